@@ -0,0 +1,160 @@
+"""
+Read-only JSON API, version 1.
+
+    GET /api/v1/properties                      filtered, keyset-paginated listing
+    GET /api/v1/properties/<id>                 one property
+    GET /api/v1/properties/<id>/documents       its documents
+    GET /api/v1/properties/<id>/maps_links      its map links
+
+The listing takes the same filter and sort arguments as the HTML listing,
+plus ``fields=`` (comma separated) so callers only pay for the columns they
+use, ``limit`` and the ``cursor`` returned as ``next_cursor``/``prev_cursor``.
+Every response carries a weak ETag of its JSON body, so unchanged data
+revalidates with a 304, and bodies are compressed with brotli (when the
+optional ``brotli`` package is installed) or gzip according to
+Accept-Encoding. Access uses the normal login session.
+"""
+import gzip
+import json
+import hashlib
+
+from flask import Blueprint, current_app, request
+from flask_login import login_required
+
+from database import get_db
+from queries import listing_query_from_args, fetch_properties_page
+
+try:
+    import brotli
+except ImportError:  # brotli not installed: gzip only
+    brotli = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Computed listing fields that may be requested besides the table's columns
+# (relevance is set while a search is active)
+EXTRA_FIELDS = {'photos', 'relevance'}
+DOCUMENT_FIELDS = ['id', 'filename', 'original_filename', 'document_type', 'upload_date',
+                   'thumbnail_filename', 'medium_filename', 'webp_filename']
+MAPS_LINK_FIELDS = ['id', 'link_title', 'google_maps_link', 'latitude', 'longitude', 'created_date']
+# Bodies smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 512
+
+class APIError(Exception):
+    """A rejected API request; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def property_columns(conn):
+    return [row['name'] for row in conn.execute('PRAGMA table_info(properties)')]
+
+def parse_fields(value, allowed):
+    """Requested field names from ``fields=a,b``; None means all. Unknown names raise APIError."""
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown:
+        raise APIError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+def project(row, fields):
+    return {field: row.get(field) for field in fields}
+
+def json_response(payload, status=200):
+    """Compact JSON with a weak ETag (answering 304s) and negotiated compression"""
+    body = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    response = current_app.response_class(body, status=status, mimetype='application/json')
+    response.set_etag(hashlib.sha256(body).hexdigest(), weak=True)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    response.vary.add('Cookie')
+    if status == 200:
+        response.make_conditional(request)
+    if response.status_code == 200 and len(body) >= MIN_COMPRESS_SIZE:
+        compress(response, body)
+    return response
+
+def compress(response, body):
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        response.set_data(brotli.compress(body, quality=5))
+        response.content_encoding = 'br'
+    elif accepted['gzip']:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.content_encoding = 'gzip'
+
+@api.errorhandler(APIError)
+def api_error(error):
+    return json_response({'error': str(error)}, error.status)
+
+@api.route('/properties')
+@login_required
+def list_properties():
+    conn = get_db()
+    columns = property_columns(conn)
+    match_query, where_sql, params, sort_by, sort_order = listing_query_from_args(request.args)
+    fields = parse_fields(request.args.get('fields'), columns + sorted(EXTRA_FIELDS)) or columns + ['photos']
+
+    config = current_app.config
+    try:
+        limit = int(request.args.get('limit', config['LISTING_PAGE_SIZE']))
+    except ValueError:
+        raise APIError('limit must be a number')
+    limit = max(1, min(limit, config['LISTING_MAX_PAGE_SIZE']))
+
+    # Only the requested columns are read, and photos only when asked for
+    properties, next_cursor, prev_cursor = fetch_properties_page(
+        conn, where_sql, params, sort_by, sort_order, cursor=request.args.get('cursor'), page_size=limit,
+        match_query=match_query, columns=[field for field in fields if field in columns],
+        with_photos='photos' in fields)
+
+    return json_response({
+        'data': [project(row, fields) for row in properties],
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'sort_by': sort_by,
+        'sort_order': sort_order,
+    })
+
+def get_property_or_404(conn, property_id, fields):
+    row = conn.execute(f"SELECT {', '.join(fields)} FROM properties WHERE id = ?", (property_id,)).fetchone()
+    if row is None:
+        raise APIError('Property not found', 404)
+    return dict(row)
+
+@api.route('/properties/<int:property_id>')
+@login_required
+def get_property(property_id):
+    conn = get_db()
+    columns = property_columns(conn)
+    fields = parse_fields(request.args.get('fields'), columns) or columns
+    return json_response({'data': get_property_or_404(conn, property_id, fields)})
+
+@api.route('/properties/<int:property_id>/documents')
+@login_required
+def property_documents(property_id):
+    conn = get_db()
+    get_property_or_404(conn, property_id, ['id'])
+    fields = parse_fields(request.args.get('fields'), DOCUMENT_FIELDS) or DOCUMENT_FIELDS
+    rows = conn.execute(f'''SELECT {', '.join(fields)} FROM property_documents
+                            WHERE property_id = ? ORDER BY upload_date DESC, id DESC''', (property_id,))
+    return json_response({'data': [dict(row) for row in rows]})
+
+@api.route('/properties/<int:property_id>/maps_links')
+@login_required
+def property_maps_links(property_id):
+    conn = get_db()
+    get_property_or_404(conn, property_id, ['id'])
+    fields = parse_fields(request.args.get('fields'), MAPS_LINK_FIELDS) or MAPS_LINK_FIELDS
+    rows = conn.execute(f'''SELECT {', '.join(fields)} FROM property_maps_links
+                            WHERE property_id = ? ORDER BY created_date DESC, id DESC''', (property_id,))
+    return json_response({'data': [dict(row) for row in rows]})
+
+def init_app(app):
+    """Register the v1 API on ``app``; unauthenticated calls get a 401 instead of the login page"""
+    app.register_blueprint(api)
+    app.login_manager.blueprint_login_views[api.name] = None
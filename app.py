@@ -1,12 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, stream_with_context
+from markupsafe import Markup, escape
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
+import io
 import os
+import json
 from datetime import datetime
-from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
+import database
+import jobs
+import blobstore
+import thumbnails
+import maintenance
+import api
+import instrumentation
+from database import get_db, connect_from_config
+from cache import TTLCache, create_cache
+from migrations import apply_migrations
+from users import User, load_cached_user, user_cache_key, invalidate_user
+from queries import (listing_query_from_args, fetch_properties_page, load_filter_options, delete_properties,
+                     update_properties_status, orphaned_files, get_data_generations, get_property_generation,
+                     pick_args, SNIPPET_START, SNIPPET_END)
+from page_cache import cached_page
+from exports import iter_properties_csv
+from importer import detect_format, import_file
+from downloads import send_upload
+from geo import resolve_coordinates, parse_bbox
+from clusters import MAP_FILTER_ARGS, count_properties, load_clusters, parse_zoom
+from thumbnails import enqueue_thumbnails
+from cleanup import enqueue_removal
+from chunked_uploads import (UploadError, create_session, get_session, session_status, append_chunk,
+                             complete_session, mark_complete, expire_sessions)
 
 # Load environment variables
 load_dotenv()
@@ -26,6 +51,74 @@ ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'txt,pdf,png,jpg,jpeg,g
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))  # 16MB max file size
 
+# Resumable chunked uploads; each chunk request must fit in MAX_CONTENT_LENGTH
+app.config['MAX_UPLOAD_SIZE'] = int(os.getenv('MAX_UPLOAD_SIZE', 512 * 1024 * 1024))
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+app.config['UPLOAD_SESSION_TTL'] = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))  # seconds
+app.config['UPLOAD_WORKERS'] = int(os.getenv('UPLOAD_WORKERS', 4))  # parallel file writes per request
+
+# Database configuration; DATABASE_URL uses the sqlite:///path form
+app.config['DATABASE'] = os.getenv('DATABASE_URL', 'sqlite:///property_management.db').replace('sqlite:///', '', 1)
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 4))
+app.config['SQLITE_JOURNAL_MODE'] = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_CACHE_SIZE'] = int(os.getenv('SQLITE_CACHE_SIZE', -20000))  # negative = KiB
+app.config['SQLITE_MMAP_SIZE'] = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+app.config['SQLITE_BUSY_TIMEOUT'] = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+
+# Instrumentation: Server-Timing headers, /metrics (Prometheus) and the slow
+# SQL log (statements taking at least SLOW_QUERY_MS; -1 turns it off)
+app.config['SERVER_TIMING'] = os.getenv('SERVER_TIMING', 'True').lower() == 'true'
+app.config['SLOW_QUERY_MS'] = int(os.getenv('SLOW_QUERY_MS', 100))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')  # bearer token for scrapers; unset = login required
+
+# Cache backend shared by the users, filter option and map tile caches:
+# memory (per process), sqlite (one file shared by every worker on this
+# machine) or redis (any Redis-compatible server; needs `pip install redis`)
+app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'memory').lower()
+app.config['CACHE_PATH'] = os.getenv('CACHE_PATH', 'property_management_cache.db')
+app.config['CACHE_URL'] = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+
+# Authenticated user cache
+app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 256))
+app.config['USER_CACHE_TTL'] = int(os.getenv('USER_CACHE_TTL', 300))  # seconds
+
+# Listing pagination
+app.config['LISTING_PAGE_SIZE'] = int(os.getenv('LISTING_PAGE_SIZE', 24))
+app.config['LISTING_MAX_PAGE_SIZE'] = int(os.getenv('LISTING_MAX_PAGE_SIZE', 100))
+
+# Filter form option cache
+app.config['LISTING_CACHE_SIZE'] = int(os.getenv('LISTING_CACHE_SIZE', 64))
+app.config['LISTING_CACHE_TTL'] = int(os.getenv('LISTING_CACHE_TTL', 3600))  # seconds
+app.config['SHOW_FACET_COUNTS'] = os.getenv('SHOW_FACET_COUNTS', 'True').lower() == 'true'
+
+# Rendered listing and detail pages, cached per data generation (0 disables)
+app.config['PAGE_CACHE_SIZE'] = int(os.getenv('PAGE_CACHE_SIZE', 128))
+app.config['PAGE_CACHE_TTL'] = int(os.getenv('PAGE_CACHE_TTL', 3600))  # seconds
+
+# Portfolio map: clustered markers cached per 256px tile and data generation
+app.config['MAP_TILE_CACHE_SIZE'] = int(os.getenv('MAP_TILE_CACHE_SIZE', 2048))
+app.config['MAP_CLUSTER_CELL_PX'] = int(os.getenv('MAP_CLUSTER_CELL_PX', 64))  # grid cell size in screen pixels
+
+# Browser caching of uploaded files
+app.config['DOWNLOAD_MAX_AGE'] = int(os.getenv('DOWNLOAD_MAX_AGE', 365 * 24 * 60 * 60))  # seconds
+app.config['FILE_ETAG_CACHE_SIZE'] = int(os.getenv('FILE_ETAG_CACHE_SIZE', 4096))
+
+# Who sends upload bytes: flask, x-sendfile (Apache) or x-accel-redirect (nginx)
+app.config['FILE_DELIVERY'] = os.getenv('FILE_DELIVERY', 'flask').lower()
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.getenv('X_ACCEL_REDIRECT_PREFIX', '/protected-uploads/')
+
+# Background jobs: 'thread' runs a worker inside each app process, 'external'
+# leaves them to `python worker.py`
+app.config['JOB_WORKER'] = os.getenv('JOB_WORKER', 'thread').lower()
+app.config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', 1.0))  # seconds
+app.config['JOB_LOCK_TIMEOUT'] = int(os.getenv('JOB_LOCK_TIMEOUT', 600))  # seconds before a running job is retried
+app.config['JOB_RETRY_DELAY'] = int(os.getenv('JOB_RETRY_DELAY', 30))  # seconds, doubled on every attempt
+app.config['JOB_RETENTION_DAYS'] = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+# Bulk imports: rows written per transaction
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+
 # Security configurations
 app.config['SESSION_COOKIE_SECURE'] = os.getenv('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
 app.config['SESSION_COOKIE_HTTPONLY'] = os.getenv('SESSION_COOKIE_HTTPONLY', 'True').lower() == 'true'
@@ -34,142 +127,80 @@ app.config['SESSION_COOKIE_SAMESITE'] = os.getenv('SESSION_COOKIE_SAMESITE', 'La
 # Create upload directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# User class for Flask-Login
-class User(UserMixin):
-    def __init__(self, id, username, password_hash):
-        self.id = id
-        self.username = username
-        self.password_hash = password_hash
+# Per-request pooled database connections
+database.init_app(app)
+
+# Authenticated users are cached so @login_required pages skip the users query
+user_cache = create_cache(app.config, 'users', app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+app.extensions['user_cache'] = user_cache
+
+# Uploads are stored once per distinct content under UPLOAD_FOLDER/blobs
+blob_store = blobstore.init_app(app)
+
+# Thumbnails, file removal, exports and index rebuilds run as background jobs
+thumbnails.init_app(app)
+job_worker = jobs.init_app(app)
+
+# Read-only JSON API under /api/v1
+api.init_app(app)
+
+# Request timing: Server-Timing headers, /metrics and the slow SQL log
+instrumentation.init_app(app)
+
+# Content hashes used as download ETags, keyed by path, mtime and size
+file_etags = TTLCache(maxsize=app.config['FILE_ETAG_CACHE_SIZE'], ttl=24 * 60 * 60)
+app.extensions['file_etags'] = file_etags
+
+# Listing data (filter options) keyed by the properties data generation
+listing_cache = create_cache(app.config, 'listing', app.config['LISTING_CACHE_SIZE'], app.config['LISTING_CACHE_TTL'])
+app.extensions['listing_cache'] = listing_cache
+
+# Clustered map markers keyed by tile, filters and data generations
+map_tile_cache = create_cache(app.config, 'map_tiles', app.config['MAP_TILE_CACHE_SIZE'], app.config['LISTING_CACHE_TTL'])
+app.extensions['map_tile_cache'] = map_tile_cache
+
+# Rendered listing and detail pages keyed by query args and data generations
+page_cache = (create_cache(app.config, 'pages', app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_TTL'])
+              if app.config['PAGE_CACHE_SIZE'] > 0 else None)
+app.extensions['page_cache'] = page_cache
 
 @login_manager.user_loader
 def load_user(user_id):
-    conn = get_db_connection()
-    user_data = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    conn.close()
-    if user_data:
-        return User(user_data['id'], user_data['username'], user_data['password_hash'])
-    return None
+    return load_cached_user(user_cache, get_db_connection, user_id)
+
+@app.template_filter('highlight')
+def highlight_snippet(snippet):
+    """Escape a search snippet and wrap its matched terms in <mark> tags"""
+    return escape(snippet).replace(SNIPPET_START, Markup('<mark>')).replace(SNIPPET_END, Markup('</mark>'))
 
 def init_db():
-    """Initialize the database with required tables"""
-    conn = sqlite3.connect('property_management.db')
-    c = conn.cursor()
-    
-    # Create users table
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  username TEXT UNIQUE NOT NULL,
-                  password_hash TEXT NOT NULL,
-                  created_date TEXT)''')
-    
-    # Create properties table
-    c.execute('''CREATE TABLE IF NOT EXISTS properties
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  title TEXT NOT NULL,
-                  description TEXT,
-                  property_type TEXT,
-                  price REAL,
-                  location TEXT,
-                  rtc TEXT,
-                  status TEXT DEFAULT 'Available',
-                  owner_name TEXT,
-                  owner_contact TEXT,
-                  created_date TEXT,
-                  updated_date TEXT)''')
-    
-    # Create documents table
-    c.execute('''CREATE TABLE IF NOT EXISTS property_documents
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  property_id INTEGER,
-                  filename TEXT,
-                  original_filename TEXT,
-                  document_type TEXT DEFAULT 'General',
-                  upload_date TEXT,
-                  FOREIGN KEY (property_id) REFERENCES properties (id))''')
-    
-    # Create Google Maps links table
-    c.execute('''CREATE TABLE IF NOT EXISTS property_maps_links
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  property_id INTEGER,
-                  link_title TEXT NOT NULL,
-                  google_maps_link TEXT NOT NULL,
-                  latitude REAL,
-                  longitude REAL,
-                  created_date TEXT,
-                  FOREIGN KEY (property_id) REFERENCES properties (id))''')
+    """Bring the database schema up to date and create the default admin user"""
+    conn = connect_from_config(app.config)
+    
+    # Apply pending schema migrations (recorded in schema_version)
+    apply_migrations(conn)
     
     # Create default admin user if not exists
     admin_username = os.getenv('ADMIN_USERNAME', 'admin')
     admin_password = os.getenv('ADMIN_PASSWORD', 'admin123')
     
-    existing_user = c.execute('SELECT * FROM users WHERE username = ?', (admin_username,)).fetchone()
+    existing_user = conn.execute('SELECT * FROM users WHERE username = ?', (admin_username,)).fetchone()
     if not existing_user:
         password_hash = generate_password_hash(admin_password)
         current_time = datetime.now().isoformat()
-        c.execute('INSERT INTO users (username, password_hash, created_date) VALUES (?, ?, ?)',
-                 (admin_username, password_hash, current_time))
+        user_id = conn.execute('INSERT INTO users (username, password_hash, created_date) VALUES (?, ?, ?)',
+                               (admin_username, password_hash, current_time)).lastrowid
+        invalidate_user(user_cache, user_id)
     
     conn.commit()
     conn.close()
-    
-    # Run database migrations
-    migrate_db()
-
-def migrate_db():
-    """Migrate existing database to new schema"""
-    conn = sqlite3.connect('property_management.db')
-    c = conn.cursor()
-    
-    try:
-        # Check if document_type column exists in property_documents table
-        c.execute("PRAGMA table_info(property_documents)")
-        columns = [column[1] for column in c.fetchall()]
-        
-        if 'document_type' not in columns:
-            # Add document_type column to existing property_documents table
-            c.execute('ALTER TABLE property_documents ADD COLUMN document_type TEXT DEFAULT "General"')
-            print("Added document_type column to property_documents table")
-        
-        # Check if property_maps_links table exists
-        c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='property_maps_links'")
-        if not c.fetchone():
-            # Create property_maps_links table
-            c.execute('''CREATE TABLE property_maps_links
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         property_id INTEGER,
-                         link_title TEXT NOT NULL,
-                         google_maps_link TEXT NOT NULL,
-                         latitude REAL,
-                         longitude REAL,
-                         created_date TEXT,
-                         FOREIGN KEY (property_id) REFERENCES properties (id))''')
-            print("Created property_maps_links table")
-        
-        # Check if rtc column exists in properties table
-        c.execute("PRAGMA table_info(properties)")
-        columns = [column[1] for column in c.fetchall()]
-        
-        if 'rtc' not in columns:
-            # Add rtc column to existing properties table
-            c.execute('ALTER TABLE properties ADD COLUMN rtc TEXT')
-            print("Added rtc column to properties table")
-        
-        conn.commit()
-        print("Database migration completed successfully")
-        
-    except Exception as e:
-        print(f"Migration error: {e}")
-        conn.rollback()
-    finally:
-        conn.close()
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def get_db_connection():
-    conn = sqlite3.connect('property_management.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # One pooled connection per request, released in teardown (see database.py)
+    return get_db()
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -182,10 +213,10 @@ def login():
         
         conn = get_db_connection()
         user_data = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        conn.close()
         
         if user_data and check_password_hash(user_data['password_hash'], password):
-            user = User(user_data['id'], user_data['username'], user_data['password_hash'])
+            user = User.from_row(user_data)
+            user_cache.set(user_cache_key(user.id), user)
             login_user(user)
             flash('Login successful!', 'success')
             return redirect(url_for('index'))
@@ -201,8 +232,25 @@ def logout():
     flash('You have been logged out.', 'success')
     return redirect(url_for('login'))
 
+def csv_download(chunks, filename):
+    """Stream CSV text chunks as an attachment while the request context stays open"""
+    return Response(stream_with_context(chunks),
+                    mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+def listing_generations():
+    """Generations the listing page depends on; map links only matter to radius and box searches"""
+    names = ['properties', 'photos']
+    if request.args.get('near_lat') or request.args.get('bbox'):
+        names.append('locations')
+    return get_data_generations(get_db_connection(), names)
+
+def property_generation(property_id):
+    return get_property_generation(get_db_connection(), property_id)
+
 @app.route('/', methods=['GET', 'POST'])
 @login_required
+@cached_page(page_cache, listing_generations)
 def index():
     conn = get_db_connection()
     
@@ -213,75 +261,29 @@ def index():
     price_min = request.args.get('price_min', '')
     price_max = request.args.get('price_max', '')
     location = request.args.get('location', '')
-    sort_by = request.args.get('sort_by', 'created_date')
-    sort_order = request.args.get('sort_order', 'desc')
-    
-    # Build the query dynamically
-    query = "SELECT * FROM properties WHERE 1=1"
-    params = []
-    
-    if search_query:
-        query += " AND (rtc LIKE ? OR title LIKE ? OR description LIKE ?)"
-        search_param = f'%{search_query}%'
-        params.extend([search_param, search_param, search_param])
-    
-    if property_type:
-        query += " AND property_type = ?"
-        params.append(property_type)
-    
-    if status:
-        query += " AND status = ?"
-        params.append(status)
+    near_lat = request.args.get('near_lat', '')
+    near_lng = request.args.get('near_lng', '')
+    radius_km = request.args.get('radius_km', '')
+    bbox = request.args.get('bbox', '')
+    match_query, where_sql, params, sort_by, sort_order = listing_query_from_args(request.args)
     
-    if price_min:
-        try:
-            price_min_val = float(price_min)
-            query += " AND price >= ?"
-            params.append(price_min_val)
-        except ValueError:
-            pass
-    
-    if price_max:
-        try:
-            price_max_val = float(price_max)
-            query += " AND price <= ?"
-            params.append(price_max_val)
-        except ValueError:
-            pass
-    
-    if location:
-        query += " AND location LIKE ?"
-        params.append(f'%{location}%')
-    
-    # Add sorting
-    valid_sort_fields = ['created_date', 'updated_date', 'title', 'price', 'status']
-    if sort_by in valid_sort_fields:
-        query += f" ORDER BY {sort_by}"
-        if sort_order.lower() == 'asc':
-            query += " ASC"
-        else:
-            query += " DESC"
-    else:
-        query += " ORDER BY created_date DESC"
-    
-    properties = conn.execute(query, params).fetchall()
+    # Page size is bounded so page weight never grows with the table
+    try:
+        per_page = int(request.args.get('per_page', app.config['LISTING_PAGE_SIZE']))
+    except ValueError:
+        per_page = app.config['LISTING_PAGE_SIZE']
+    per_page = max(1, min(per_page, app.config['LISTING_MAX_PAGE_SIZE']))
     
-    # Get photos for each property
-    properties_with_photos = []
-    for property in properties:
-        photos = conn.execute('''SELECT * FROM property_documents 
-                               WHERE property_id = ? AND document_type = 'Photos' 
-                               ORDER BY upload_date DESC LIMIT 1''', (property['id'],)).fetchall()
-        property_dict = dict(property)
-        property_dict['photos'] = photos
-        properties_with_photos.append(property_dict)
+    # Fetch one keyset page of properties with their latest photo
+    properties_with_photos, next_cursor, prev_cursor = fetch_properties_page(
+        conn, where_sql, params, sort_by, sort_order,
+        cursor=request.args.get('cursor'), page_size=per_page, match_query=match_query)
     
-    # Get filter options for the form
-    property_types = conn.execute('SELECT DISTINCT property_type FROM properties WHERE property_type IS NOT NULL AND property_type != ""').fetchall()
-    statuses = conn.execute('SELECT DISTINCT status FROM properties WHERE status IS NOT NULL').fetchall()
-    locations = conn.execute('SELECT DISTINCT location FROM properties WHERE location IS NOT NULL AND location != ""').fetchall()
+    # Filter and sort args carried over to the next/previous page links
+    page_args = pick_args(request.args)
     
-    conn.close()
+    # Get filter options for the form (cached until the next property write)
+    filter_options = load_filter_options(conn, listing_cache)
     
     return render_template('index.html', 
                          properties=properties_with_photos, 
@@ -291,77 +293,80 @@ def index():
                          price_min=price_min,
                          price_max=price_max,
                          location=location,
+                         near_lat=near_lat,
+                         near_lng=near_lng,
+                         radius_km=radius_km,
+                         bbox=bbox,
                          sort_by=sort_by,
                          sort_order=sort_order,
-                         property_types=property_types,
-                         statuses=statuses,
-                         locations=locations)
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor,
+                         page_args=page_args,
+                         property_types=filter_options['property_type'],
+                         statuses=filter_options['status'],
+                         locations=filter_options['location'],
+                         show_facet_counts=app.config['SHOW_FACET_COUNTS'])
 
 @app.route('/dashboard')
 @login_required
 def dashboard():
     conn = get_db_connection()
     
-    # Get basic statistics
-    total_properties = conn.execute('SELECT COUNT(*) as count FROM properties').fetchone()['count']
+    # Counters below come from property_stats/property_totals, which triggers
+    # on properties keep current (see migrations.create_dashboard_stats)
+    totals = conn.execute('SELECT * FROM property_totals WHERE id = 1').fetchone()
+    total_properties = totals['property_count'] if totals else 0
     
     # Properties by status
     status_stats = conn.execute('''
-        SELECT status, COUNT(*) as count 
-        FROM properties 
-        WHERE status IS NOT NULL 
-        GROUP BY status
+        SELECT value as status, count 
+        FROM property_stats 
+        WHERE dimension = 'status'
     ''').fetchall()
     
     # Properties by type
     type_stats = conn.execute('''
-        SELECT property_type, COUNT(*) as count 
-        FROM properties 
-        WHERE property_type IS NOT NULL AND property_type != ""
-        GROUP BY property_type
+        SELECT value as property_type, count 
+        FROM property_stats 
+        WHERE dimension = 'property_type'
     ''').fetchall()
     
-    # Price statistics
+    # Price statistics; MIN/MAX are index lookups on idx_properties_price_value
     price_stats = conn.execute('''
         SELECT 
-            MIN(price) as min_price,
-            MAX(price) as max_price,
-            AVG(price) as avg_price,
-            COUNT(CASE WHEN price > 0 THEN 1 END) as properties_with_price
-        FROM properties
+            (SELECT MIN(price) FROM properties) as min_price,
+            (SELECT MAX(price) FROM properties) as max_price,
+            CASE WHEN t.price_count > 0 THEN t.price_sum / t.price_count END as avg_price,
+            t.priced_count as properties_with_price
+        FROM property_totals t
+        WHERE t.id = 1
     ''').fetchone()
     
     # Recent properties (last 30 days)
     recent_properties = conn.execute('''
         SELECT * FROM properties 
-        WHERE created_date >= date('now', '-30 days')
-        ORDER BY created_date DESC
+        WHERE IFNULL(created_date, '') >= date('now', '-30 days')
+        ORDER BY IFNULL(created_date, '') DESC
         LIMIT 5
     ''').fetchall()
     
     # Properties by month (for chart)
     monthly_stats = conn.execute('''
-        SELECT 
-            strftime('%Y-%m', created_date) as month,
-            COUNT(*) as count
-        FROM properties 
-        WHERE created_date >= date('now', '-12 months')
-        GROUP BY strftime('%Y-%m', created_date)
+        SELECT value as month, count
+        FROM property_stats 
+        WHERE dimension = 'month' AND value >= strftime('%Y-%m', 'now', '-12 months')
         ORDER BY month
     ''').fetchall()
     
     # Location statistics
     location_stats = conn.execute('''
-        SELECT location, COUNT(*) as count 
-        FROM properties 
-        WHERE location IS NOT NULL AND location != ""
-        GROUP BY location
+        SELECT value as location, count 
+        FROM property_stats 
+        WHERE dimension = 'location'
         ORDER BY count DESC
         LIMIT 10
     ''').fetchall()
     
-    conn.close()
-    
     return render_template('dashboard.html', 
                          total_properties=total_properties,
                          status_stats=status_stats,
@@ -371,20 +376,107 @@ def dashboard():
                          monthly_stats=monthly_stats,
                          location_stats=location_stats)
 
+@app.route('/export')
+@login_required
+def export_properties():
+    """Download every property matching the listing filters as CSV"""
+    match_query, where_sql, params, sort_by, sort_order = listing_query_from_args(request.args)
+    chunks = iter_properties_csv(get_db_connection(), where_sql, params, sort_by, sort_order, match_query)
+    return csv_download(chunks, 'properties_export.csv')
+
+@app.route('/jobs/export', methods=['POST'])
+@login_required
+def queue_export():
+    """Write the filtered listing to a CSV file in the background"""
+    conn = get_db_connection()
+    job_id = jobs.enqueue(conn, 'export_csv', {'args': request.args.to_dict()})
+    conn.commit()
+    flash(f'Export queued as job #{job_id}; download it here once it is done.', 'success')
+    return redirect(url_for('job_status'))
+
+@app.route('/jobs')
+@login_required
+def job_status():
+    conn = get_db_connection()
+    job_list = [dict(job, result=json.loads(job['result']) if job['result'] else None)
+                for job in jobs.recent_jobs(conn)]
+    return render_template('jobs.html', counts=jobs.job_counts(conn), jobs=job_list,
+                           maintenance_jobs=maintenance.MAINTENANCE_JOBS, worker_mode=app.config['JOB_WORKER'])
+
+@app.route('/jobs/run', methods=['POST'])
+@login_required
+def run_maintenance_job():
+    kind = request.form.get('kind')
+    if kind not in maintenance.MAINTENANCE_JOBS:
+        flash('Unknown maintenance task.', 'error')
+        return redirect(url_for('job_status'))
+    
+    conn = get_db_connection()
+    job_id = jobs.enqueue(conn, kind)
+    conn.commit()
+    flash(f'{maintenance.MAINTENANCE_JOBS[kind]} queued as job #{job_id}.', 'success')
+    return redirect(url_for('job_status'))
+
+@app.route('/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_job(job_id):
+    if jobs.retry(get_db_connection(), job_id):
+        flash(f'Job #{job_id} queued again.', 'success')
+    else:
+        flash('Only failed jobs can be retried.', 'error')
+    return redirect(url_for('job_status'))
+
+@app.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job_result(job_id):
+    job = get_db_connection().execute("SELECT * FROM jobs WHERE id = ? AND kind = 'export_csv' AND status = 'done'",
+                                      (job_id,)).fetchone()
+    if job is None:
+        flash('Export not found or not finished yet.', 'error')
+        return redirect(url_for('job_status'))
+    response = send_upload(app.config['UPLOAD_FOLDER'], json.loads(job['result'])['filename'], file_etags,
+                           app.config['DOWNLOAD_MAX_AGE'], delivery=app.config['FILE_DELIVERY'],
+                           accel_prefix=app.config['X_ACCEL_REDIRECT_PREFIX'])
+    response.headers['Content-Disposition'] = f'attachment; filename=properties_export_{job_id}.csv'
+    return response
+
+@app.route('/map')
+@login_required
+def property_map():
+    """Portfolio map; markers come from /api/map/clusters as the map moves"""
+    return render_template('map.html', filter_args=pick_args(request.args, MAP_FILTER_ARGS))
+
+@app.route('/api/map/clusters')
+@login_required
+def map_clusters():
+    """Clustered markers inside ``bbox`` (min_lng,min_lat,max_lng,max_lat) at ``zoom``"""
+    bbox = parse_bbox(request.args.get('bbox', ''))
+    zoom = parse_zoom(request.args.get('zoom'))
+    if bbox is None or zoom is None:
+        return jsonify(error='bbox (min_lng,min_lat,max_lng,max_lat) and zoom (0-20) are required'), 400
+    
+    conn = get_db_connection()
+    markers = load_clusters(conn, map_tile_cache, bbox, zoom, request.args,
+                            cell_px=app.config['MAP_CLUSTER_CELL_PX'])
+    if markers is None:
+        return jsonify(error='Viewport covers too many tiles; zoom in'), 400
+    return jsonify(zoom=zoom, markers=markers, total=count_properties(conn, bbox, request.args))
+
 @app.route('/property/<int:property_id>')
 @login_required
+@cached_page(page_cache, property_generation)
 def property_detail(property_id):
     conn = get_db_connection()
     property_data = conn.execute('SELECT * FROM properties WHERE id = ?', (property_id,)).fetchone()
     documents = conn.execute('SELECT * FROM property_documents WHERE property_id = ? ORDER BY upload_date DESC', (property_id,)).fetchall()
     maps_links = conn.execute('SELECT * FROM property_maps_links WHERE property_id = ? ORDER BY created_date DESC', (property_id,)).fetchall()
-    conn.close()
     
     if property_data is None:
         flash('Property not found!', 'error')
         return redirect(url_for('index'))
     
-    return render_template('property_detail.html', property=property_data, documents=documents, maps_links=maps_links)
+    return render_template('property_detail.html', property=property_data, documents=documents, maps_links=maps_links,
+                         chunked_upload_url=url_for('start_upload'))
 
 @app.route('/add_property', methods=['GET', 'POST'])
 @login_required
@@ -402,59 +494,83 @@ def add_property():
         
         current_time = datetime.now().isoformat()
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''INSERT INTO properties 
-                         (title, description, property_type, price, location, rtc, status, owner_name, owner_contact, created_date, updated_date)
-                         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                      (title, description, property_type, price, location, rtc, status, owner_name, owner_contact, current_time, current_time))
-        
-        property_id = cursor.lastrowid
-        
-        # Handle Google Maps data
-        google_maps_link = request.form.get('google_maps_link')
-        latitude = request.form.get('latitude')
-        longitude = request.form.get('longitude')
-        
-        if google_maps_link or (latitude and longitude):
-            # Validate coordinates if provided
-            if latitude and longitude:
-                try:
-                    latitude = float(latitude)
-                    longitude = float(longitude)
-                except ValueError:
-                    latitude = None
-                    longitude = None
+        # Handle file uploads: files are written and hashed in parallel before
+        # the transaction opens, so the write lock is not held during disk I/O
+        files = [file for file in request.files.getlist('documents')
+                 if file and file.filename and allowed_file(file.filename)]
+        # The batch keeps the blobs safe from file cleanup until the rows commit
+        with blob_store.batch() as blobs:
+            filenames = blobs.save_many(files, app.config['UPLOAD_WORKERS'])
             
-            cursor.execute('''INSERT INTO property_maps_links 
-                           (property_id, link_title, google_maps_link, latitude, longitude, created_date)
-                           VALUES (?, ?, ?, ?, ?, ?)''',
-                        (property_id, 'Property Location', google_maps_link or '', latitude, longitude, current_time))
-        
-        # Handle file uploads
-        if 'documents' in request.files:
-            files = request.files.getlist('documents')
-            for file in files:
-                if file and file.filename and allowed_file(file.filename):
-                    filename = secure_filename(file.filename)
-                    # Add timestamp to avoid conflicts
-                    filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    file.save(file_path)
-                    
-                    # Save to database
-                    cursor.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
-                                     VALUES (?, ?, ?, ?, ?)''',
-                                  (property_id, filename, file.filename, 'General', current_time))
-        
-        conn.commit()
-        conn.close()
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.execute('''INSERT INTO properties 
+                             (title, description, property_type, price, location, rtc, status, owner_name, owner_contact, created_date, updated_date)
+                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                          (title, description, property_type, price, location, rtc, status, owner_name, owner_contact, current_time, current_time))
+            
+            property_id = cursor.lastrowid
+            
+            # Handle Google Maps data
+            google_maps_link = request.form.get('google_maps_link')
+            latitude = request.form.get('latitude')
+            longitude = request.form.get('longitude')
+            
+            if google_maps_link or (latitude and longitude):
+                # Typed coordinates win; otherwise they are parsed from the link once, here
+                latitude, longitude = resolve_coordinates(google_maps_link, latitude, longitude)
+                
+                cursor.execute('''INSERT INTO property_maps_links 
+                               (property_id, link_title, google_maps_link, latitude, longitude, created_date)
+                               VALUES (?, ?, ?, ?, ?, ?)''',
+                            (property_id, 'Property Location', google_maps_link or '', latitude, longitude, current_time))
+            
+            # Insert all document rows in one statement
+            cursor.executemany('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
+                                 VALUES (?, ?, ?, ?, ?)''',
+                              [(property_id, filename, file.filename, 'General', current_time)
+                               for file, filename in zip(files, filenames)])
+            
+            # Derivatives are built by the job worker once this transaction commits
+            for document_id, filename in conn.execute('SELECT id, filename FROM property_documents WHERE property_id = ?', (property_id,)):
+                enqueue_thumbnails(conn, document_id, filename)
+            
+            conn.commit()
         
         flash('Property added successfully!', 'success')
         return redirect(url_for('property_detail', property_id=property_id))
     
     return render_template('add_property.html')
 
+@app.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_properties():
+    """Create (or with upsert, update by RTC) properties from an uploaded CSV or JSON file"""
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('file')
+        if not file or not file.filename:
+            flash('Choose a CSV or JSON file to import.', 'error')
+            return redirect(url_for('import_properties'))
+        try:
+            batch_size = max(1, int(request.form.get('batch_size') or app.config['IMPORT_BATCH_SIZE']))
+        except ValueError:
+            batch_size = app.config['IMPORT_BATCH_SIZE']
+        file_format = request.form.get('format') or detect_format(file.filename)
+        
+        # Rows are decoded from the upload as they are read, never all at once
+        stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')
+        result = import_file(get_db_connection(), stream, file_format, batch_size,
+                             upsert=request.form.get('upsert') == 'on')
+        result['format'] = file_format
+        if result['error']:
+            flash(f"Stopped reading {file.filename}: {result['error']}", 'error')
+        else:
+            flash(f"Imported {file.filename}: {result['inserted']} added, {result['updated']} updated, "
+                  f"{result['skipped']} skipped", 'success')
+    
+    return render_template('import.html', result=result, batch_size=app.config['IMPORT_BATCH_SIZE'])
+
 @app.route('/edit_property/<int:property_id>', methods=['GET', 'POST'])
 @login_required
 def edit_property(property_id):
@@ -482,13 +598,11 @@ def edit_property(property_id):
                      status, owner_name, owner_contact, updated_time, property_id))
         
         conn.commit()
-        conn.close()
         
         flash('Property updated successfully!', 'success')
         return redirect(url_for('property_detail', property_id=property_id))
     
     property_data = conn.execute('SELECT * FROM properties WHERE id = ?', (property_id,)).fetchone()
-    conn.close()
     
     if property_data is None:
         flash('Property not found!', 'error')
@@ -501,20 +615,10 @@ def edit_property(property_id):
 def delete_property(property_id):
     conn = get_db_connection()
     
-    # Delete associated documents from filesystem
-    documents = conn.execute('SELECT filename FROM property_documents WHERE property_id = ?', (property_id,)).fetchall()
-    for doc in documents:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc['filename'])
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    
-    # Delete from database
-    conn.execute('DELETE FROM property_documents WHERE property_id = ?', (property_id,))
-    conn.execute('DELETE FROM property_maps_links WHERE property_id = ?', (property_id,))
-    conn.execute('DELETE FROM properties WHERE id = ?', (property_id,))
-    
+    # Delete from database; the files are removed by a job once this commits
+    _, filenames = delete_properties(conn, [property_id])
+    enqueue_removal(conn, filenames)
     conn.commit()
-    conn.close()
     
     flash('Property deleted successfully!', 'success')
     return redirect(url_for('index'))
@@ -536,6 +640,9 @@ def add_maps_link(property_id):
             flash('Invalid coordinates provided.', 'error')
             return redirect(url_for('property_detail', property_id=property_id))
     
+    # Fall back to the coordinates in the link itself
+    latitude, longitude = resolve_coordinates(google_maps_link, latitude, longitude)
+    
     current_time = datetime.now().isoformat()
     
     conn = get_db_connection()
@@ -544,7 +651,6 @@ def add_maps_link(property_id):
                    VALUES (?, ?, ?, ?, ?, ?)''',
                 (property_id, link_title, google_maps_link, latitude, longitude, current_time))
     conn.commit()
-    conn.close()
     
     flash('Google Maps link added successfully!', 'success')
     return redirect(url_for('property_detail', property_id=property_id))
@@ -559,11 +665,9 @@ def delete_maps_link(link_id):
         property_id = link_data['property_id']
         conn.execute('DELETE FROM property_maps_links WHERE id = ?', (link_id,))
         conn.commit()
-        conn.close()
         flash('Google Maps link deleted successfully!', 'success')
         return redirect(url_for('property_detail', property_id=property_id))
     
-    conn.close()
     flash('Link not found!', 'error')
     return redirect(url_for('index'))
 
@@ -582,20 +686,18 @@ def add_document(property_id):
         return redirect(url_for('property_detail', property_id=property_id))
     
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Add timestamp to avoid conflicts
-        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        current_time = datetime.now().isoformat()
-        
-        conn = get_db_connection()
-        conn.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
-                       VALUES (?, ?, ?, ?, ?)''',
-                    (property_id, filename, file.filename, document_type, current_time))
-        conn.commit()
-        conn.close()
+        # Stored once per distinct content (see blobstore.py)
+        with blob_store.batch() as blobs:
+            filename = blobs.save_upload(file)
+            
+            current_time = datetime.now().isoformat()
+            
+            conn = get_db_connection()
+            cursor = conn.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
+                                    VALUES (?, ?, ?, ?, ?)''',
+                                 (property_id, filename, file.filename, document_type, current_time))
+            enqueue_thumbnails(conn, cursor.lastrowid, filename)
+            conn.commit()
         
         flash('Document uploaded successfully!', 'success')
     else:
@@ -603,30 +705,94 @@ def add_document(property_id):
     
     return redirect(url_for('property_detail', property_id=property_id))
 
+@app.errorhandler(UploadError)
+def upload_error(e):
+    return jsonify(e.to_dict()), e.status
+
+@app.route('/uploads', methods=['POST'])
+@login_required
+def start_upload():
+    data = request.get_json(silent=True) or request.form
+    original_filename = data.get('filename', '')
+    document_type = data.get('document_type', 'General')
+    try:
+        property_id = int(data.get('property_id'))
+        total_size = int(data.get('size'))
+    except (TypeError, ValueError):
+        raise UploadError('property_id and size must be integers')
+    
+    if not allowed_file(original_filename):
+        raise UploadError('Invalid file type. Allowed types: ' + ', '.join(sorted(ALLOWED_EXTENSIONS)))
+    if not 0 < total_size <= app.config['MAX_UPLOAD_SIZE']:
+        raise UploadError('File is empty or larger than allowed', 413, max_size=app.config['MAX_UPLOAD_SIZE'])
+    
+    conn = get_db_connection()
+    if conn.execute('SELECT 1 FROM properties WHERE id = ?', (property_id,)).fetchone() is None:
+        raise UploadError('Property not found', 404)
+    
+    # Abandoned sessions are swept whenever a new one starts
+    expire_sessions(conn, blob_store.incoming_dir, app.config['UPLOAD_SESSION_TTL'])
+    session = create_session(conn, blob_store.incoming_dir, property_id, original_filename, document_type, total_size)
+    return jsonify(chunk_size=app.config['UPLOAD_CHUNK_SIZE'], **session_status(session)), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    return jsonify(session_status(get_session(get_db_connection(), upload_id)))
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    conn = get_db_connection()
+    session = get_session(conn, upload_id)
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        raise UploadError('offset query parameter is required')
+    
+    # The body is read from the raw stream in small blocks, never buffered whole
+    new_offset = append_chunk(conn, blob_store.incoming_dir, session, request.stream, offset,
+                              request.headers.get('X-Chunk-SHA256'), app.config['UPLOAD_CHUNK_SIZE'])
+    return jsonify(upload_id=upload_id, offset=new_offset, size=session['total_size'])
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@login_required
+def complete_upload(upload_id):
+    conn = get_db_connection()
+    session = get_session(conn, upload_id)
+    data = request.get_json(silent=True) or request.form
+    
+    document_id = session['document_id']
+    if document_id is None:
+        with blob_store.batch() as blobs:
+            filename = complete_session(conn, blobs, session, data.get('sha256'))
+            document_id = conn.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
+                                         VALUES (?, ?, ?, ?, ?)''',
+                                      (session['property_id'], filename, session['original_filename'], session['document_type'],
+                                       datetime.now().isoformat())).lastrowid
+            mark_complete(conn, session, document_id)
+            enqueue_thumbnails(conn, document_id, filename)
+            conn.commit()
+    
+    return jsonify(document_id=document_id,
+                   redirect=url_for('property_detail', property_id=session['property_id']))
+
 @app.route('/delete_document/<int:document_id>', methods=['POST'])
 @login_required
 def delete_document(document_id):
     conn = get_db_connection()
-    doc_data = conn.execute('SELECT property_id, filename FROM property_documents WHERE id = ?', (document_id,)).fetchone()
+    doc_data = conn.execute('SELECT * FROM property_documents WHERE id = ?', (document_id,)).fetchone()
     
     if doc_data:
         property_id = doc_data['property_id']
-        filename = doc_data['filename']
-        
-        # Delete file from filesystem
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
         
-        # Delete from database
+        # Delete from database; the blob goes only with its last reference
         conn.execute('DELETE FROM property_documents WHERE id = ?', (document_id,))
+        enqueue_removal(conn, orphaned_files(conn, [doc_data]))
         conn.commit()
-        conn.close()
         
         flash('Document deleted successfully!', 'success')
         return redirect(url_for('property_detail', property_id=property_id))
     
-    conn.close()
     flash('Document not found!', 'error')
     return redirect(url_for('index'))
 
@@ -640,57 +806,35 @@ def bulk_action():
         flash('No properties selected.', 'error')
         return redirect(url_for('index'))
     
+    selected_ids = [int(property_id) for property_id in property_ids if property_id.isdigit()]
     conn = get_db_connection()
     
     try:
         if action == 'delete':
-            # Delete selected properties
-            for property_id in property_ids:
-                # Delete associated documents from filesystem
-                documents = conn.execute('SELECT filename FROM property_documents WHERE property_id = ?', (property_id,)).fetchall()
-                for doc in documents:
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc['filename'])
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                
-                # Delete from database
-                conn.execute('DELETE FROM property_documents WHERE property_id = ?', (property_id,))
-                conn.execute('DELETE FROM property_maps_links WHERE property_id = ?', (property_id,))
-                conn.execute('DELETE FROM properties WHERE id = ?', (property_id,))
+            # Delete selected properties in one short write transaction
+            conn.execute('BEGIN IMMEDIATE')
+            deleted, filenames = delete_properties(conn, selected_ids)
             
+            # Files are removed by a background job once the rows are gone
+            enqueue_removal(conn, filenames)
             conn.commit()
-            flash(f'Successfully deleted {len(property_ids)} properties.', 'success')
+            flash(f'Successfully deleted {deleted} properties.', 'success')
             
         elif action == 'update_status':
             new_status = request.form.get('new_status')
             if new_status:
-                for property_id in property_ids:
-                    conn.execute('UPDATE properties SET status = ?, updated_date = ? WHERE id = ?', 
-                               (new_status, datetime.now().isoformat(), property_id))
+                conn.execute('BEGIN IMMEDIATE')
+                updated = update_properties_status(conn, selected_ids, new_status, datetime.now().isoformat())
                 conn.commit()
-                flash(f'Successfully updated status to "{new_status}" for {len(property_ids)} properties.', 'success')
+                flash(f'Successfully updated status to "{new_status}" for {updated} properties.', 'success')
             else:
                 flash('No status selected for update.', 'error')
                 
         elif action == 'export':
             # Export selected properties to CSV
-            properties = []
-            for property_id in property_ids:
-                property_data = conn.execute('SELECT * FROM properties WHERE id = ?', (property_id,)).fetchone()
-                if property_data:
-                    properties.append(dict(property_data))
-            
-            # Create CSV content
-            csv_content = 'Title,Type,Status,Price,Location,RTC,Owner,Contact,Date Added\n'
-            for prop in properties:
-                csv_content += f'"{prop.get("title", "")}","{prop.get("property_type", "")}","{prop.get("status", "")}","{prop.get("price", "")}","{prop.get("location", "")}","{prop.get("rtc", "")}","{prop.get("owner_name", "")}","{prop.get("owner_contact", "")}","{prop.get("created_date", "")}"\n'
-            
-            from flask import Response
-            return Response(
-                csv_content,
-                mimetype='text/csv',
-                headers={'Content-Disposition': 'attachment; filename=selected_properties.csv'}
-            )
+            chunks = iter_properties_csv(conn, " AND p.id IN (SELECT value FROM json_each(?))",
+                                         [json.dumps(selected_ids)])
+            return csv_download(chunks, 'selected_properties.csv')
         
         else:
             flash('Invalid action selected.', 'error')
@@ -698,15 +842,14 @@ def bulk_action():
     except Exception as e:
         conn.rollback()
         flash(f'Error performing bulk action: {str(e)}', 'error')
-    finally:
-        conn.close()
     
     return redirect(url_for('index'))
 
-@app.route('/download/<filename>')
+@app.route('/download/<path:filename>')
 @login_required
 def download_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_upload(app.config['UPLOAD_FOLDER'], filename, file_etags, app.config['DOWNLOAD_MAX_AGE'],
+                       delivery=app.config['FILE_DELIVERY'], accel_prefix=app.config['X_ACCEL_REDIRECT_PREFIX'])
 
 app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
     '/property_management_application/property_management': app
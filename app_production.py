@@ -1,11 +1,27 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory
-from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash
+from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 import os
 from datetime import datetime
-from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
 from config import config
+import database
+import jobs
+import blobstore
+import thumbnails
+import maintenance
+import api
+import instrumentation
+from database import get_db, connect_from_config
+from cache import TTLCache, create_cache
+from migrations import apply_migrations
+from users import User, load_cached_user, user_cache_key, invalidate_user
+from queries import (fetch_properties_page, delete_properties, orphaned_files, get_data_generations,
+                     get_property_generation)
+from page_cache import cached_page
+from downloads import send_upload
+from geo import resolve_coordinates
+from cleanup import enqueue_removal
+from thumbnails import enqueue_thumbnails
 
 def create_app(config_name=None):
     """Application factory pattern for creating Flask app"""
@@ -24,135 +40,68 @@ def create_app(config_name=None):
     # Create upload directory if it doesn't exist
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
-    # User class for Flask-Login
-    class User(UserMixin):
-        def __init__(self, id, username, password_hash):
-            self.id = id
-            self.username = username
-            self.password_hash = password_hash
+    # Per-request pooled database connections
+    database.init_app(app)
+    
+    # Authenticated users are cached so @login_required pages skip the users query
+    user_cache = create_cache(app.config, 'users', app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+    app.extensions['user_cache'] = user_cache
+    
+    # Uploads are stored once per distinct content; unreferenced blobs are
+    # removed by a background job
+    blob_store = blobstore.init_app(app)
+    
+    # Thumbnails and file removal run as background jobs
+    thumbnails.init_app(app)
+    jobs.init_app(app)
+    
+    # Read-only JSON API under /api/v1
+    api.init_app(app)
+    
+    # Request timing: Server-Timing headers, /metrics and the slow SQL log
+    instrumentation.init_app(app)
+    
+    # Content hashes used as download ETags, keyed by path, mtime and size
+    file_etags = TTLCache(maxsize=app.config['FILE_ETAG_CACHE_SIZE'], ttl=24 * 60 * 60)
+    app.extensions['file_etags'] = file_etags
+    
+    # Rendered listing and detail pages keyed by query args and data generations
+    page_cache = (create_cache(app.config, 'pages', app.config['PAGE_CACHE_SIZE'], app.config['PAGE_CACHE_TTL'])
+                  if app.config['PAGE_CACHE_SIZE'] > 0 else None)
+    app.extensions['page_cache'] = page_cache
     
     @login_manager.user_loader
     def load_user(user_id):
-        conn = get_db_connection()
-        user_data = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-        conn.close()
-        if user_data:
-            return User(user_data['id'], user_data['username'], user_data['password_hash'])
-        return None
+        return load_cached_user(user_cache, get_db_connection, user_id)
     
     def init_db():
-        """Initialize the database with required tables"""
-        conn = sqlite3.connect('property_management.db')
-        c = conn.cursor()
-        
-        # Create users table
-        c.execute('''CREATE TABLE IF NOT EXISTS users
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      username TEXT UNIQUE NOT NULL,
-                      password_hash TEXT NOT NULL,
-                      created_date TEXT)''')
+        """Bring the database schema up to date and create the default admin user"""
+        conn = connect_from_config(app.config)
         
-        # Create properties table
-        c.execute('''CREATE TABLE IF NOT EXISTS properties
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      title TEXT NOT NULL,
-                      description TEXT,
-                      property_type TEXT,
-                      price REAL,
-                      location TEXT,
-                      bedrooms INTEGER,
-                      bathrooms INTEGER,
-                      area REAL,
-                      status TEXT DEFAULT 'Available',
-                      owner_name TEXT,
-                      owner_contact TEXT,
-                      created_date TEXT,
-                      updated_date TEXT)''')
-        
-        # Create documents table
-        c.execute('''CREATE TABLE IF NOT EXISTS property_documents
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      property_id INTEGER,
-                      filename TEXT,
-                      original_filename TEXT,
-                      document_type TEXT DEFAULT 'General',
-                      upload_date TEXT,
-                      FOREIGN KEY (property_id) REFERENCES properties (id))''')
-        
-        # Create Google Maps links table
-        c.execute('''CREATE TABLE IF NOT EXISTS property_maps_links
-                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                      property_id INTEGER,
-                      link_title TEXT NOT NULL,
-                      google_maps_link TEXT NOT NULL,
-                      latitude REAL,
-                      longitude REAL,
-                      created_date TEXT,
-                      FOREIGN KEY (property_id) REFERENCES properties (id))''')
+        # Apply pending schema migrations (recorded in schema_version)
+        apply_migrations(conn)
         
         # Create default admin user if not exists
         admin_username = app.config['ADMIN_USERNAME']
         admin_password = app.config['ADMIN_PASSWORD']
         
-        existing_user = c.execute('SELECT * FROM users WHERE username = ?', (admin_username,)).fetchone()
+        existing_user = conn.execute('SELECT * FROM users WHERE username = ?', (admin_username,)).fetchone()
         if not existing_user:
             password_hash = generate_password_hash(admin_password)
             current_time = datetime.now().isoformat()
-            c.execute('INSERT INTO users (username, password_hash, created_date) VALUES (?, ?, ?)',
-                     (admin_username, password_hash, current_time))
+            user_id = conn.execute('INSERT INTO users (username, password_hash, created_date) VALUES (?, ?, ?)',
+                                   (admin_username, password_hash, current_time)).lastrowid
+            invalidate_user(user_cache, user_id)
         
         conn.commit()
         conn.close()
-        
-        # Run database migrations
-        migrate_db()
-    
-    def migrate_db():
-        """Migrate existing database to new schema"""
-        conn = sqlite3.connect('property_management.db')
-        c = conn.cursor()
-        
-        try:
-            # Check if document_type column exists in property_documents table
-            c.execute("PRAGMA table_info(property_documents)")
-            columns = [column[1] for column in c.fetchall()]
-            
-            if 'document_type' not in columns:
-                # Add document_type column to existing property_documents table
-                c.execute('ALTER TABLE property_documents ADD COLUMN document_type TEXT DEFAULT "General"')
-                print("Added document_type column to property_documents table")
-            
-            # Check if property_maps_links table exists
-            c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='property_maps_links'")
-            if not c.fetchone():
-                # Create property_maps_links table
-                c.execute('''CREATE TABLE property_maps_links
-                            (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                             property_id INTEGER,
-                             link_title TEXT NOT NULL,
-                             google_maps_link TEXT NOT NULL,
-                             latitude REAL,
-                             longitude REAL,
-                             created_date TEXT,
-                             FOREIGN KEY (property_id) REFERENCES properties (id))''')
-                print("Created property_maps_links table")
-            
-            conn.commit()
-            print("Database migration completed successfully")
-            
-        except Exception as e:
-            print(f"Migration error: {e}")
-            conn.rollback()
-        finally:
-            conn.close()
     
     def allowed_file(filename):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
     
     def get_db_connection():
-        conn = sqlite3.connect('property_management.db')
-        conn.row_factory = sqlite3.Row
-        return conn
+        # One pooled connection per request, released in teardown (see database.py)
+        return get_db()
     
     # Routes
     @app.route('/login', methods=['GET', 'POST'])
@@ -166,10 +115,10 @@ def create_app(config_name=None):
             
             conn = get_db_connection()
             user_data = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-            conn.close()
             
             if user_data and check_password_hash(user_data['password_hash'], password):
-                user = User(user_data['id'], user_data['username'], user_data['password_hash'])
+                user = User.from_row(user_data)
+                user_cache.set(user_cache_key(user.id), user)
                 login_user(user)
                 flash('Login successful!', 'success')
                 return redirect(url_for('index'))
@@ -187,31 +136,23 @@ def create_app(config_name=None):
     
     @app.route('/')
     @login_required
+    @cached_page(page_cache, lambda: get_data_generations(get_db_connection(), ['properties', 'photos']))
     def index():
         conn = get_db_connection()
-        properties = conn.execute('SELECT * FROM properties ORDER BY created_date DESC').fetchall()
+        properties_with_photos, next_cursor, prev_cursor = fetch_properties_page(
+            conn, cursor=request.args.get('cursor'), page_size=app.config['LISTING_PAGE_SIZE'])
         
-        # Get photos for each property
-        properties_with_photos = []
-        for property in properties:
-            photos = conn.execute('''SELECT * FROM property_documents 
-                                   WHERE property_id = ? AND document_type = 'Photos' 
-                                   ORDER BY upload_date DESC LIMIT 1''', (property['id'],)).fetchall()
-            property_dict = dict(property)
-            property_dict['photos'] = photos
-            properties_with_photos.append(property_dict)
-        
-        conn.close()
-        return render_template('index.html', properties=properties_with_photos)
+        return render_template('index.html', properties=properties_with_photos,
+                               next_cursor=next_cursor, prev_cursor=prev_cursor, page_args={})
     
     @app.route('/property/<int:property_id>')
     @login_required
+    @cached_page(page_cache, lambda property_id: get_property_generation(get_db_connection(), property_id))
     def property_detail(property_id):
         conn = get_db_connection()
         property_data = conn.execute('SELECT * FROM properties WHERE id = ?', (property_id,)).fetchone()
         documents = conn.execute('SELECT * FROM property_documents WHERE property_id = ? ORDER BY upload_date DESC', (property_id,)).fetchall()
         maps_links = conn.execute('SELECT * FROM property_maps_links WHERE property_id = ? ORDER BY created_date DESC', (property_id,)).fetchall()
-        conn.close()
         
         if property_data is None:
             flash('Property not found!', 'error')
@@ -237,53 +178,48 @@ def create_app(config_name=None):
             
             current_time = datetime.now().isoformat()
             
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute('''INSERT INTO properties 
-                             (title, description, property_type, price, location, bedrooms, bathrooms, area, status, owner_name, owner_contact, created_date, updated_date)
-                             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
-                          (title, description, property_type, price, location, bedrooms, bathrooms, area, status, owner_name, owner_contact, current_time, current_time))
-            
-            property_id = cursor.lastrowid
-            
-            # Handle Google Maps data
-            google_maps_link = request.form.get('google_maps_link')
-            latitude = request.form.get('latitude')
-            longitude = request.form.get('longitude')
-            
-            if google_maps_link or (latitude and longitude):
-                # Validate coordinates if provided
-                if latitude and longitude:
-                    try:
-                        latitude = float(latitude)
-                        longitude = float(longitude)
-                    except ValueError:
-                        latitude = None
-                        longitude = None
+            # Handle file uploads: files are written and hashed in parallel before
+            # the transaction opens, so the write lock is not held during disk I/O
+            files = [file for file in request.files.getlist('documents')
+                     if file and file.filename and allowed_file(file.filename)]
+            # The batch keeps the blobs safe from file cleanup until the rows commit
+            with blob_store.batch() as blobs:
+                filenames = blobs.save_many(files, app.config['UPLOAD_WORKERS'])
                 
-                cursor.execute('''INSERT INTO property_maps_links 
-                               (property_id, link_title, google_maps_link, latitude, longitude, created_date)
-                               VALUES (?, ?, ?, ?, ?, ?)''',
-                            (property_id, 'Property Location', google_maps_link or '', latitude, longitude, current_time))
-            
-            # Handle file uploads
-            if 'documents' in request.files:
-                files = request.files.getlist('documents')
-                for file in files:
-                    if file and file.filename and allowed_file(file.filename):
-                        filename = secure_filename(file.filename)
-                        # Add timestamp to avoid conflicts
-                        filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-                        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                        file.save(file_path)
-                        
-                        # Save to database
-                        cursor.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
-                                         VALUES (?, ?, ?, ?, ?)''',
-                                      (property_id, filename, file.filename, 'General', current_time))
-            
-            conn.commit()
-            conn.close()
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                cursor.execute('''INSERT INTO properties 
+                                 (title, description, property_type, price, location, bedrooms, bathrooms, area, status, owner_name, owner_contact, created_date, updated_date)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                              (title, description, property_type, price, location, bedrooms, bathrooms, area, status, owner_name, owner_contact, current_time, current_time))
+                
+                property_id = cursor.lastrowid
+                
+                # Handle Google Maps data
+                google_maps_link = request.form.get('google_maps_link')
+                latitude = request.form.get('latitude')
+                longitude = request.form.get('longitude')
+                
+                if google_maps_link or (latitude and longitude):
+                    # Typed coordinates win; otherwise they are parsed from the link once, here
+                    latitude, longitude = resolve_coordinates(google_maps_link, latitude, longitude)
+                    
+                    cursor.execute('''INSERT INTO property_maps_links 
+                                   (property_id, link_title, google_maps_link, latitude, longitude, created_date)
+                                   VALUES (?, ?, ?, ?, ?, ?)''',
+                                (property_id, 'Property Location', google_maps_link or '', latitude, longitude, current_time))
+                
+                # Insert all document rows in one statement
+                cursor.executemany('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
+                                     VALUES (?, ?, ?, ?, ?)''',
+                                  [(property_id, filename, file.filename, 'General', current_time)
+                                   for file, filename in zip(files, filenames)])
+                
+                # Derivatives are built by the job worker once this transaction commits
+                for document_id, filename in conn.execute('SELECT id, filename FROM property_documents WHERE property_id = ?', (property_id,)):
+                    enqueue_thumbnails(conn, document_id, filename)
+                
+                conn.commit()
             
             flash('Property added successfully!', 'success')
             return redirect(url_for('property_detail', property_id=property_id))
@@ -319,13 +255,11 @@ def create_app(config_name=None):
                          status, owner_name, owner_contact, updated_time, property_id))
             
             conn.commit()
-            conn.close()
             
             flash('Property updated successfully!', 'success')
             return redirect(url_for('property_detail', property_id=property_id))
         
         property_data = conn.execute('SELECT * FROM properties WHERE id = ?', (property_id,)).fetchone()
-        conn.close()
         
         if property_data is None:
             flash('Property not found!', 'error')
@@ -338,20 +272,10 @@ def create_app(config_name=None):
     def delete_property(property_id):
         conn = get_db_connection()
         
-        # Delete associated documents from filesystem
-        documents = conn.execute('SELECT filename FROM property_documents WHERE property_id = ?', (property_id,)).fetchall()
-        for doc in documents:
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], doc['filename'])
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        
-        # Delete from database
-        conn.execute('DELETE FROM property_documents WHERE property_id = ?', (property_id,))
-        conn.execute('DELETE FROM property_maps_links WHERE property_id = ?', (property_id,))
-        conn.execute('DELETE FROM properties WHERE id = ?', (property_id,))
-        
+        # Delete from database, then remove files no other document shares
+        _, filenames = delete_properties(conn, [property_id])
+        enqueue_removal(conn, filenames)
         conn.commit()
-        conn.close()
         
         flash('Property deleted successfully!', 'success')
         return redirect(url_for('index'))
@@ -373,6 +297,9 @@ def create_app(config_name=None):
                 flash('Invalid coordinates provided.', 'error')
                 return redirect(url_for('property_detail', property_id=property_id))
         
+        # Fall back to the coordinates in the link itself
+        latitude, longitude = resolve_coordinates(google_maps_link, latitude, longitude)
+        
         current_time = datetime.now().isoformat()
         
         conn = get_db_connection()
@@ -381,7 +308,6 @@ def create_app(config_name=None):
                        VALUES (?, ?, ?, ?, ?, ?)''',
                     (property_id, link_title, google_maps_link, latitude, longitude, current_time))
         conn.commit()
-        conn.close()
         
         flash('Google Maps link added successfully!', 'success')
         return redirect(url_for('property_detail', property_id=property_id))
@@ -396,11 +322,9 @@ def create_app(config_name=None):
             property_id = link_data['property_id']
             conn.execute('DELETE FROM property_maps_links WHERE id = ?', (link_id,))
             conn.commit()
-            conn.close()
             flash('Google Maps link deleted successfully!', 'success')
             return redirect(url_for('property_detail', property_id=property_id))
         
-        conn.close()
         flash('Link not found!', 'error')
         return redirect(url_for('index'))
     
@@ -419,20 +343,18 @@ def create_app(config_name=None):
             return redirect(url_for('property_detail', property_id=property_id))
         
         if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Add timestamp to avoid conflicts
-            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(file_path)
-            
-            current_time = datetime.now().isoformat()
-            
-            conn = get_db_connection()
-            conn.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
-                           VALUES (?, ?, ?, ?, ?)''',
-                        (property_id, filename, file.filename, document_type, current_time))
-            conn.commit()
-            conn.close()
+            # Stored once per distinct content (see blobstore.py)
+            with blob_store.batch() as blobs:
+                filename = blobs.save_upload(file)
+                
+                current_time = datetime.now().isoformat()
+                
+                conn = get_db_connection()
+                cursor = conn.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
+                                        VALUES (?, ?, ?, ?, ?)''',
+                                     (property_id, filename, file.filename, document_type, current_time))
+                enqueue_thumbnails(conn, cursor.lastrowid, filename)
+                conn.commit()
             
             flash('Document uploaded successfully!', 'success')
         else:
@@ -444,33 +366,27 @@ def create_app(config_name=None):
     @login_required
     def delete_document(document_id):
         conn = get_db_connection()
-        doc_data = conn.execute('SELECT property_id, filename FROM property_documents WHERE id = ?', (document_id,)).fetchone()
+        doc_data = conn.execute('SELECT * FROM property_documents WHERE id = ?', (document_id,)).fetchone()
         
         if doc_data:
             property_id = doc_data['property_id']
-            filename = doc_data['filename']
-            
-            # Delete file from filesystem
-            file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)
             
-            # Delete from database
+            # Delete from database; the blob goes only with its last reference
             conn.execute('DELETE FROM property_documents WHERE id = ?', (document_id,))
+            enqueue_removal(conn, orphaned_files(conn, [doc_data]))
             conn.commit()
-            conn.close()
             
             flash('Document deleted successfully!', 'success')
             return redirect(url_for('property_detail', property_id=property_id))
         
-        conn.close()
         flash('Document not found!', 'error')
         return redirect(url_for('index'))
     
-    @app.route('/download/<filename>')
+    @app.route('/download/<path:filename>')
     @login_required
     def download_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        return send_upload(app.config['UPLOAD_FOLDER'], filename, file_etags, app.config['DOWNLOAD_MAX_AGE'],
+                           delivery=app.config['FILE_DELIVERY'], accel_prefix=app.config['X_ACCEL_REDIRECT_PREFIX'])
     
     # Initialize database
     with app.app_context():
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Fill in latitude/longitude for Google Maps links saved without coordinates,
+parsing them from the link URL the same way new links are parsed on save.
+
+Usage: python backfill_coordinates.py [--dry-run] [database_path]
+"""
+
+import sys
+import sqlite3
+
+from config import Config
+from migrations import apply_migrations
+from geo import coordinates_from_maps_link
+
+def pending_links(conn):
+    """(id, google_maps_link) of links that have a URL but no coordinates"""
+    return conn.execute('''SELECT id, google_maps_link FROM property_maps_links
+                           WHERE (latitude IS NULL OR longitude IS NULL) AND google_maps_link > ''
+                        ''').fetchall()
+
+def backfill(conn, batch_size=500):
+    """Parse coordinates for every link missing them; returns (updated, unparsed)"""
+    links = pending_links(conn)
+    updates = []
+    unparsed = 0
+    for link_id, url in links:
+        point = coordinates_from_maps_link(url)
+        if point:
+            updates.append((*point, link_id))
+        else:
+            unparsed += 1
+
+    # One transaction per batch; the R*Tree triggers index each point as it is set
+    for start in range(0, len(updates), batch_size):
+        conn.executemany('UPDATE property_maps_links SET latitude = ?, longitude = ? WHERE id = ?',
+                         updates[start:start + batch_size])
+        conn.commit()
+    return len(updates), unparsed
+
+def main():
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    paths = [arg for arg in args if arg != '--dry-run']
+    database = paths[0] if paths else Config.DATABASE
+
+    conn = sqlite3.connect(database)
+    try:
+        apply_migrations(conn, verbose=False)
+        if dry_run:
+            links = pending_links(conn)
+            parsed = sum(1 for _, url in links if coordinates_from_maps_link(url))
+            print(f"ℹ️  {parsed} of {len(links)} link(s) without coordinates can be parsed")
+            return
+        updated, unparsed = backfill(conn)
+        print(f"✅ Added coordinates to {updated} link(s); {unparsed} link(s) carry no coordinates (e.g. short links)")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Benchmark script for Property Management System
+Seeds throwaway SQLite databases and times the hot query paths.
+
+Usage: python benchmark.py [listing] [pagination] [search] [import]
+"""
+
+import io
+import os
+import csv
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+import database
+from migrations import apply_migrations
+from importer import PROPERTY_FIELDS, INSERT_SQL, import_file
+from queries import fetch_properties_with_photos, fetch_properties_page, encode_cursor, build_match_query
+
+LISTING_SIZES = [100, 1000, 10000, 50000]
+
+DESCRIPTION_WORDS = ['agricultural', 'survey', 'boundary', 'road', 'facing', 'mosque', 'school', 'trust',
+                     'waqf', 'khata', 'village', 'taluk', 'acre', 'guntha', 'irrigated', 'dry', 'land',
+                     'compound', 'wall', 'well', 'borewell', 'coconut', 'areca', 'garden', 'residential',
+                     'commercial', 'shop', 'building', 'tenant', 'lease', 'encroachment', 'mutation',
+                     'registered', 'sale', 'deed', 'gift', 'inheritance', 'madrasa', 'graveyard', 'hall']
+
+SEARCH_TERMS = ['mosque', 'RTC-0004', 'borewell lease', 'grave']
+
+IMPORT_ROWS = 10000
+IMPORT_BATCH_SIZES = [50, 500, 5000]
+
+def create_benchmark_db(num_properties, photos_per_property=3):
+    """Create a temporary database seeded with properties and photo rows"""
+    fd, db_path = tempfile.mkstemp(suffix='.db', prefix='bench_')
+    os.close(fd)
+
+    conn = sqlite3.connect(db_path)
+    apply_migrations(conn, verbose=False)
+
+    rng = random.Random(42)
+    base_date = datetime(2024, 1, 1)
+    vocabulary = DESCRIPTION_WORDS
+    statuses = ['Available', 'Pending', 'Sold', 'Rented']
+    types = ['Land', 'House', 'Apartment', 'Commercial']
+
+    properties = []
+    documents = []
+    for i in range(1, num_properties + 1):
+        created = (base_date + timedelta(minutes=i)).isoformat()
+        description = f"Survey plot number {i} " + ' '.join(rng.choice(vocabulary) for _ in range(40))
+        properties.append((f'Property {i}', description, rng.choice(types),
+                           rng.randint(100000, 9000000), f'Ward {rng.randint(1, 50)}', f'RTC-{i:06d}',
+                           rng.choice(statuses), f'Owner {i}', '9999999999', created, created))
+        for j in range(photos_per_property):
+            upload = (base_date + timedelta(minutes=i, seconds=j)).isoformat()
+            documents.append((i, f'{i}_{j}.jpg', f'photo_{j}.jpg', 'Photos', upload))
+        documents.append((i, f'{i}_deed.pdf', 'deed.pdf', 'Legal', created))
+
+    conn.executemany('''INSERT INTO properties (title, description, property_type, price, location, rtc,
+                        status, owner_name, owner_contact, created_date, updated_date)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', properties)
+    conn.executemany('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
+                        VALUES (?, ?, ?, ?, ?)''', documents)
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+    return db_path
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def listing_n_plus_one(conn):
+    """The original listing: one photo query per property row"""
+    properties = conn.execute('SELECT * FROM properties ORDER BY created_date DESC').fetchall()
+    result = []
+    for property in properties:
+        photos = conn.execute('''SELECT * FROM property_documents
+                               WHERE property_id = ? AND document_type = 'Photos'
+                               ORDER BY upload_date DESC LIMIT 1''', (property['id'],)).fetchall()
+        property_dict = dict(property)
+        property_dict['photos'] = photos
+        result.append(property_dict)
+    return result
+
+def time_call(func, repeat=3):
+    """Return the best wall time in milliseconds over ``repeat`` runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_listing():
+    """Compare the N+1 listing with the single joined fetch"""
+    print("📊 Listing: N+1 photo queries vs single joined fetch")
+    print(f"{'properties':>10} {'n+1 ms':>10} {'joined ms':>10} {'n+1 us/row':>11} {'joined us/row':>14}")
+
+    for size in LISTING_SIZES:
+        db_path = create_benchmark_db(size)
+        conn = connect(db_path)
+        try:
+            n_plus_one_ms = time_call(lambda: listing_n_plus_one(conn))
+            joined_ms = time_call(lambda: fetch_properties_with_photos(conn))
+        finally:
+            conn.close()
+            os.remove(db_path)
+
+        print(f"{size:>10} {n_plus_one_ms:10.1f} {joined_ms:10.1f} {n_plus_one_ms * 1000 / size:11.1f} {joined_ms * 1000 / size:14.1f}")
+
+def bench_pagination(page_size=24):
+    """Compare first and deep pages using keyset cursors and OFFSET"""
+    print("📊 Pagination: keyset cursor vs OFFSET at the first page and 90% deep")
+    print(f"{'properties':>10} {'page 1 ms':>10} {'keyset 90% ms':>14} {'offset 90% ms':>14}")
+
+    for size in LISTING_SIZES:
+        db_path = create_benchmark_db(size)
+        conn = connect(db_path)
+        try:
+            # Position of the row 90% of the way through the newest-first ordering
+            depth = int(size * 0.9)
+            anchor = conn.execute('SELECT id, created_date FROM properties ORDER BY created_date DESC, id DESC LIMIT 1 OFFSET ?',
+                                  (depth,)).fetchone()
+            cursor = encode_cursor(anchor['created_date'], anchor['id'], 'next')
+
+            first_ms = time_call(lambda: fetch_properties_page(conn, page_size=page_size))
+            keyset_ms = time_call(lambda: fetch_properties_page(conn, cursor=cursor, page_size=page_size))
+            offset_ms = time_call(lambda: conn.execute('SELECT * FROM properties ORDER BY created_date DESC, id DESC LIMIT ? OFFSET ?',
+                                                       (page_size, depth)).fetchall())
+        finally:
+            conn.close()
+            os.remove(db_path)
+
+        print(f"{size:>10} {first_ms:10.2f} {keyset_ms:14.2f} {offset_ms:14.2f}")
+
+def search_like(conn, search_query):
+    """The original search: substring LIKE over three columns"""
+    search_param = f'%{search_query}%'
+    return conn.execute('''SELECT * FROM properties
+                           WHERE rtc LIKE ? OR title LIKE ? OR description LIKE ?
+                           ORDER BY created_date DESC''', (search_param, search_param, search_param)).fetchall()
+
+def bench_search(page_size=24):
+    """Compare LIKE scans with the ranked FTS5 search for a first page"""
+    print("📊 Search: LIKE scan vs FTS5 ranked first page")
+    print(f"{'properties':>10} {'term':>16} {'matches':>8} {'LIKE all ms':>12} {'LIKE page ms':>13} {'FTS page ms':>12}")
+
+    for size in LISTING_SIZES:
+        db_path = create_benchmark_db(size)
+        conn = connect(db_path)
+        try:
+            for term in SEARCH_TERMS:
+                match_query = build_match_query(term)
+                matches = conn.execute('SELECT COUNT(*) FROM properties_fts WHERE properties_fts MATCH ?',
+                                       (match_query,)).fetchone()[0]
+                like_all = time_call(lambda: search_like(conn, term))
+                like_page = time_call(lambda: conn.execute('''SELECT * FROM properties
+                                                              WHERE rtc LIKE ? OR title LIKE ? OR description LIKE ?
+                                                              ORDER BY created_date DESC LIMIT ?''',
+                                                           (f'%{term}%',) * 3 + (page_size,)).fetchall())
+                fts_page = time_call(lambda: fetch_properties_page(conn, sort_by='relevance', page_size=page_size,
+                                                                   match_query=match_query))
+                print(f"{size:>10} {term:>16} {matches:>8} {like_all:12.2f} {like_page:13.2f} {fts_page:12.2f}")
+        finally:
+            conn.close()
+            os.remove(db_path)
+
+def import_csv_text(num_rows):
+    """A CSV file of ``num_rows`` properties as the importer would receive it"""
+    rng = random.Random(7)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(PROPERTY_FIELDS)
+    for i in range(1, num_rows + 1):
+        description = ' '.join(rng.choice(DESCRIPTION_WORDS) for _ in range(40))
+        writer.writerow([f'Imported {i}', description, 'Land', rng.randint(100000, 9000000), f'Ward {rng.randint(1, 50)}',
+                         f'IMP-{i:06d}', 'Available', f'Owner {i}', '9999999999', '', '', rng.randint(1, 50)])
+    return buffer.getvalue()
+
+def import_row_by_row(conn, text):
+    """The add_property pattern: one INSERT and one commit per row"""
+    for record in csv.DictReader(io.StringIO(text)):
+        now = datetime.now().isoformat()
+        conn.execute(INSERT_SQL, [record[field] or None for field in PROPERTY_FIELDS] + [now, now])
+        conn.commit()
+
+def bench_import(num_rows=IMPORT_ROWS):
+    """Compare one commit per row with batched executemany imports, in rows per second"""
+    print(f"📊 Import: {num_rows} CSV rows, one commit per row vs batched executemany")
+    print(f"{'method':>16} {'seconds':>8} {'rows/s':>10}")
+
+    text = import_csv_text(num_rows)
+    runs = [('row by row', lambda conn: import_row_by_row(conn, text))]
+    for batch_size in IMPORT_BATCH_SIZES:
+        runs.append((f'batch {batch_size}', lambda conn, batch_size=batch_size:
+                     import_file(conn, io.StringIO(text), 'csv', batch_size)))
+    runs.append(('upsert 500', lambda conn: import_file(conn, io.StringIO(text), 'csv', 500, upsert=True)))
+
+    for label, run in runs:
+        # Tuned connection as used by the app; each run starts from an empty table
+        db_path = create_benchmark_db(0)
+        conn = database.connect(db_path)
+        try:
+            if label.startswith('upsert'):
+                run(conn)  # Second pass: every row updates the property it created
+            start = time.perf_counter()
+            run(conn)
+            elapsed = time.perf_counter() - start
+        finally:
+            conn.close()
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+        print(f"{label:>16} {elapsed:8.2f} {num_rows / elapsed:10.0f}")
+
+BENCHMARKS = {
+    'listing': bench_listing,
+    'pagination': bench_pagination,
+    'search': bench_search,
+    'import': bench_import,
+}
+
+def main():
+    """Run the benchmarks named on the command line (default: all)"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"❌ Unknown benchmark(s): {', '.join(unknown)}")
+        print(f"   Available: {', '.join(BENCHMARKS)}")
+        sys.exit(1)
+
+    for name in names:
+        BENCHMARKS[name]()
+        print()
+
+if __name__ == '__main__':
+    main()
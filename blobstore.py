@@ -0,0 +1,218 @@
+"""
+Content-addressed storage for uploaded documents and photos.
+
+Each upload is hashed with SHA-256 while it is streamed to a temporary file
+and then stored once as ``blobs/<h0h1>/<h2h3>/<sha256>.<ext>`` under
+UPLOAD_FOLDER, so identical files share one blob and no directory grows past
+a few hundred entries. That relative path is what property_documents.filename
+holds; the number of rows sharing a filename is the blob's reference count,
+and a blob is removed only once the last of those rows is deleted.
+
+Uploads are saved through a BlobBatch wrapped around the transaction that
+inserts their rows. Until that commits, nothing in the database refers to a
+blob, so a delete_files job (see cleanup.py) for an earlier document with
+the same content may remove it. The batch keeps a spare copy of every
+upload (a hard link, or the duplicate file itself) and puts back any blob
+removed in the meantime once the rows are committed. The job unlinks under
+the database write lock, so it either sees the new rows or finishes before
+they commit, and the batch's check comes after the commit.
+"""
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BLOB_DIR = 'blobs'
+
+def blob_filename(digest, original_filename):
+    """Relative path of the blob for ``digest``; the extension keeps mimetypes working"""
+    extension = os.path.splitext(original_filename)[1].lower()
+    return '/'.join([BLOB_DIR, digest[:2], digest[2:4], f"{digest}{extension}"])
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class BlobStore:
+    """Write uploads into a sharded, deduplicated directory tree"""
+
+    def __init__(self, root, chunk_size=1024 * 1024):
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def path(self, filename):
+        return os.path.join(self.root, *filename.split('/'))
+
+    @property
+    def incoming_dir(self):
+        """Directory for partially received uploads, on the store's filesystem"""
+        return os.path.join(self.root, BLOB_DIR, 'incoming')
+
+    def batch(self):
+        """A BlobBatch for the uploads of one transaction"""
+        return BlobBatch(self)
+
+    def _write(self, stream):
+        """Stream ``stream`` into a temporary file in the store; returns (path, hex SHA-256)"""
+        tmp_dir = os.path.join(self.root, BLOB_DIR, 'tmp')
+        os.makedirs(tmp_dir, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for block in iter(lambda: stream.read(self.chunk_size), b''):
+                    digest.update(block)
+                    tmp.write(block)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        return tmp_path, digest.hexdigest()
+
+    def _hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(self.chunk_size), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _store(self, tmp_path, digest, original_filename):
+        """Put a fully written file in place as a blob.
+
+        Returns ``(filename, created, spare)``: ``created`` is False when an
+        existing blob was reused, and ``spare`` is a path still holding the
+        same content (``tmp_path`` itself), or None when there is none.
+        """
+        filename = blob_filename(digest, original_filename)
+        blob_path = self.path(filename)
+        try:
+            # Duplicate content: the existing blob is reused. Touching it tells
+            # a queued delete_files job (see cleanup.py) that it is wanted again.
+            os.utime(blob_path)
+            return filename, False, tmp_path
+        except FileNotFoundError:
+            pass
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        try:
+            os.link(tmp_path, blob_path)
+            return filename, True, tmp_path
+        except FileExistsError:
+            # A concurrent upload of the same content got there first
+            return filename, False, tmp_path
+        except OSError:
+            # No hard links on this filesystem: move the file, without a spare
+            os.replace(tmp_path, blob_path)
+            return filename, True, None
+
+class BlobBatch:
+    """Blobs saved for document rows that are not committed yet.
+
+    Use as a context manager around the saves and the transaction that
+    inserts their rows, commit included. A clean exit puts back any blob a
+    delete_files job removed meanwhile and drops the spare copies; an
+    exception removes the blobs this batch created (blobs that already
+    existed are kept) along with the spares.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._saved = []  # (filename, created, spare)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.restore()
+        else:
+            self.discard()
+        return False
+
+    def _add(self, saved):
+        with self._lock:
+            self._saved.append(saved)
+        return saved[0]
+
+    def save(self, stream, original_filename):
+        """Store the contents of ``stream`` and return its relative blob filename"""
+        tmp_path, digest = self.store._write(stream)
+        try:
+            saved = self.store._store(tmp_path, digest, original_filename)
+        except BaseException:
+            _remove(tmp_path)
+            raise
+        return self._add(saved)
+
+    def save_upload(self, file):
+        """Store a Werkzeug FileStorage and return its relative blob filename"""
+        return self.save(file.stream, file.filename)
+
+    def save_many(self, files, max_workers=4):
+        """Store several FileStorage uploads in parallel; returns their blob filenames in order.
+
+        Writing and hashing happen on a short-lived thread pool, so the total
+        time tracks the slowest file rather than the sum of all of them. The
+        pool is drained before the first error is raised, so every file that
+        was stored is in the batch and removed again on exit.
+        """
+        if len(files) <= 1 or max_workers <= 1:
+            return [self.save_upload(file) for file in files]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as pool:
+            futures = [pool.submit(self.save_upload, file) for file in files]
+        return [future.result() for future in futures]
+
+    def adopt(self, path, original_filename, expected_sha256=None):
+        """Move an already written file at ``path`` into the store without copying it.
+
+        ``path`` must be on the same filesystem as the store (see
+        ``incoming_dir``). It is renamed first, so of two concurrent calls
+        for one file the second raises FileNotFoundError. Raises ValueError,
+        leaving the file in place, when ``expected_sha256`` is given and does
+        not match.
+        """
+        claimed = f"{path}.adopting"
+        os.replace(path, claimed)
+        try:
+            digest = self.store._hash_file(claimed)
+            if expected_sha256 and digest != expected_sha256.lower():
+                raise ValueError('SHA-256 of the assembled file does not match')
+            saved = self.store._store(claimed, digest, original_filename)
+        except BaseException:
+            os.replace(claimed, path)
+            raise
+        return self._add(saved)
+
+    def restore(self):
+        """Once the rows are committed: put back blobs removed meanwhile and drop the spares"""
+        with self._lock:
+            saved, self._saved = self._saved, []
+        for filename, _, spare in saved:
+            if spare is None:
+                continue
+            blob_path = self.store.path(filename)
+            if os.path.exists(blob_path):
+                _remove(spare)
+            else:
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                os.replace(spare, blob_path)
+
+    def discard(self):
+        """Remove the blobs this batch created and its spares"""
+        with self._lock:
+            saved, self._saved = self._saved, []
+        for filename, created, spare in saved:
+            if created:
+                _remove(self.store.path(filename))
+            if spare is not None:
+                _remove(spare)
+
+def init_app(app):
+    """Attach a BlobStore rooted at UPLOAD_FOLDER to ``app`` and return it"""
+    store = BlobStore(app.config['UPLOAD_FOLDER'])
+    app.extensions['blob_store'] = store
+    return store
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Generate thumbnails and WebP copies for photos uploaded before derivatives
+existed (or while Pillow was not installed).
+
+Usage: python build_thumbnails.py [database_path] [upload_folder]
+"""
+
+import os
+import sys
+import sqlite3
+
+from config import Config
+from migrations import apply_migrations
+from thumbnails import DERIVATIVE_COLUMNS, derivatives_enabled, generate_derivatives, is_image
+
+def build_missing(conn, upload_folder):
+    """Create derivatives for every image document that has none; returns (built, skipped)"""
+    documents = conn.execute('SELECT id, filename FROM property_documents WHERE thumbnail_filename IS NULL').fetchall()
+    built = skipped = 0
+    for document_id, filename in documents:
+        if not is_image(filename) or not os.path.exists(os.path.join(upload_folder, filename)):
+            skipped += 1
+            continue
+        try:
+            derivatives = generate_derivatives(upload_folder, filename)
+        except OSError as e:
+            print(f"⚠️  {filename}: {e}")
+            skipped += 1
+            continue
+        conn.execute(f"UPDATE property_documents SET {', '.join(f'{column} = ?' for column in DERIVATIVE_COLUMNS)} WHERE id = ?",
+                     [derivatives[column] for column in DERIVATIVE_COLUMNS] + [document_id])
+        conn.commit()
+        built += 1
+    return built, skipped
+
+def main():
+    if not derivatives_enabled():
+        print("❌ Pillow is not installed. Run: pip install Pillow")
+        sys.exit(1)
+
+    database = sys.argv[1] if len(sys.argv) > 1 else Config.DATABASE
+    upload_folder = sys.argv[2] if len(sys.argv) > 2 else Config.UPLOAD_FOLDER
+
+    conn = sqlite3.connect(database)
+    try:
+        apply_migrations(conn, verbose=False)
+        built, skipped = build_missing(conn, upload_folder)
+        print(f"✅ Built derivatives for {built} photo(s), skipped {skipped} non-image or missing file(s)")
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
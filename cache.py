@@ -0,0 +1,260 @@
+"""
+Caching helpers with pluggable backends.
+
+TTLCache is a small thread-safe in-process LRU map whose entries also expire
+after a fixed number of seconds. Under gunicorn every worker has its own
+copy, so ``create_cache`` can instead return a backend shared by all
+workers: SQLiteCache (a separate SQLite file, for one machine) or RedisCache
+(any Redis-compatible server, when the optional ``redis`` package is
+installed). All backends keep hit/miss counters so the effect of a cache can
+be checked from stats() rather than guessed.
+
+Cached data derived from properties is keyed by the data_generations
+counters, which triggers bump in the same transaction as every write. A
+worker reads the current generation and looks up that key, so it sees fresh
+data straight after any worker's write without expiring or polling
+anything; entries for older generations simply age out.
+
+Shared backends pickle values, so the cache file or server must be as
+trusted as the database itself.
+"""
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:  # redis not installed: memory and sqlite backends only
+    redis = None
+
+class Cache:
+    """Interface shared by the backends; subclasses provide get/set/invalidate/clear/stats"""
+
+    def get_or_load(self, key, loader):
+        """Return the cached value or call ``loader()`` and cache its result.
+
+        A ``None`` result is returned but not cached, so rows created later
+        are picked up on the next lookup.
+        """
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        value = loader()
+        if value is not None:
+            self.set(key, value)
+        return value
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _stats(self, size):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': size,
+                'maxsize': self.maxsize,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+class TTLCache(Cache):
+    """Least-recently-used cache with per-entry expiry, private to this process"""
+
+    def __init__(self, maxsize=256, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._data)
+        return self._stats(size)
+
+class SQLiteCache(Cache):
+    """Cache shared by every process on one machine through a SQLite file.
+
+    Entries live in the ``cache_entries`` table of their own file, so cache
+    writes never wait on the application database's write lock. Keys are
+    stored as ``repr(key)`` within ``namespace``; once a namespace holds
+    more than ``maxsize`` entries the oldest written are dropped. A locked
+    or unreadable file counts as a miss rather than failing the request.
+    """
+
+    # Expired and surplus entries are pruned after this many writes
+    PRUNE_EVERY = 64
+
+    def __init__(self, path, namespace, maxsize=256, ttl=300):
+        self.path = path
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        """This thread's connection, reopened after a fork"""
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            # Entries can always be rebuilt, so durability is not worth an fsync
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries
+                            (namespace TEXT NOT NULL,
+                             key TEXT NOT NULL,
+                             value BLOB NOT NULL,
+                             expires REAL NOT NULL,
+                             PRIMARY KEY (namespace, key)) WITHOUT ROWID''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_entries_expires ON cache_entries (namespace, expires)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, key, default=None):
+        try:
+            row = self._connect().execute('SELECT value, expires FROM cache_entries WHERE namespace = ? AND key = ?',
+                                          (self.namespace, repr(key))).fetchone()
+        except sqlite3.Error:
+            row = None
+        hit = row is not None and row[1] > time.time()
+        self._count(hit)
+        return pickle.loads(row[0]) if hit else default
+
+    def set(self, key, value):
+        try:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires) VALUES (?, ?, ?, ?)',
+                         (self.namespace, repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), time.time() + self.ttl))
+            with self._lock:
+                self._writes += 1
+                prune = self._writes % self.PRUNE_EVERY == 0
+            if prune:
+                self.prune(conn)
+        except sqlite3.Error:
+            pass
+
+    def prune(self, conn=None):
+        """Delete expired entries and the oldest ones beyond ``maxsize``"""
+        conn = conn or self._connect()
+        conn.execute('DELETE FROM cache_entries WHERE namespace = ? AND expires <= ?', (self.namespace, time.time()))
+        conn.execute('''DELETE FROM cache_entries WHERE namespace = ? AND key IN
+                            (SELECT key FROM cache_entries WHERE namespace = ?
+                             ORDER BY expires DESC LIMIT -1 OFFSET ?)''',
+                     (self.namespace, self.namespace, self.maxsize))
+
+    def invalidate(self, key):
+        try:
+            self._connect().execute('DELETE FROM cache_entries WHERE namespace = ? AND key = ?',
+                                    (self.namespace, repr(key)))
+        except sqlite3.Error:
+            pass
+
+    def clear(self):
+        self._connect().execute('DELETE FROM cache_entries WHERE namespace = ?', (self.namespace,))
+
+    def stats(self):
+        size = self._connect().execute('SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires > ?',
+                                       (self.namespace, time.time())).fetchone()[0]
+        return self._stats(size)
+
+class RedisCache(Cache):
+    """Cache shared through a Redis-compatible server (Redis, Valkey, KeyDB, ...).
+
+    Entries are written with SETEX so the server expires them; the size is
+    bounded by the server's maxmemory policy rather than ``maxsize``. An
+    unreachable server counts as a miss rather than failing the request.
+    """
+
+    def __init__(self, url, namespace, maxsize=256, ttl=300):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = f"property_management:{namespace}:"
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        try:
+            value = self.client.get(self.prefix + repr(key))
+        except redis.RedisError:
+            value = None
+        self._count(value is not None)
+        return pickle.loads(value) if value is not None else default
+
+    def set(self, key, value):
+        try:
+            self.client.setex(self.prefix + repr(key), self.ttl, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        except redis.RedisError:
+            pass
+
+    def invalidate(self, key):
+        try:
+            self.client.delete(self.prefix + repr(key))
+        except redis.RedisError:
+            pass
+
+    def _keys(self):
+        return self.client.scan_iter(match=self.prefix.replace('[', '[[]') + '*', count=500)
+
+    def clear(self):
+        keys = list(self._keys())
+        for start in range(0, len(keys), 500):
+            self.client.delete(*keys[start:start + 500])
+
+    def stats(self):
+        return self._stats(sum(1 for _ in self._keys()))
+
+def create_cache(config, namespace, maxsize, ttl):
+    """A cache for ``namespace`` on the backend named by CACHE_BACKEND (memory, sqlite or redis)"""
+    backend = config['CACHE_BACKEND']
+    if backend == 'sqlite':
+        return SQLiteCache(config['CACHE_PATH'], namespace, maxsize, ttl)
+    if backend == 'redis':
+        if redis is not None:
+            return RedisCache(config['CACHE_URL'], namespace, maxsize, ttl)
+        print(f"⚠️  CACHE_BACKEND=redis needs the redis package; {namespace} cache stays in-process")
+    return TTLCache(maxsize, ttl)
@@ -0,0 +1,134 @@
+"""
+Resumable, chunked uploads for large documents.
+
+A regular multipart upload is buffered by Werkzeug and capped by
+MAX_CONTENT_LENGTH. Large files instead go through a session:
+
+    POST /uploads                   start: property_id, filename, size, document_type
+    GET  /uploads/<id>              how many bytes have arrived (resume point)
+    PUT  /uploads/<id>?offset=N     append one chunk; raw body, X-Chunk-SHA256 header
+    POST /uploads/<id>/complete     check size (and optional sha256), file the document
+
+Each chunk is streamed straight into ``<id>.part`` in the blob store's
+incoming directory and checked against its SHA-256 before the session's
+offset moves, so a failed or corrupted chunk is simply sent again. On
+completion the part file is moved into the blob store without copying and
+the session keeps the new document's id until it expires, so a repeated
+/complete (say, after a dropped response) answers with the same document.
+"""
+import os
+import uuid
+import hashlib
+from datetime import datetime, timedelta
+
+class UploadError(Exception):
+    """A rejected upload request; ``status`` is the HTTP status to answer with"""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+    def to_dict(self):
+        return {'error': str(self), **self.details}
+
+def part_path(incoming_dir, upload_id):
+    return os.path.join(incoming_dir, f"{upload_id}.part")
+
+def create_session(conn, incoming_dir, property_id, original_filename, document_type, total_size):
+    """Record a new upload session and create its empty part file; returns the session row"""
+    upload_id = uuid.uuid4().hex
+    current_time = datetime.now().isoformat()
+    os.makedirs(incoming_dir, exist_ok=True)
+    open(part_path(incoming_dir, upload_id), 'wb').close()
+    conn.execute('''INSERT INTO upload_sessions
+                    (id, property_id, original_filename, document_type, total_size, received_size, created_date, updated_date)
+                    VALUES (?, ?, ?, ?, ?, 0, ?, ?)''',
+                 (upload_id, property_id, original_filename, document_type, total_size, current_time, current_time))
+    conn.commit()
+    return get_session(conn, upload_id)
+
+def get_session(conn, upload_id):
+    session = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    if session is None:
+        raise UploadError('Unknown or expired upload', 404)
+    return session
+
+def session_status(session):
+    return {'upload_id': session['id'], 'offset': session['received_size'], 'size': session['total_size']}
+
+def append_chunk(conn, incoming_dir, session, stream, offset, checksum, max_chunk_size, block_size=64 * 1024):
+    """Write one chunk from ``stream`` at ``offset`` and return the new offset.
+
+    The chunk must start exactly where the previous one ended and match the
+    hex SHA-256 in ``checksum``; otherwise nothing is recorded and the part
+    file is cut back to the last good offset.
+    """
+    received = session['received_size']
+    if offset != received:
+        raise UploadError('Chunk does not start at the current offset', 409, offset=received)
+    if not checksum:
+        raise UploadError('X-Chunk-SHA256 header is required')
+
+    path = part_path(incoming_dir, session['id'])
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as part:
+        part.seek(offset)
+        part.truncate()
+        try:
+            for block in iter(lambda: stream.read(block_size), b''):
+                written += len(block)
+                if written > max_chunk_size or offset + written > session['total_size']:
+                    raise UploadError('Chunk is larger than allowed', 413, offset=received)
+                digest.update(block)
+                part.write(block)
+            if digest.hexdigest() != checksum.lower():
+                raise UploadError('Chunk checksum mismatch', 422, offset=received)
+        except BaseException:
+            part.truncate(offset)
+            raise
+
+    new_offset = offset + written
+    updated = conn.execute('''UPDATE upload_sessions SET received_size = ?, updated_date = ?
+                              WHERE id = ? AND received_size = ?''',
+                           (new_offset, datetime.now().isoformat(), session['id'], received)).rowcount
+    conn.commit()
+    if not updated:
+        raise UploadError('Upload was modified concurrently', 409, offset=get_session(conn, session['id'])['received_size'])
+    return new_offset
+
+def complete_session(conn, blobs, session, expected_sha256=None):
+    """Move the assembled file into the store through the BlobBatch ``blobs`` and return the blob filename.
+
+    The caller files the document and records it with ``mark_complete`` in
+    the same transaction, inside the batch.
+    """
+    if session['received_size'] != session['total_size']:
+        raise UploadError('Upload is incomplete', 409, offset=session['received_size'])
+    path = part_path(blobs.store.incoming_dir, session['id'])
+    try:
+        return blobs.adopt(path, session['original_filename'], expected_sha256)
+    except ValueError as e:
+        raise UploadError(str(e), 422)
+    except FileNotFoundError:
+        # Another request took the part file first
+        raise UploadError('Upload is already being completed', 409, offset=session['received_size'])
+
+def mark_complete(conn, session, document_id):
+    conn.execute('UPDATE upload_sessions SET document_id = ?, updated_date = ? WHERE id = ?',
+                 (document_id, datetime.now().isoformat(), session['id']))
+
+def expire_sessions(conn, incoming_dir, max_age):
+    """Drop sessions idle for more than ``max_age`` seconds along with their part files"""
+    cutoff = (datetime.now() - timedelta(seconds=max_age)).isoformat()
+    expired = [row['id'] for row in conn.execute('SELECT id FROM upload_sessions WHERE updated_date < ?', (cutoff,))]
+    for upload_id in expired:
+        conn.execute('DELETE FROM upload_sessions WHERE id = ?', (upload_id,))
+    conn.commit()
+    for upload_id in expired:
+        try:
+            os.remove(part_path(incoming_dir, upload_id))
+        except FileNotFoundError:
+            pass
+    return len(expired)
@@ -0,0 +1,53 @@
+"""
+Background removal of uploaded files.
+
+Deleting rows is fast; unlinking their files one by one is not. Views
+enqueue a ``delete_files`` job (see jobs.py) in the deleting transaction, so
+the files are removed by the job worker once the rows are gone, and never if
+the delete is rolled back.
+
+A blob can be uploaded again between the delete and the job. The reference
+check and the unlink run under ``BEGIN IMMEDIATE`` so no new row commits in
+between, and blobs modified after the job was queued are left alone. An
+upload whose row commits after the job ran puts its blob back from the spare
+copy its BlobBatch keeps (see blobstore.py).
+"""
+import os
+import time
+
+import jobs
+
+def enqueue_removal(conn, file_groups):
+    """Queue ``[original, *derivatives]`` filename groups for removal in the caller's transaction"""
+    file_groups = list(file_groups)
+    if file_groups:
+        jobs.enqueue(conn, 'delete_files', {'files': file_groups, 'queued_at': time.time()})
+
+@jobs.handler('delete_files')
+def delete_files(app, conn, payload):
+    blob_store = app.extensions['blob_store']
+    queued_at = payload.get('queued_at', float('inf'))
+    removed = skipped = 0
+    for filenames in payload['files']:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # The same content may have been uploaded again since the job was queued
+            if (conn.execute('SELECT 1 FROM property_documents WHERE filename = ? LIMIT 1', (filenames[0],)).fetchone()
+                    or modified_after(blob_store.path(filenames[0]), queued_at)):
+                skipped += 1
+                continue
+            for filename in filenames:
+                try:
+                    os.remove(blob_store.path(filename))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        finally:
+            conn.commit()
+    return {'removed': removed, 'skipped': skipped}
+
+def modified_after(path, timestamp):
+    try:
+        return os.path.getmtime(path) > timestamp
+    except FileNotFoundError:
+        return False
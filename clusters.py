@@ -0,0 +1,135 @@
+"""
+Server-side marker clustering for the portfolio map.
+
+The map asks for the points inside its viewport at a zoom level. The
+viewport is split into standard 256px web-map tiles, and each tile is
+clustered on its own: points are grouped into square grid cells of
+MAP_CLUSTER_CELL_PX pixels with one GROUP BY over the property_locations
+R*Tree, and each cell becomes a marker at the centroid of its points.
+
+Because tiles are fixed, a tile's markers depend only on (zoom, x, y, the
+listing filters and the data generations), so they are cached per tile and
+shared by every viewport that overlaps it; panning only computes the newly
+exposed tiles.
+"""
+import math
+
+from queries import FILTER_ARGS, LOCATION_BOX_SQL, build_property_filters, get_data_generation, pick_args
+
+TILE_SIZE = 256
+MAX_ZOOM = 20
+# Mercator's latitude limit; the R*Tree still answers for points beyond it
+MAX_LATITUDE = 85.05112878
+# Listing filters that apply on the map; its own bbox is the viewport
+MAP_FILTER_ARGS = tuple(key for key in FILTER_ARGS if key != 'bbox')
+
+def lng_to_tile_x(lng, zoom):
+    return (lng + 180.0) / 360.0 * (1 << zoom)
+
+def lat_to_tile_y(lat, zoom):
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    phi = math.radians(lat)
+    return (1.0 - math.log(math.tan(phi) + 1.0 / math.cos(phi)) / math.pi) / 2.0 * (1 << zoom)
+
+def tile_bounds(zoom, x, y):
+    """``(south, north, west, east)`` of tile (x, y) at ``zoom``"""
+    n = 1 << zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    # Tiles on the edge of the world also take the points beyond mercator's range
+    if y == 0:
+        north = 90.0
+    if y == n - 1:
+        south = -90.0
+    return south, north, west, east
+
+def tiles_for_bbox(bbox, zoom):
+    """Tile (x, y) pairs covering ``bbox`` = ``(min_lat, max_lat, min_lng, max_lng)``"""
+    min_lat, max_lat, min_lng, max_lng = bbox
+    last = (1 << zoom) - 1
+    x0 = max(0, min(last, int(lng_to_tile_x(min_lng, zoom))))
+    x1 = max(0, min(last, int(lng_to_tile_x(max_lng, zoom))))
+    y0 = max(0, min(last, int(lat_to_tile_y(max_lat, zoom))))
+    y1 = max(0, min(last, int(lat_to_tile_y(min_lat, zoom))))
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+def filter_args(args):
+    """The listing filters in ``args`` as a sorted tuple, usable in a cache key"""
+    return tuple(sorted(pick_args(args, MAP_FILTER_ARGS).items()))
+
+def cluster_tile(conn, zoom, x, y, filters=(), cell_px=64):
+    """Markers for one tile: ``[{lat, lng, count[, property_id, title, status]}]``.
+
+    Cells are cut evenly in latitude within the tile, which at tile scale is
+    indistinguishable from mercator spacing. Markers of a single property
+    carry its id, title and status for the popup.
+    """
+    south, north, west, east = tile_bounds(zoom, x, y)
+    cells = max(1, TILE_SIZE // cell_px)
+    cell_lng = (east - west) / cells
+    cell_lat = (north - south) / cells
+    where_sql, params = build_property_filters(dict(filters))
+
+    rows = conn.execute(f'''SELECT MIN(CAST((l.min_lng - ?) / ? AS INTEGER), {cells - 1}) AS cx,
+                                   MIN(CAST((? - l.min_lat) / ? AS INTEGER), {cells - 1}) AS cy,
+                                   COUNT(DISTINCT l.property_id) AS count,
+                                   AVG(l.min_lat) AS lat, AVG(l.min_lng) AS lng,
+                                   MIN(l.property_id) AS property_id
+                            FROM property_locations l
+                            JOIN properties p ON p.id = l.property_id
+                            WHERE l.max_lat >= ? AND l.min_lat <= ? AND l.max_lng >= ? AND l.min_lng <= ?
+                              AND l.min_lat > ? AND l.min_lng < ?{where_sql}
+                            GROUP BY cx, cy''',
+                         [west, cell_lng, north, cell_lat,
+                          # The R*Tree box, then half-open edges so a point on a shared border lands in one tile
+                          south, north, west, east, south if y < (1 << zoom) - 1 else -91.0,
+                          east if x < (1 << zoom) - 1 else 181.0, *params]).fetchall()
+
+    markers = [{'lat': round(row['lat'], 6), 'lng': round(row['lng'], 6), 'count': row['count'],
+                'property_id': row['property_id'] if row['count'] == 1 else None}
+               for row in rows]
+    singles = [marker['property_id'] for marker in markers if marker['property_id']]
+    if singles:
+        placeholders = ', '.join('?' * len(singles))
+        details = {row['id']: row for row in conn.execute(
+            f'SELECT id, title, status FROM properties WHERE id IN ({placeholders})', singles)}
+        for marker in markers:
+            if marker['property_id']:
+                marker['title'] = details[marker['property_id']]['title']
+                marker['status'] = details[marker['property_id']]['status']
+    return markers
+
+def load_clusters(conn, cache, bbox, zoom, args, cell_px=64, max_tiles=256):
+    """Markers for every tile covering ``bbox``, each tile cached by data generation.
+
+    Returns None when the viewport needs more than ``max_tiles`` tiles.
+    """
+    tiles = tiles_for_bbox(bbox, zoom)
+    if len(tiles) > max_tiles:
+        return None
+    filters = filter_args(args)
+    generations = (get_data_generation(conn, 'properties'), get_data_generation(conn, 'locations'))
+    markers = []
+    for x, y in tiles:
+        markers.extend(cache.get_or_load(('map_tile', zoom, x, y, cell_px, filters, generations),
+                                         lambda: cluster_tile(conn, zoom, x, y, filters, cell_px)))
+    return markers
+
+def count_properties(conn, bbox, args):
+    """Distinct properties with a location inside ``bbox`` that match the listing filters in ``args``.
+
+    A property linked to several points can appear in more than one tile's
+    markers, so the viewport total is counted here rather than summed.
+    """
+    where_sql, params = build_property_filters(dict(filter_args(args)))
+    return conn.execute(f'''SELECT COUNT(*) FROM properties p
+                            WHERE p.id IN ({LOCATION_BOX_SQL}){where_sql}''', [*bbox, *params]).fetchone()[0]
+
+def parse_zoom(value):
+    try:
+        zoom = int(value)
+    except (TypeError, ValueError):
+        return None
+    return zoom if 0 <= zoom <= MAX_ZOOM else None
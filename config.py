@@ -10,6 +10,74 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 16 * 1024 * 1024))
     ALLOWED_EXTENSIONS = set(os.getenv('ALLOWED_EXTENSIONS', 'txt,pdf,png,jpg,jpeg,gif,doc,docx').split(','))
     
+    # Resumable chunked uploads; each chunk request must fit in MAX_CONTENT_LENGTH
+    MAX_UPLOAD_SIZE = int(os.getenv('MAX_UPLOAD_SIZE', 512 * 1024 * 1024))
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+    UPLOAD_SESSION_TTL = int(os.getenv('UPLOAD_SESSION_TTL', 24 * 60 * 60))  # seconds
+    UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 4))  # parallel file writes per request
+    
+    # Database configuration; DATABASE_URL uses the sqlite:///path form
+    DATABASE = os.getenv('DATABASE_URL', 'sqlite:///property_management.db').replace('sqlite:///', '', 1)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 4))
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -20000))  # negative = KiB
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # milliseconds
+
+    # Instrumentation: Server-Timing headers, /metrics (Prometheus) and the slow
+    # SQL log (statements taking at least SLOW_QUERY_MS; -1 turns it off)
+    SERVER_TIMING = os.getenv('SERVER_TIMING', 'True').lower() == 'true'
+    SLOW_QUERY_MS = int(os.getenv('SLOW_QUERY_MS', 100))
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')  # bearer token for scrapers; unset = login required
+
+    # Cache backend shared by the users, filter option and map tile caches:
+    # memory (per process), sqlite (one file shared by every worker on this
+    # machine) or redis (any Redis-compatible server; needs `pip install redis`)
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory').lower()
+    CACHE_PATH = os.getenv('CACHE_PATH', 'property_management_cache.db')
+    CACHE_URL = os.getenv('CACHE_URL', 'redis://localhost:6379/0')
+    
+    # Authenticated user cache
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 256))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))  # seconds
+    
+    # Listing pagination
+    LISTING_PAGE_SIZE = int(os.getenv('LISTING_PAGE_SIZE', 24))
+    LISTING_MAX_PAGE_SIZE = int(os.getenv('LISTING_MAX_PAGE_SIZE', 100))
+    
+    # Filter form option cache
+    LISTING_CACHE_SIZE = int(os.getenv('LISTING_CACHE_SIZE', 64))
+    LISTING_CACHE_TTL = int(os.getenv('LISTING_CACHE_TTL', 3600))  # seconds
+    SHOW_FACET_COUNTS = os.getenv('SHOW_FACET_COUNTS', 'True').lower() == 'true'
+    
+    # Rendered listing and detail pages, cached per data generation (0 disables)
+    PAGE_CACHE_SIZE = int(os.getenv('PAGE_CACHE_SIZE', 128))
+    PAGE_CACHE_TTL = int(os.getenv('PAGE_CACHE_TTL', 3600))  # seconds
+    
+    # Portfolio map: clustered markers cached per 256px tile and data generation
+    MAP_TILE_CACHE_SIZE = int(os.getenv('MAP_TILE_CACHE_SIZE', 2048))
+    MAP_CLUSTER_CELL_PX = int(os.getenv('MAP_CLUSTER_CELL_PX', 64))  # grid cell size in screen pixels
+    
+    # Browser caching of uploaded files
+    DOWNLOAD_MAX_AGE = int(os.getenv('DOWNLOAD_MAX_AGE', 365 * 24 * 60 * 60))  # seconds
+    FILE_ETAG_CACHE_SIZE = int(os.getenv('FILE_ETAG_CACHE_SIZE', 4096))
+    
+    # Who sends upload bytes: flask, x-sendfile (Apache) or x-accel-redirect (nginx)
+    FILE_DELIVERY = os.getenv('FILE_DELIVERY', 'flask').lower()
+    X_ACCEL_REDIRECT_PREFIX = os.getenv('X_ACCEL_REDIRECT_PREFIX', '/protected-uploads/')
+
+    # Background jobs: 'thread' runs a worker inside each app process, 'external'
+    # leaves them to `python worker.py`
+    JOB_WORKER = os.getenv('JOB_WORKER', 'thread').lower()
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))  # seconds
+    JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 600))  # seconds before a running job is retried
+    JOB_RETRY_DELAY = int(os.getenv('JOB_RETRY_DELAY', 30))  # seconds, doubled on every attempt
+    JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', 7))
+
+    # Bulk imports: rows written per transaction
+    IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+    
     # Security configurations
     SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
     SESSION_COOKIE_HTTPONLY = os.getenv('SESSION_COOKIE_HTTPONLY', 'True').lower() == 'true'
@@ -0,0 +1,100 @@
+"""
+SQLite connection handling shared by app.py and app_production.py.
+
+Each request borrows one connection from a small per-process pool, keeps it
+on ``flask.g`` so ``load_user`` and the view share it, and hands it back in
+``teardown_appcontext``. Connections are opened lazily, so a pool created
+before gunicorn forks never shares a file handle between workers.
+"""
+import os
+import queue
+import sqlite3
+
+from flask import current_app, g
+
+from geo import distance_km
+from instrumentation import InstrumentedConnection
+
+def connect(database, journal_mode='WAL', synchronous='NORMAL', cache_size=-20000,
+            mmap_size=134217728, busy_timeout=5000, slow_query_ms=None):
+    """Open a connection with Row results and the tuned PRAGMAs applied.
+
+    ``cache_size`` follows SQLite's convention (negative values are KiB),
+    ``mmap_size`` is in bytes and ``busy_timeout`` in milliseconds.
+    Statements are timed (see instrumentation.py); those taking at least
+    ``slow_query_ms`` are logged with their query plan.
+    """
+    conn = sqlite3.connect(database, timeout=busy_timeout / 1000, check_same_thread=False,
+                           factory=InstrumentedConnection)
+    if slow_query_ms is not None:
+        conn.slow_query_seconds = slow_query_ms / 1000
+    conn.row_factory = sqlite3.Row
+    conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+    conn.execute(f'PRAGMA cache_size = {int(cache_size)}')
+    conn.execute(f'PRAGMA mmap_size = {int(mmap_size)}')
+    conn.execute(f'PRAGMA busy_timeout = {int(busy_timeout)}')
+    # Exact distance check for radius searches (see geo.py)
+    conn.create_function('distance_km', 4, distance_km, deterministic=True)
+    return conn
+
+def connect_from_config(config):
+    """Open a tuned connection using the DATABASE and SQLITE_* config keys"""
+    return connect(config['DATABASE'],
+                   journal_mode=config['SQLITE_JOURNAL_MODE'],
+                   synchronous=config['SQLITE_SYNCHRONOUS'],
+                   cache_size=config['SQLITE_CACHE_SIZE'],
+                   mmap_size=config['SQLITE_MMAP_SIZE'],
+                   busy_timeout=config['SQLITE_BUSY_TIMEOUT'],
+                   slow_query_ms=config['SLOW_QUERY_MS'] if config['SLOW_QUERY_MS'] >= 0 else None)
+
+class ConnectionPool:
+    """Keep up to ``size`` idle connections for reuse within one process"""
+
+    def __init__(self, factory, size):
+        self.factory = factory
+        self.size = size
+        self.pid = os.getpid()
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self):
+        if self.pid != os.getpid():
+            # Forked after connections were opened: start over in this process
+            self.pid = os.getpid()
+            self.idle = queue.LifoQueue(maxsize=self.size)
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            return self.factory()
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def close_all(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+def get_db():
+    """Return the connection bound to the current app context"""
+    if 'db' not in g:
+        g.db = current_app.extensions['db_pool'].acquire()
+    return g.db
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        current_app.extensions['db_pool'].release(conn)
+
+def init_app(app):
+    """Attach a connection pool to ``app`` and return it to the pool on teardown"""
+    app.extensions['db_pool'] = ConnectionPool(lambda: connect_from_config(app.config),
+                                               app.config['DB_POOL_SIZE'])
+    app.teardown_appcontext(close_db)
@@ -0,0 +1,97 @@
+"""
+Delivery of uploaded documents and photos.
+
+Uploads are stored as content-addressed blobs (older ones under
+timestamp-prefixed names) and never rewritten, so they are served with a
+content-hash ETag and, for those names, a year-long
+``Cache-Control: private, immutable`` policy. A blob's ETag is the hash in
+its name, so only the older files are ever read to compute one. Conditional requests
+(If-None-Match / If-Modified-Since) and byte ranges are answered by
+Werkzeug's send_file, so repeat views and resumed PDF downloads never
+re-send bytes the browser already has.
+
+With FILE_DELIVERY set to ``x-sendfile`` (Apache mod_xsendfile) or
+``x-accel-redirect`` (nginx) Flask still checks the login and answers 304s,
+but a 200 carries only a header naming the file and the web server sends
+the bytes (and handles ranges) without tying up a worker.
+"""
+import os
+import re
+import hashlib
+import mimetypes
+from urllib.parse import quote
+
+from flask import abort, current_app, request, send_file
+from werkzeug.security import safe_join
+
+DELIVERY_MODES = ('flask', 'x-sendfile', 'x-accel-redirect')
+
+# Content-addressed blobs, and the older 20250101_120000_original.ext names
+# (derivatives keep the prefix of their original)
+IMMUTABLE_NAME = re.compile(r'^(blobs/|\d{8}_\d{6}_)')
+
+# A blob's name already holds its SHA-256 (derivatives add a suffix to it)
+BLOB_NAME = re.compile(r'^blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}[^/.]*)(\.[^/]*)?$')
+
+def upload_etag(filename, path, cache):
+    """ETag for an upload: the hash in a blob's name, else the hash of the file itself"""
+    match = BLOB_NAME.match(filename)
+    if match:
+        return match.group(1)
+    return file_etag(path, cache)
+
+def file_etag(path, cache):
+    """SHA-256 of the file at ``path``, hashed once per (path, mtime, size) and cached"""
+    stat = os.stat(path)
+
+    def hash_file():
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    return cache.get_or_load((path, stat.st_mtime_ns, stat.st_size), hash_file)
+
+def offload_response(path, filename, delivery, accel_prefix):
+    """Empty response telling the front-end server to send ``path`` itself"""
+    response = current_app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    if delivery == 'x-sendfile':
+        response.headers['X-Sendfile'] = path
+    else:
+        response.headers['X-Accel-Redirect'] = f"{accel_prefix.rstrip('/')}/{quote(filename)}"
+    response.last_modified = os.stat(path).st_mtime
+    return response
+
+def send_upload(upload_folder, filename, etag_cache, max_age, delivery='flask', accel_prefix='/protected-uploads/'):
+    """Send ``filename`` from ``upload_folder`` with ETag, caching and Range support"""
+    path = safe_join(os.path.abspath(upload_folder), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    immutable = bool(IMMUTABLE_NAME.match(filename))
+    etag = upload_etag(filename, path, etag_cache)
+    if delivery == 'flask':
+        response = send_file(path, etag=etag, conditional=True, max_age=max_age if immutable else 0)
+        # Advertise ranges on full responses too, so PDF viewers fetch pages lazily
+        response.accept_ranges = 'bytes'
+    elif delivery in DELIVERY_MODES:
+        response = offload_response(path, filename, delivery, accel_prefix)
+        response.set_etag(etag)
+        response.cache_control.max_age = max_age if immutable else 0
+        # Ranges are left to the web server; only revalidation is answered here
+        response.make_conditional(request)
+        if response.status_code == 304:
+            response.headers.pop('X-Sendfile', None)
+            response.headers.pop('X-Accel-Redirect', None)
+    else:
+        raise ValueError(f"FILE_DELIVERY must be one of {', '.join(DELIVERY_MODES)}, not {delivery!r}")
+
+    # Uploads sit behind the login, so only the browser itself may keep a copy
+    response.cache_control.public = False
+    response.cache_control.private = True
+    if immutable:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
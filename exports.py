@@ -0,0 +1,117 @@
+"""
+CSV export of the property listing.
+
+Rows are read with one query and written through the csv module in small
+batches, so a response generator built from ``iter_properties_csv`` streams
+any number of properties in constant memory. Large exports can instead run
+as an ``export_csv`` job that writes the file under UPLOAD_FOLDER/exports
+for download from the jobs page.
+"""
+import io
+import os
+import csv
+import time
+import uuid
+from datetime import datetime
+
+import jobs
+from queries import SORT_FIELDS, RELEVANCE_SORT, FTS_WEIGHTS, normalize_sort, listing_query_from_args
+
+EXPORT_DIR = 'exports'
+
+# (CSV header, properties column) in export order
+EXPORT_COLUMNS = [
+    ('Title', 'title'),
+    ('Type', 'property_type'),
+    ('Status', 'status'),
+    ('Price', 'price'),
+    ('Location', 'location'),
+    ('RTC', 'rtc'),
+    ('Owner', 'owner_name'),
+    ('Contact', 'owner_contact'),
+    ('Date Added', 'created_date'),
+]
+
+def iter_export_rows(conn, where_sql='', params=(), sort_by='created_date', sort_order='desc', match_query=None):
+    """Yield export rows (tuples in EXPORT_COLUMNS order) for the filtered listing.
+
+    Takes the same ``where_sql``/``params``/``match_query`` as
+    fetch_properties_with_photos. Rows come straight off the cursor, so
+    nothing is materialised beyond SQLite's own page cache.
+    """
+    sort_by, sort_order = normalize_sort(sort_by, sort_order, searching=bool(match_query))
+    sort_sql = RELEVANCE_SORT if sort_by == 'relevance' else SORT_FIELDS[sort_by]
+    direction = 'DESC' if sort_order == 'desc' else 'ASC'
+
+    query_params = []
+    search_join = ""
+    if match_query:
+        search_join = f'''
+                    JOIN (SELECT rowid AS fts_rowid, -bm25(properties_fts, {FTS_WEIGHTS}) AS relevance
+                          FROM properties_fts WHERE properties_fts MATCH ?) s ON s.fts_rowid = p.id'''
+        query_params.append(match_query)
+    query_params.extend(params)
+
+    columns = ', '.join(f'p.{column}' for _, column in EXPORT_COLUMNS)
+    query = f'''SELECT {columns}
+                FROM properties p{search_join}
+                WHERE 1=1{where_sql}
+                ORDER BY {sort_sql} {direction}, p.id {direction}'''
+    for row in conn.execute(query, query_params):
+        yield tuple(row)
+
+def iter_csv(rows, header=None, batch_size=500):
+    """Encode ``rows`` as CSV text, yielding one chunk per ``batch_size`` rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    pending = 0
+    for row in rows:
+        writer.writerow(['' if value is None else value for value in row])
+        pending += 1
+        if pending >= batch_size:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def iter_properties_csv(conn, where_sql='', params=(), sort_by='created_date', sort_order='desc', match_query=None):
+    """Stream the filtered listing as CSV text chunks, header first"""
+    header = [title for title, _ in EXPORT_COLUMNS]
+    rows = iter_export_rows(conn, where_sql, params, sort_by, sort_order, match_query)
+    return iter_csv(rows, header)
+
+def prune_exports(export_dir, max_age):
+    """Remove export files older than ``max_age`` seconds"""
+    cutoff = time.time() - max_age
+    for entry in os.scandir(export_dir):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+@jobs.handler('export_csv')
+def export_csv(app, conn, payload):
+    """Write the listing filtered by ``payload['args']`` to a CSV file under UPLOAD_FOLDER"""
+    export_dir = os.path.join(app.config['UPLOAD_FOLDER'], EXPORT_DIR)
+    os.makedirs(export_dir, exist_ok=True)
+    prune_exports(export_dir, app.config['JOB_RETENTION_DAYS'] * 24 * 60 * 60)
+
+    match_query, where_sql, params, sort_by, sort_order = listing_query_from_args(payload.get('args', {}))
+    rows = 0
+
+    def counted(export_rows):
+        nonlocal rows
+        for row in export_rows:
+            rows += 1
+            yield row
+
+    name = f"properties_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.csv"
+    path = os.path.join(export_dir, name)
+    header = [title for title, _ in EXPORT_COLUMNS]
+    with open(path + '.tmp', 'w', newline='', encoding='utf-8') as f:
+        for chunk in iter_csv(counted(iter_export_rows(conn, where_sql, params, sort_by, sort_order, match_query)), header):
+            f.write(chunk)
+    os.replace(path + '.tmp', path)
+    return {'filename': f"{EXPORT_DIR}/{name}", 'rows': rows}
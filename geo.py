@@ -0,0 +1,123 @@
+"""
+Coordinates and distances for the spatial property search.
+
+Map link coordinates are indexed in the ``property_locations`` R*Tree (see
+migration 13), which answers "which points fall inside this box" without
+scanning every row. A radius search first asks the R*Tree for the box
+around the circle and then drops the corners with ``distance_km``, which is
+registered as an SQL function on every connection.
+
+Coordinates are taken from the Google Maps link when a map link is saved
+without typed ones (``coordinates_from_maps_link``), so they are parsed once
+on write; ``python backfill_coordinates.py`` does the same for older rows.
+"""
+import re
+import math
+from urllib.parse import urlsplit, parse_qs, unquote_plus
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance between two points in kilometres"""
+    if None in (lat1, lng1, lat2, lng2):
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def radius_bounds(lat, lng, radius_km):
+    """``(min_lat, max_lat, min_lng, max_lng)`` of a box containing the circle.
+
+    Boxes reaching a pole or the antimeridian are widened to the full
+    longitude range rather than split, which only costs a few extra
+    candidates for the distance check.
+    """
+    d_lat = radius_km / KM_PER_DEGREE_LAT
+    min_lat, max_lat = max(-90.0, lat - d_lat), min(90.0, lat + d_lat)
+    cos_lat = math.cos(math.radians(lat))
+    if min_lat <= -90 or max_lat >= 90 or cos_lat <= 0:
+        return min_lat, max_lat, -180.0, 180.0
+    d_lng = d_lat / cos_lat
+    if lng - d_lng < -180 or lng + d_lng > 180:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lng - d_lng, lng + d_lng
+
+# "12.9716,77.5946" (optionally with spaces or a leading "loc:")
+LAT_LNG = re.compile(r'^\s*(?:loc:)?\s*([-+]?\d{1,2}(?:\.\d+)?)\s*,\s*([-+]?\d{1,3}(?:\.\d+)?)\s*$')
+# Place pin inside the data= blob: ...!3d12.9716!4d77.5946...
+PIN = re.compile(r'!3d([-+]?\d{1,2}(?:\.\d+)?)!4d([-+]?\d{1,3}(?:\.\d+)?)')
+# Map viewport centre: /@12.9716,77.5946,17z
+VIEWPORT = re.compile(r'@([-+]?\d{1,2}(?:\.\d+)?),([-+]?\d{1,3}(?:\.\d+)?)')
+# Query parameters that carry a point, most specific first
+POINT_PARAMS = ('q', 'query', 'destination', 'daddr', 'll', 'sll', 'center')
+
+def _point(match):
+    return parse_point(*match.groups()) if match else None
+
+def coordinates_from_maps_link(url):
+    """``(lat, lng)`` from a Google Maps URL, or None when it carries no point.
+
+    Understands ``!3d..!4d..`` place pins, ``?q=lat,lng`` (and the other
+    point parameters), ``/place/lat,lng`` and ``/search/lat,lng`` paths and
+    the ``@lat,lng`` viewport, in that order of preference. Shortened
+    ``maps.app.goo.gl`` links need a network request and are not resolved.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    parts = urlsplit(url)
+
+    pins = PIN.findall(url)
+    if pins:
+        # The last pin is the selected place; earlier ones are route stops
+        point = parse_point(*pins[-1])
+        if point:
+            return point
+
+    params = parse_qs(parts.query)
+    for name in POINT_PARAMS:
+        for value in params.get(name, []):
+            point = _point(LAT_LNG.match(value))
+            if point:
+                return point
+
+    for segment in unquote_plus(parts.path).split('/'):
+        point = _point(LAT_LNG.match(segment))
+        if point:
+            return point
+
+    return _point(VIEWPORT.search(unquote_plus(parts.path)))
+
+def resolve_coordinates(google_maps_link, latitude, longitude):
+    """Coordinates for a map link: typed ``latitude``/``longitude`` if valid, else parsed from the link.
+
+    Returns ``(lat, lng)``, or ``(None, None)`` when neither gives a point.
+    """
+    point = parse_point(latitude, longitude) or coordinates_from_maps_link(google_maps_link)
+    return point or (None, None)
+
+def valid_coordinates(lat, lng):
+    return lat is not None and lng is not None and -90 <= lat <= 90 and -180 <= lng <= 180
+
+def parse_point(lat, lng):
+    """``(lat, lng)`` floats from request strings, or None when missing or out of range"""
+    try:
+        point = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    return point if valid_coordinates(*point) else None
+
+def parse_bbox(value):
+    """``(min_lat, max_lat, min_lng, max_lng)`` from a ``min_lng,min_lat,max_lng,max_lat`` string, or None"""
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (valid_coordinates(min_lat, min_lng) and valid_coordinates(max_lat, max_lng)):
+        return None
+    if min_lat > max_lat or min_lng > max_lng:
+        return None
+    return min_lat, max_lat, min_lng, max_lng
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Bulk import of properties from a CSV or JSON file (see importer.py).
+
+Usage: python import_properties.py [--upsert] [--batch-size N] [--format csv|json] file [database_path]
+"""
+
+import sys
+import sqlite3
+
+from config import Config
+from migrations import apply_migrations
+from importer import detect_format, import_file
+
+def parse_args(args):
+    """(options, positional) from the command line; exits with the usage line on error"""
+    options = {'upsert': False, 'batch_size': Config.IMPORT_BATCH_SIZE, 'format': None}
+    positional = []
+    args = list(args)
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--upsert':
+                options['upsert'] = True
+            elif arg == '--batch-size':
+                options['batch_size'] = int(args.pop(0))
+            elif arg == '--format':
+                options['format'] = args.pop(0)
+                if options['format'] not in ('csv', 'json'):
+                    raise ValueError(options['format'])
+            else:
+                positional.append(arg)
+        if not 1 <= len(positional) <= 2 or options['batch_size'] < 1:
+            raise ValueError()
+    except (IndexError, ValueError):
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(1)
+    return options, positional
+
+def main():
+    options, positional = parse_args(sys.argv[1:])
+    path = positional[0]
+    database = positional[1] if len(positional) > 1 else Config.DATABASE
+    file_format = options['format'] or detect_format(path)
+
+    conn = sqlite3.connect(database)
+    try:
+        apply_migrations(conn, verbose=False)
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            result = import_file(conn, f, file_format, options['batch_size'], options['upsert'])
+    finally:
+        conn.close()
+
+    for number, message in result['errors']:
+        print(f"⚠️  {'Line' if file_format == 'csv' else 'Record'} {number}: {message}")
+    if result['skipped'] > len(result['errors']):
+        print(f"⚠️  ... and {result['skipped'] - len(result['errors'])} more")
+    if result['error']:
+        print(f"❌ Stopped reading {path}: {result['error']}")
+    print(f"✅ Read {result['rows']} row(s) in {result['seconds']:.2f}s ({result['rows_per_second']:.0f} rows/s): "
+          f"{result['inserted']} inserted, {result['updated']} updated, {result['skipped']} skipped")
+    if result['error']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
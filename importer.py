@@ -0,0 +1,256 @@
+"""
+Bulk import of properties from CSV or JSON.
+
+Records are read one at a time from the file (``csv.DictReader``, or a JSON
+array / newline-delimited JSON decoded incrementally), validated, and
+written in batches: each batch is one ``BEGIN IMMEDIATE`` transaction with
+one ``executemany`` per statement, so thousands of rows cost a handful of
+commits instead of one each. Invalid rows are reported with their CSV line
+or JSON record number and skipped; the rest of the file still imports.
+
+Column names may be properties columns or the headers written by the CSV
+export, so an export can be edited and imported back. With ``upsert`` a row
+whose RTC matches exactly one existing property updates it; fields left
+blank keep their current value.
+"""
+import csv
+import json
+import time
+from datetime import datetime
+
+from exports import EXPORT_COLUMNS
+from geo import parse_point, resolve_coordinates
+
+# properties columns an import may set, in INSERT order
+PROPERTY_FIELDS = ['title', 'description', 'property_type', 'price', 'location', 'rtc', 'status',
+                   'owner_name', 'owner_contact', 'bedrooms', 'bathrooms', 'area']
+
+# Optional location columns, stored as a property_maps_links row
+LOCATION_FIELDS = ['google_maps_link', 'latitude', 'longitude']
+
+NUMERIC_FIELDS = {'price': float, 'bedrooms': int, 'bathrooms': int, 'area': float}
+
+# Lower-cased column name or export header -> field
+FIELD_ALIASES = {field: field for field in PROPERTY_FIELDS + LOCATION_FIELDS}
+FIELD_ALIASES.update({header.lower(): column for header, column in EXPORT_COLUMNS if column in PROPERTY_FIELDS})
+
+MAX_JSON_RECORD = 1024 * 1024  # characters one JSON record may span
+MAX_REPORTED_ERRORS = 1000
+
+INSERT_SQL = f'''INSERT INTO properties ({', '.join(PROPERTY_FIELDS)}, created_date, updated_date)
+                 VALUES ({', '.join('?' * (len(PROPERTY_FIELDS) + 2))})'''
+
+UPDATE_SQL = f'''UPDATE properties SET {', '.join(f'{field} = COALESCE(?, {field})' for field in PROPERTY_FIELDS)},
+                                       updated_date = ?
+                 WHERE id = ?'''
+
+class ImportFileError(ValueError):
+    """The file cannot be read any further (malformed JSON, bad encoding)"""
+
+class RowError(ValueError):
+    """One record failed validation"""
+
+def detect_format(filename):
+    """'json' for .json/.jsonl/.ndjson files, otherwise 'csv'"""
+    return 'json' if filename.lower().rsplit('.', 1)[-1] in ('json', 'jsonl', 'ndjson') else 'csv'
+
+def iter_csv_records(stream):
+    """Yield (line number, record) for each row of a CSV text stream with a header row"""
+    reader = csv.DictReader(stream)
+    for record in reader:
+        yield reader.line_num, record
+
+def iter_json_records(stream, chunk_size=64 * 1024):
+    """Yield (record number, record) from a JSON array or newline-delimited JSON text stream.
+
+    The stream is read in ``chunk_size`` pieces and each record is decoded
+    with ``raw_decode`` as soon as it is complete, so memory is bounded by
+    the largest record rather than the file.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = '', 0, False
+    array = None
+    number = 0
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        buffer, pos, eof = buffer[pos:] + chunk, 0, not chunk
+
+    while True:
+        # Skip whitespace (and separators inside an array) up to the next value
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or (array and buffer[pos] == ',')):
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            fill()
+        if pos >= len(buffer):
+            if array:
+                raise ImportFileError('JSON array is not closed')
+            return
+        if array is None:
+            array = buffer[pos] == '['
+            if array:
+                pos += 1
+                continue
+        elif array and buffer[pos] == ']':
+            return
+
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if eof or len(buffer) - pos > MAX_JSON_RECORD:
+                raise ImportFileError(f"Invalid JSON in record {number + 1}: {e.msg}")
+            fill()
+            continue
+        number += 1
+        pos = end
+        yield number, record
+
+def iter_records(stream, file_format):
+    return iter_json_records(stream) if file_format == 'json' else iter_csv_records(stream)
+
+def clean_row(record):
+    """Validate one record and return a dict with every PROPERTY_FIELDS and LOCATION_FIELDS key"""
+    if not isinstance(record, dict):
+        raise RowError('Expected an object of property fields')
+
+    row = dict.fromkeys(PROPERTY_FIELDS + LOCATION_FIELDS)
+    for key, value in record.items():
+        field = FIELD_ALIASES.get(str(key).strip().lower())
+        if field is None:
+            continue  # Unknown columns (e.g. "Date Added") are ignored
+        if isinstance(value, str):
+            value = value.strip()
+        row[field] = None if value == '' else value
+
+    if not row['title']:
+        raise RowError('Title is required')
+    for field, convert in NUMERIC_FIELDS.items():
+        if row[field] is not None:
+            try:
+                row[field] = convert(row[field])
+            except (TypeError, ValueError):
+                raise RowError(f"{field} must be a number, not {row[field]!r}")
+            if row[field] < 0:
+                raise RowError(f"{field} cannot be negative")
+    for field in PROPERTY_FIELDS:
+        if row[field] is not None and not isinstance(row[field], (str, int, float)):
+            raise RowError(f"{field} must be text or a number")
+    for field in ('title', 'rtc', 'status', 'google_maps_link'):
+        if row[field] is not None:
+            row[field] = str(row[field])
+
+    if row['latitude'] is not None or row['longitude'] is not None:
+        if parse_point(row['latitude'], row['longitude']) is None:
+            raise RowError('latitude and longitude must both be given and within range')
+    if row['google_maps_link'] or row['latitude'] is not None:
+        row['latitude'], row['longitude'] = resolve_coordinates(row['google_maps_link'], row['latitude'], row['longitude'])
+    return row
+
+def existing_rtcs(conn, rtcs, chunk_size=500):
+    """Map each RTC in ``rtcs`` to the ids of the properties that carry it"""
+    matches = {}
+    rtcs = list(rtcs)
+    for start in range(0, len(rtcs), chunk_size):
+        chunk = rtcs[start:start + chunk_size]
+        for property_id, rtc in conn.execute(f"SELECT id, rtc FROM properties WHERE rtc IN ({', '.join('?' * len(chunk))})",
+                                             chunk):
+            matches.setdefault(rtc, []).append(property_id)
+    return matches
+
+def write_batch(conn, batch, upsert=False):
+    """Write validated ``(number, row)`` pairs in one transaction; returns (inserted, updated, errors)"""
+    now = datetime.now().isoformat()
+    errors = []
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        matches = existing_rtcs(conn, {row['rtc'] for _, row in batch if row['rtc']}) if upsert else {}
+        inserts, updates, located = [], [], []
+        for number, row in batch:
+            property_ids = matches.get(row['rtc'], [])
+            values = [row[field] for field in PROPERTY_FIELDS]
+            if len(property_ids) > 1:
+                errors.append((number, f"RTC {row['rtc']} matches {len(property_ids)} properties"))
+            elif property_ids:
+                updates.append((*values, now, property_ids[0]))
+            else:
+                # Same defaults as the add_property form
+                values[PROPERTY_FIELDS.index('price')] = row['price'] or 0.0
+                values[PROPERTY_FIELDS.index('status')] = row['status'] or 'Available'
+                if row['google_maps_link'] or row['latitude'] is not None:
+                    located.append((values, row))
+                else:
+                    inserts.append((*values, now, now))
+
+        conn.executemany(UPDATE_SQL, updates)
+        conn.executemany(INSERT_SQL, inserts)
+        # Rows with a location need their new id for the map link
+        links = []
+        for values, row in located:
+            property_id = conn.execute(INSERT_SQL, (*values, now, now)).lastrowid
+            links.append((property_id, 'Property Location', row['google_maps_link'] or '',
+                          row['latitude'], row['longitude'], now))
+        conn.executemany('''INSERT INTO property_maps_links
+                            (property_id, link_title, google_maps_link, latitude, longitude, created_date)
+                            VALUES (?, ?, ?, ?, ?, ?)''', links)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return len(inserts) + len(located), len(updates), errors
+
+def import_records(conn, records, batch_size=500, upsert=False):
+    """Validate and write ``(number, record)`` pairs in batches of ``batch_size``.
+
+    Returns a dict with ``rows`` read, ``inserted``, ``updated``, ``skipped``,
+    the first MAX_REPORTED_ERRORS ``errors`` as (number, message), ``seconds``
+    and ``rows_per_second``. A file that stops being readable part way keeps
+    the batches written so far and reports the reason as ``error``.
+    """
+    result = {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'errors': [], 'error': None}
+    start = time.perf_counter()
+    batch = []
+    batch_rtcs = set()
+
+    def report(errors):
+        result['skipped'] += len(errors)
+        result['errors'].extend(errors[:MAX_REPORTED_ERRORS - len(result['errors'])])
+
+    def flush():
+        if batch:
+            inserted, updated, errors = write_batch(conn, batch, upsert)
+            result['inserted'] += inserted
+            result['updated'] += updated
+            report(errors)
+            batch.clear()
+            batch_rtcs.clear()
+
+    try:
+        for number, record in records:
+            result['rows'] += 1
+            try:
+                row = clean_row(record)
+            except RowError as e:
+                report([(number, str(e))])
+                continue
+            if upsert and row['rtc']:
+                # A repeated RTC must see the earlier row as an existing property
+                if row['rtc'] in batch_rtcs:
+                    flush()
+                batch_rtcs.add(row['rtc'])
+            batch.append((number, row))
+            if len(batch) >= batch_size:
+                flush()
+    except (ImportFileError, csv.Error, UnicodeDecodeError) as e:
+        result['error'] = str(e)
+    flush()
+
+    result['seconds'] = time.perf_counter() - start
+    result['rows_per_second'] = result['rows'] / result['seconds'] if result['seconds'] else 0.0
+    return result
+
+def import_file(conn, stream, file_format='csv', batch_size=500, upsert=False):
+    """Import a CSV or JSON text stream; see import_records for the result"""
+    return import_records(conn, iter_records(stream, file_format), batch_size, upsert)
@@ -0,0 +1,392 @@
+"""
+Per-request performance instrumentation.
+
+Connections from database.connect are InstrumentedConnections: every
+statement they execute is counted and timed, from execute until its rows
+are exhausted or its cursor is closed, whether they are fetched or iterated.
+Inside a request the totals go to ``g``; any statement slower than
+SLOW_QUERY_MS is printed with its EXPLAIN QUERY PLAN once it is done, in
+requests and job workers alike.
+
+``init_app`` adds template render time from Flask's render signals, a
+``Server-Timing`` header (app, sql and tpl durations, visible in the
+browser's network panel) and a WSGI middleware that counts the bytes each
+response sends. Everything is aggregated per endpoint and served at
+``/metrics`` in Prometheus text format, along with the hit and miss counts
+of the app's caches. The counters belong to one process: with several
+gunicorn workers each scrape sees the worker that answered it.
+"""
+import time
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+
+from flask import g, has_app_context, has_request_context, request, Response, abort, template_rendered, before_render_template
+from flask_login import current_user
+
+# Statements whose plan is worth printing when they are slow
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+# Prometheus' default latency buckets, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+ENVIRON_KEY = 'property_management.instrumentation'
+
+class RequestStats:
+    """SQL and template totals of the current request, kept on ``g.perf``"""
+    __slots__ = ('sql_count', 'sql_seconds', 'slow_count', 'template_seconds', 'template_starts')
+
+    def __init__(self):
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.slow_count = 0
+        self.template_seconds = 0.0
+        self.template_starts = []
+
+def request_stats():
+    """This request's RequestStats, or None outside an app context (e.g. job workers)"""
+    if not has_app_context():
+        return None
+    stats = g.get('perf')
+    if stats is None:
+        stats = g.perf = RequestStats()
+    return stats
+
+def format_plan(rows):
+    """EXPLAIN QUERY PLAN rows (id, parent, notused, detail) as an indented tree"""
+    depth = {0: 0}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, 0) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's time to its connection.
+
+    A statement that returns rows stays open until they are exhausted or the
+    cursor is closed (or collected); reading them, by fetch or iteration, is
+    charged to it, and only then is it checked against the slow-query limit.
+    """
+    _statement = None  # [sql, parameters, seconds, explain] while rows may still be read
+
+    def _begin(self, sql, parameters, seconds, explain=True):
+        self.connection.record(seconds)
+        self._statement = [sql, parameters, seconds, explain]
+        if self.description is None:
+            self._finish()
+
+    def _read(self, seconds, exhausted):
+        self.connection.record_fetch(seconds)
+        if self._statement is not None:
+            self._statement[2] += seconds
+        if exhausted:
+            self._finish()
+
+    def _finish(self):
+        statement, self._statement = self._statement, None
+        if statement is not None:
+            self.connection.record_done(*statement)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._begin(sql, parameters, time.perf_counter() - start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            sample = seq_of_parameters[0] if isinstance(seq_of_parameters, (list, tuple)) and seq_of_parameters else None
+            self._begin(sql, sample, time.perf_counter() - start)
+
+    def executescript(self, sql_script):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._begin(sql_script, None, time.perf_counter() - start, explain=False)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = None
+        try:
+            row = super().fetchone()
+            return row
+        finally:
+            self._read(time.perf_counter() - start, row is None)
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = []
+        try:
+            rows = super().fetchmany(size)
+            return rows
+        finally:
+            self._read(time.perf_counter() - start, len(rows) < size)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._read(time.perf_counter() - start, True)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        exhausted = True
+        try:
+            row = super().__next__()
+            exhausted = False
+            return row
+        finally:
+            self._read(time.perf_counter() - start, exhausted)
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that counts and times statements and logs slow ones.
+
+    Pass as ``factory`` to sqlite3.connect and set ``slow_query_seconds``
+    (None turns the slow-query log off).
+    """
+    slow_query_seconds = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def record(self, seconds):
+        """Count a statement and the time its execute took"""
+        stats = request_stats()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += seconds
+
+    def record_fetch(self, seconds):
+        stats = request_stats()
+        if stats is not None:
+            stats.sql_seconds += seconds
+
+    def record_done(self, sql, parameters, seconds, explain=True):
+        """Check a finished statement's total time against the slow-query limit"""
+        if self.slow_query_seconds is not None and seconds >= self.slow_query_seconds:
+            stats = request_stats()
+            if stats is not None:
+                stats.slow_count += 1
+            self.log_slow(sql, parameters, seconds, explain)
+
+    def log_slow(self, sql, parameters, seconds, explain=True):
+        """Print a slow statement with its query plan"""
+        where = f" in {request.endpoint}" if has_request_context() else ''
+        statement = ' '.join(sql.split())
+        print(f"⚠️  Slow SQL ({seconds * 1000:.1f} ms){where}: {statement[:500]}")
+        if not explain or not statement.upper().startswith(EXPLAINABLE):
+            return
+        try:
+            # Base-class execute, so the EXPLAIN itself is neither timed nor logged
+            rows = sqlite3.Connection.execute(self, f'EXPLAIN QUERY PLAN {sql}', parameters or ()).fetchall()
+        except (sqlite3.Error, ValueError) as e:
+            print(f"   (no query plan: {e})")
+            return
+        if rows:
+            print('\n'.join(f"   {line}" for line in format_plan(rows).splitlines()))
+
+def prometheus_labels(**labels):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+class Metrics:
+    """Request, SQL, template and byte totals per endpoint, rendered for Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()  # (endpoint, method, status) -> requests
+        self.duration_buckets = defaultdict(lambda: [0] * len(DURATION_BUCKETS))
+        self.duration_sum = Counter()
+        self.duration_count = Counter()
+        self.response_bytes = Counter()
+        self.sql_statements = Counter()
+        self.sql_seconds = Counter()
+        self.slow_statements = Counter()
+        self.template_seconds = Counter()
+
+    def observe(self, endpoint, method, status, seconds, bytes_sent, stats=None):
+        with self._lock:
+            self.requests[(endpoint, method, status)] += 1
+            buckets = self.duration_buckets[endpoint]
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self.duration_sum[endpoint] += seconds
+            self.duration_count[endpoint] += 1
+            self.response_bytes[endpoint] += bytes_sent
+            if stats is not None:
+                self.sql_statements[endpoint] += stats.sql_count
+                self.sql_seconds[endpoint] += stats.sql_seconds
+                self.slow_statements[endpoint] += stats.slow_count
+                self.template_seconds[endpoint] += stats.template_seconds
+
+    def render(self, caches=None):
+        """The metrics in Prometheus text exposition format, plus the stats() of each cache in ``caches``"""
+        lines = []
+
+        def family(name, kind, description, values):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for endpoint, value in sorted(values.items()):
+                lines.append(f"{name}{prometheus_labels(endpoint=endpoint)} {value}")
+
+        with self._lock:
+            lines.append('# HELP http_requests_total Requests answered, by endpoint, method and status')
+            lines.append('# TYPE http_requests_total counter')
+            for (endpoint, method, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{prometheus_labels(endpoint=endpoint, method=method, status=status)} {count}")
+
+            lines.append('# HELP http_request_duration_seconds Wall time from receiving a request to sending its last byte')
+            lines.append('# TYPE http_request_duration_seconds histogram')
+            for endpoint, buckets in sorted(self.duration_buckets.items()):
+                for bound, count in zip(DURATION_BUCKETS, buckets):
+                    lines.append(f"http_request_duration_seconds_bucket{prometheus_labels(endpoint=endpoint, le=bound)} {count}")
+                total = self.duration_count[endpoint]
+                lines.append(f"http_request_duration_seconds_bucket{prometheus_labels(endpoint=endpoint, le='+Inf')} {total}")
+                lines.append(f"http_request_duration_seconds_sum{prometheus_labels(endpoint=endpoint)} {self.duration_sum[endpoint]}")
+                lines.append(f"http_request_duration_seconds_count{prometheus_labels(endpoint=endpoint)} {total}")
+
+            family('http_response_bytes_total', 'counter', 'Response body bytes sent', self.response_bytes)
+            family('sql_statements_total', 'counter', 'SQL statements executed', self.sql_statements)
+            family('sql_duration_seconds_total', 'counter', 'Time spent executing SQL and fetching rows', self.sql_seconds)
+            family('sql_slow_statements_total', 'counter', 'SQL statements slower than SLOW_QUERY_MS', self.slow_statements)
+            family('template_render_seconds_total', 'counter', 'Time spent rendering Jinja templates', self.template_seconds)
+
+        stats = {name: cache.stats() for name, cache in sorted((caches or {}).items())}
+        for name, key, kind, description in (('cache_hits_total', 'hits', 'counter', 'Cache lookups answered from the cache'),
+                                             ('cache_misses_total', 'misses', 'counter', 'Cache lookups that had to load the value'),
+                                             ('cache_entries', 'size', 'gauge', 'Entries currently held by the cache'),
+                                             ('cache_max_entries', 'maxsize', 'gauge', 'Configured cache size')):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache_name, values in stats.items():
+                lines.append(f"{name}{prometheus_labels(cache=cache_name)} {values[key]}")
+        return '\n'.join(lines) + '\n'
+
+class _CountedBody:
+    """Response iterable that counts the bytes passed through and reports them on close"""
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+        self.sent = 0
+
+    def __iter__(self):
+        for chunk in self.body:
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close(self.sent)
+
+class InstrumentationMiddleware:
+    """WSGI middleware timing each request to its last byte and recording it in ``metrics``"""
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        start = time.perf_counter()
+        environ[ENVIRON_KEY] = {'start': start}
+        response = {}
+
+        def recording_start_response(status, headers, exc_info=None):
+            response['status'] = status.split(' ', 1)[0]
+            response['length'] = next((value for name, value in headers if name.lower() == 'content-length'), None)
+            return start_response(status, headers, exc_info)
+
+        def finish(sent):
+            timing = environ[ENVIRON_KEY]
+            self.metrics.observe(timing.get('endpoint', 'unmatched'), environ.get('REQUEST_METHOD', ''),
+                                 response.get('status', ''), time.perf_counter() - start, sent, timing.get('stats'))
+
+        body = self.wsgi_app(environ, recording_start_response)
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and isinstance(body, file_wrapper):
+            # Leave file responses to the server's sendfile path; their size is the Content-Length
+            finish(int(response.get('length') or 0))
+            return body
+        return _CountedBody(body, finish)
+
+def init_app(app):
+    """Time SQL, templates and responses for ``app``, add Server-Timing and serve /metrics"""
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+
+    def template_started(sender, template, context, **extra):
+        request_stats().template_starts.append(time.perf_counter())
+
+    def template_finished(sender, template, context, **extra):
+        stats = request_stats()
+        if stats.template_starts:
+            stats.template_seconds += time.perf_counter() - stats.template_starts.pop()
+
+    before_render_template.connect(template_started, app, weak=False)
+    template_rendered.connect(template_finished, app, weak=False)
+
+    @app.after_request
+    def add_server_timing(response):
+        timing = request.environ.get(ENVIRON_KEY)
+        if timing is None:
+            return response
+        # The stats object itself is kept, so SQL run while a response
+        # streams still reaches /metrics (though not this header)
+        stats = request_stats()
+        timing.update(endpoint=request.endpoint or 'unmatched', stats=stats)
+        if app.config['SERVER_TIMING']:
+            total = time.perf_counter() - timing['start']
+            response.headers['Server-Timing'] = (f'app;dur={total * 1000:.1f}, '
+                                                 f'sql;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_count} statement(s)", '
+                                                 f'tpl;dur={stats.template_seconds * 1000:.1f}')
+        return response
+
+    def metrics_view():
+        token = app.config['METRICS_TOKEN']
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                abort(401)
+        elif not current_user.is_authenticated:
+            abort(401)
+        # user_cache, page_cache, ... as users, page, ...
+        caches = {name[:-len('_cache')]: extension for name, extension in app.extensions.items()
+                  if name.endswith('_cache') and extension is not None}
+        return Response(metrics.render(caches), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+    app.wsgi_app = InstrumentationMiddleware(app.wsgi_app, metrics)
+    return metrics
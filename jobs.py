@@ -0,0 +1,203 @@
+"""
+SQLite-backed background jobs.
+
+Slow follow-up work (thumbnails, removing unreferenced files, CSV exports,
+index rebuilds) is recorded as a row in the ``jobs`` table and run by a
+JobWorker instead of inside the request. ``enqueue`` writes in the caller's
+transaction, so a job is published together with the change that needs it
+and disappears with it on rollback.
+
+Workers claim jobs with a single UPDATE ... RETURNING, so any number of them
+(threads inside each gunicorn worker, or ``python worker.py`` processes) can
+share one queue. A failing job is retried with exponential backoff until
+``max_attempts`` is reached; a job whose worker died is requeued once its
+lock is older than the lock timeout.
+
+Handlers are registered per kind with ``@handler('kind')`` and called as
+``handler(app, conn, payload)``; whatever they return is stored as the
+job's JSON result.
+"""
+import os
+import json
+import time
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from database import connect_from_config
+
+HANDLERS = {}
+
+# Set whenever a job is enqueued so an idle worker thread in this process
+# looks again without waiting for its next poll
+WAKE = threading.Event()
+
+def handler(kind):
+    """Register the decorated function as the handler for jobs of ``kind``"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+def enqueue(conn, kind, payload=None, max_attempts=3, delay=0):
+    """Add a job in the caller's transaction (it runs once committed); returns its id"""
+    now = datetime.now()
+    cursor = conn.execute('''INSERT INTO jobs (kind, payload, status, attempts, max_attempts, run_after, created_date, updated_date)
+                             VALUES (?, ?, 'queued', 0, ?, ?, ?, ?)''',
+                          (kind, json.dumps(payload or {}), max_attempts,
+                           (now + timedelta(seconds=delay)).isoformat(), now.isoformat(), now.isoformat()))
+    WAKE.set()
+    return cursor.lastrowid
+
+def claim(conn, worker_id):
+    """Atomically take the next due job for ``worker_id``; returns the row or None"""
+    now = datetime.now().isoformat()
+    rows = conn.execute('''UPDATE jobs SET status = 'running', attempts = attempts + 1,
+                                          locked_by = ?, locked_at = ?, updated_date = ?
+                           WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ?
+                                       ORDER BY run_after, id LIMIT 1)
+                           RETURNING *''', (worker_id, now, now, now)).fetchall()
+    conn.commit()
+    return rows[0] if rows else None
+
+def finish(conn, job, result=None, error=None, retry_delay=30):
+    """Record a job's outcome: done, queued again with backoff, or failed"""
+    now = datetime.now()
+    if error is None:
+        conn.execute('''UPDATE jobs SET status = 'done', result = ?, last_error = NULL, locked_by = NULL,
+                                        updated_date = ?, finished_date = ? WHERE id = ?''',
+                     (json.dumps(result), now.isoformat(), now.isoformat(), job['id']))
+    elif job['attempts'] < job['max_attempts']:
+        run_after = now + timedelta(seconds=retry_delay * 2 ** (job['attempts'] - 1))
+        conn.execute('''UPDATE jobs SET status = 'queued', last_error = ?, locked_by = NULL, run_after = ?,
+                                        updated_date = ? WHERE id = ?''',
+                     (error, run_after.isoformat(), now.isoformat(), job['id']))
+    else:
+        conn.execute('''UPDATE jobs SET status = 'failed', last_error = ?, locked_by = NULL,
+                                        updated_date = ?, finished_date = ? WHERE id = ?''',
+                     (error, now.isoformat(), now.isoformat(), job['id']))
+    conn.commit()
+
+def requeue_stale(conn, lock_timeout):
+    """Release jobs locked longer than ``lock_timeout`` seconds by a worker that went away"""
+    now = datetime.now().isoformat()
+    cutoff = (datetime.now() - timedelta(seconds=lock_timeout)).isoformat()
+    conn.execute('''UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+                                    last_error = 'Worker stopped before finishing', locked_by = NULL,
+                                    updated_date = ?
+                    WHERE status = 'running' AND locked_at < ?''', (now, cutoff))
+    conn.commit()
+
+def prune(conn, retention_days):
+    """Delete finished jobs older than ``retention_days``"""
+    cutoff = (datetime.now() - timedelta(days=retention_days)).isoformat()
+    conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_date < ?", (cutoff,))
+    conn.commit()
+
+def retry(conn, job_id):
+    """Queue a failed job again with a fresh set of attempts; returns True if it was failed"""
+    now = datetime.now().isoformat()
+    updated = conn.execute('''UPDATE jobs SET status = 'queued', attempts = 0, run_after = ?, updated_date = ?,
+                                              finished_date = NULL
+                              WHERE id = ? AND status = 'failed' ''', (now, now, job_id)).rowcount
+    conn.commit()
+    return bool(updated)
+
+def job_counts(conn):
+    """Number of jobs per status"""
+    return {status: count for status, count in conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status')}
+
+def recent_jobs(conn, limit=50):
+    return conn.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+
+class JobWorker:
+    """Claim and run jobs with the handlers in HANDLERS"""
+
+    def __init__(self, app, connect, poll_interval=1.0, lock_timeout=600, retry_delay=30, retention_days=7):
+        self.app = app
+        self.connect = connect
+        self.poll_interval = poll_interval
+        self.lock_timeout = lock_timeout
+        self.retry_delay = retry_delay
+        self.retention_days = retention_days
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def worker_id(self):
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def run_job(self, conn, job):
+        try:
+            job_handler = HANDLERS[job['kind']]
+        except KeyError:
+            # Nothing to retry with: fail straight away
+            finish(conn, dict(job, attempts=job['max_attempts']), error=f"No handler for job kind {job['kind']!r}")
+            return
+        try:
+            result = job_handler(self.app, conn, json.loads(job['payload'] or '{}'))
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            print(f"⚠️  Job {job['id']} ({job['kind']}) failed on attempt {job['attempts']}: {e}")
+            finish(conn, job, error=f"{type(e).__name__}: {e}", retry_delay=self.retry_delay)
+        else:
+            finish(conn, job, result=result)
+
+    def run_pending(self, conn=None, limit=None):
+        """Run due jobs until none are left (or ``limit`` ran); returns how many ran"""
+        own_conn = conn is None
+        conn = conn or self.connect()
+        ran = 0
+        try:
+            while limit is None or ran < limit:
+                job = claim(conn, self.worker_id)
+                if job is None:
+                    break
+                self.run_job(conn, job)
+                ran += 1
+        finally:
+            if own_conn:
+                conn.close()
+        return ran
+
+    def run_forever(self, stop=None):
+        """Poll for jobs until ``stop`` (a threading.Event) is set"""
+        stop = stop or threading.Event()
+        conn = self.connect()
+        last_housekeeping = 0
+        while not stop.is_set():
+            try:
+                if time.monotonic() - last_housekeeping > 60:
+                    requeue_stale(conn, self.lock_timeout)
+                    prune(conn, self.retention_days)
+                    last_housekeeping = time.monotonic()
+                if not self.run_pending(conn):
+                    WAKE.wait(self.poll_interval)
+                    WAKE.clear()
+            except Exception as e:
+                # Keep the worker alive through transient errors such as a locked database
+                print(f"⚠️  Job worker error: {e}")
+                if conn.in_transaction:
+                    conn.rollback()
+                stop.wait(self.poll_interval)
+
+    def ensure_thread(self):
+        """Start a daemon worker thread in this process if it has none yet"""
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self.run_forever, daemon=True, name='job-worker').start()
+
+def init_app(app):
+    """Attach a JobWorker to ``app``; with JOB_WORKER=thread each process runs one in the background"""
+    worker = JobWorker(app, lambda: connect_from_config(app.config),
+                       poll_interval=app.config['JOB_POLL_INTERVAL'],
+                       lock_timeout=app.config['JOB_LOCK_TIMEOUT'],
+                       retry_delay=app.config['JOB_RETRY_DELAY'],
+                       retention_days=app.config['JOB_RETENTION_DAYS'])
+    app.extensions['jobs'] = worker
+    if app.config['JOB_WORKER'] == 'thread':
+        # Started lazily so every gunicorn worker gets its own thread after forking
+        app.before_request(worker.ensure_thread)
+    return worker
@@ -0,0 +1,40 @@
+"""
+Database maintenance run as background jobs.
+
+Each task is registered as a job kind (see jobs.py) and can be queued from
+the jobs page, so rebuilding an index never blocks a request. Rebuilds run
+in one write transaction; readers keep seeing the old data until it commits.
+"""
+import jobs
+from migrations import rebuild_dashboard_stats
+
+# Job kinds that may be queued by hand from the jobs page
+MAINTENANCE_JOBS = {
+    'rebuild_search_index': 'Rebuild the full-text search index',
+    'rebuild_dashboard_stats': 'Recompute dashboard and filter counts',
+    'optimize_database': 'Refresh query planner statistics',
+}
+
+@jobs.handler('rebuild_search_index')
+def rebuild_search_index(app, conn, payload):
+    conn.execute('BEGIN IMMEDIATE')
+    conn.execute("INSERT INTO properties_fts (properties_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO properties_fts (properties_fts) VALUES ('optimize')")
+    conn.commit()
+    return {'documents': conn.execute('SELECT COUNT(*) FROM properties').fetchone()[0]}
+
+@jobs.handler('rebuild_dashboard_stats')
+def rebuild_stats(app, conn, payload):
+    conn.execute('BEGIN IMMEDIATE')
+    rebuild_dashboard_stats(conn)
+    # Filter options are cached per data generation
+    conn.execute("UPDATE data_generations SET generation = generation + 1 WHERE name = 'properties'")
+    conn.commit()
+    return {'rows': conn.execute('SELECT COUNT(*) FROM property_stats').fetchone()[0]}
+
+@jobs.handler('optimize_database')
+def optimize_database(app, conn, payload):
+    conn.execute('ANALYZE')
+    conn.execute('PRAGMA optimize')
+    conn.commit()
+    return None
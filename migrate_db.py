@@ -1 +1,46 @@
- 
\ No newline at end of file
+#!/usr/bin/env python3
+"""
+Database migration command for Property Management System
+Applies pending schema migrations and shows what has been recorded.
+
+Usage: python migrate_db.py [--status] [database_path]
+"""
+
+import sys
+import sqlite3
+
+from config import Config
+from migrations import MIGRATIONS, applied_migrations, apply_migrations
+
+DEFAULT_DATABASE = Config.DATABASE
+
+def print_status(conn):
+    """Print applied and pending migrations"""
+    applied = {row[0]: row for row in applied_migrations(conn)}
+    for version, description, _ in MIGRATIONS:
+        if version in applied:
+            print(f"✅ {version:>3}  {description}  (applied {applied[version][2]})")
+        else:
+            print(f"⏳ {version:>3}  {description}  (pending)")
+
+def main():
+    args = sys.argv[1:]
+    show_status_only = '--status' in args
+    paths = [arg for arg in args if arg != '--status']
+    database = paths[0] if paths else DEFAULT_DATABASE
+
+    conn = sqlite3.connect(database)
+    try:
+        if not show_status_only:
+            applied = apply_migrations(conn)
+            if applied:
+                print(f"✅ Applied {len(applied)} migration(s) to {database}")
+            else:
+                print(f"✅ {database} is already up to date")
+            print()
+        print_status(conn)
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+"""
+Versioned schema migrations for the property management database.
+
+Each migration runs exactly once per database and is recorded in the
+``schema_version`` table together with the date it was applied. Steps are
+written to be safe on databases created before this table existed, so an
+old property_management.db is brought up to date on first start.
+"""
+import sqlite3
+from datetime import datetime
+
+def _column_names(conn, table):
+    return [column[1] for column in conn.execute(f"PRAGMA table_info({table})")]
+
+def _add_column_if_missing(conn, table, column, definition):
+    if column not in _column_names(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def create_base_tables(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     username TEXT UNIQUE NOT NULL,
+                     password_hash TEXT NOT NULL,
+                     created_date TEXT)''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS properties
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     title TEXT NOT NULL,
+                     description TEXT,
+                     property_type TEXT,
+                     price REAL,
+                     location TEXT,
+                     rtc TEXT,
+                     status TEXT DEFAULT 'Available',
+                     owner_name TEXT,
+                     owner_contact TEXT,
+                     created_date TEXT,
+                     updated_date TEXT)''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS property_documents
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     property_id INTEGER,
+                     filename TEXT,
+                     original_filename TEXT,
+                     document_type TEXT DEFAULT 'General',
+                     upload_date TEXT,
+                     FOREIGN KEY (property_id) REFERENCES properties (id))''')
+
+    conn.execute('''CREATE TABLE IF NOT EXISTS property_maps_links
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     property_id INTEGER,
+                     link_title TEXT NOT NULL,
+                     google_maps_link TEXT NOT NULL,
+                     latitude REAL,
+                     longitude REAL,
+                     created_date TEXT,
+                     FOREIGN KEY (property_id) REFERENCES properties (id))''')
+
+def add_document_type_column(conn):
+    _add_column_if_missing(conn, 'property_documents', 'document_type', "TEXT DEFAULT 'General'")
+
+def add_rtc_column(conn):
+    _add_column_if_missing(conn, 'properties', 'rtc', 'TEXT')
+
+def add_production_property_columns(conn):
+    # Columns still written by app_production's add/edit forms
+    _add_column_if_missing(conn, 'properties', 'bedrooms', 'INTEGER')
+    _add_column_if_missing(conn, 'properties', 'bathrooms', 'INTEGER')
+    _add_column_if_missing(conn, 'properties', 'area', 'REAL')
+
+def create_lookup_indexes(conn):
+    # Latest-photo lookup and document/link lists on the detail page
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_documents_property_type_date
+                    ON property_documents (property_id, document_type, upload_date)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_maps_links_property_date
+                    ON property_maps_links (property_id, created_date)''')
+
+    # One index per listing sort key; expressions match queries.SORT_FIELDS
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_created_date ON properties (IFNULL(created_date, ''))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_updated_date ON properties (IFNULL(updated_date, ''))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_title ON properties (title)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_price ON properties (IFNULL(price, 0))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_status_sort ON properties (IFNULL(status, ''))")
+
+    # Equality filters from the search form, ordered by the default sort
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_status ON properties (status, IFNULL(created_date, ''))")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_property_type ON properties (property_type, IFNULL(created_date, ''))")
+
+    conn.execute("ANALYZE")
+
+# Columns indexed for full-text search, in properties_fts column order
+FTS_COLUMNS = ['title', 'description', 'rtc', 'location', 'owner_name']
+
+def create_properties_fts(conn):
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{column}' for column in FTS_COLUMNS)
+
+    # External-content table: the text lives in properties, FTS5 keeps only the index
+    conn.execute(f'''CREATE VIRTUAL TABLE IF NOT EXISTS properties_fts
+                     USING fts5({columns}, content='properties', content_rowid='id',
+                                tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS properties_fts_insert AFTER INSERT ON properties BEGIN
+                         INSERT INTO properties_fts (rowid, {columns}) VALUES (new.id, {new_values});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS properties_fts_delete AFTER DELETE ON properties BEGIN
+                         INSERT INTO properties_fts (properties_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS properties_fts_update AFTER UPDATE OF {columns} ON properties BEGIN
+                         INSERT INTO properties_fts (properties_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                         INSERT INTO properties_fts (rowid, {columns}) VALUES (new.id, {new_values});
+                     END''')
+
+    # Index rows that existed before the table was created
+    conn.execute("INSERT INTO properties_fts (properties_fts) VALUES ('rebuild')")
+
+# Dimensions counted in property_stats: (dimension, SQL expression over a
+# properties row alias, condition for the row to be counted)
+STATS_DIMENSIONS = [
+    ('status', '{row}.status', '{row}.status IS NOT NULL'),
+    ('property_type', '{row}.property_type', "{row}.property_type IS NOT NULL AND {row}.property_type != ''"),
+    ('location', '{row}.location', "{row}.location IS NOT NULL AND {row}.location != ''"),
+    ('month', "strftime('%Y-%m', {row}.created_date)", "strftime('%Y-%m', {row}.created_date) IS NOT NULL"),
+]
+
+def _stats_increment_sql(row):
+    statements = []
+    for dimension, value, condition in STATS_DIMENSIONS:
+        statements.append(f'''INSERT INTO property_stats (dimension, value, count)
+                              SELECT '{dimension}', {value.format(row=row)}, 1 WHERE {condition.format(row=row)}
+                              ON CONFLICT (dimension, value) DO UPDATE SET count = count + 1;''')
+    statements.append(f'''UPDATE property_totals
+                          SET property_count = property_count + 1,
+                              price_sum = price_sum + IFNULL({row}.price, 0),
+                              price_count = price_count + ({row}.price IS NOT NULL),
+                              priced_count = priced_count + IFNULL({row}.price > 0, 0)
+                          WHERE id = 1;''')
+    return '\n'.join(statements)
+
+def _stats_decrement_sql(row):
+    statements = []
+    for dimension, value, condition in STATS_DIMENSIONS:
+        statements.append(f'''UPDATE property_stats SET count = count - 1
+                              WHERE dimension = '{dimension}' AND value = {value.format(row=row)}
+                                AND {condition.format(row=row)};''')
+    statements.append("DELETE FROM property_stats WHERE count <= 0;")
+    statements.append(f'''UPDATE property_totals
+                          SET property_count = property_count - 1,
+                              price_sum = price_sum - IFNULL({row}.price, 0),
+                              price_count = price_count - ({row}.price IS NOT NULL),
+                              priced_count = priced_count - IFNULL({row}.price > 0, 0)
+                          WHERE id = 1;''')
+    return '\n'.join(statements)
+
+def create_dashboard_stats(conn):
+    # Per-dimension counters read by the dashboard instead of GROUP BY scans
+    conn.execute('''CREATE TABLE IF NOT EXISTS property_stats
+                    (dimension TEXT NOT NULL,
+                     value TEXT NOT NULL,
+                     count INTEGER NOT NULL,
+                     PRIMARY KEY (dimension, value))''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_property_stats_count ON property_stats (dimension, count)")
+
+    # Single-row running totals; AVG(price) is price_sum / price_count
+    conn.execute('''CREATE TABLE IF NOT EXISTS property_totals
+                    (id INTEGER PRIMARY KEY CHECK (id = 1),
+                     property_count INTEGER NOT NULL,
+                     price_sum REAL NOT NULL,
+                     price_count INTEGER NOT NULL,
+                     priced_count INTEGER NOT NULL)''')
+
+    # MIN/MAX(price) are answered from this index in O(log n)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_properties_price_value ON properties (price)")
+
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS property_stats_insert AFTER INSERT ON properties BEGIN
+                         {_stats_increment_sql('new')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS property_stats_delete AFTER DELETE ON properties BEGIN
+                         {_stats_decrement_sql('old')}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS property_stats_update
+                     AFTER UPDATE OF status, property_type, location, created_date, price ON properties BEGIN
+                         {_stats_decrement_sql('old')}
+                         {_stats_increment_sql('new')}
+                     END''')
+
+    # Backfill from the rows that already exist
+    rebuild_dashboard_stats(conn)
+
+def rebuild_dashboard_stats(conn):
+    """Recompute property_stats and property_totals from the properties table"""
+    conn.execute("DELETE FROM property_stats")
+    for dimension, value, condition in STATS_DIMENSIONS:
+        conn.execute(f'''INSERT INTO property_stats (dimension, value, count)
+                         SELECT '{dimension}', {value.format(row='p')}, COUNT(*) FROM properties p
+                         WHERE {condition.format(row='p')}
+                         GROUP BY {value.format(row='p')}''')
+    conn.execute('''INSERT OR REPLACE INTO property_totals (id, property_count, price_sum, price_count, priced_count)
+                    SELECT 1, COUNT(*), IFNULL(SUM(price), 0), COUNT(price), COUNT(CASE WHEN price > 0 THEN 1 END)
+                    FROM properties''')
+
+def create_data_generations(conn):
+    # Monotonic counters bumped on every write; caches key their entries on
+    # the current value, so a write anywhere invalidates them in every worker
+    conn.execute('''CREATE TABLE IF NOT EXISTS data_generations
+                    (name TEXT PRIMARY KEY,
+                     generation INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute("INSERT OR IGNORE INTO data_generations (name, generation) VALUES ('properties', 0)")
+
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS properties_generation_{event.lower()}
+                         AFTER {event} ON properties BEGIN
+                             UPDATE data_generations SET generation = generation + 1 WHERE name = 'properties';
+                         END''')
+
+def add_image_derivative_columns(conn):
+    # Filled in by the thumbnail worker after upload; NULL means "serve the original"
+    _add_column_if_missing(conn, 'property_documents', 'thumbnail_filename', 'TEXT')
+    _add_column_if_missing(conn, 'property_documents', 'medium_filename', 'TEXT')
+    _add_column_if_missing(conn, 'property_documents', 'webp_filename', 'TEXT')
+
+def create_document_filename_index(conn):
+    # Documents with identical content share one blob; counting the rows per
+    # filename is the blob's reference count
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_documents_filename ON property_documents (filename)')
+
+def create_upload_sessions(conn):
+    # Resumable uploads in progress (see chunked_uploads.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS upload_sessions
+                    (id TEXT PRIMARY KEY,
+                     property_id INTEGER NOT NULL,
+                     original_filename TEXT NOT NULL,
+                     document_type TEXT DEFAULT 'General',
+                     total_size INTEGER NOT NULL,
+                     received_size INTEGER NOT NULL DEFAULT 0,
+                     created_date TEXT,
+                     updated_date TEXT,
+                     FOREIGN KEY (property_id) REFERENCES properties (id))''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated ON upload_sessions (updated_date)')
+
+def create_jobs_table(conn):
+    # Background job queue (see jobs.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                    (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                     kind TEXT NOT NULL,
+                     payload TEXT,
+                     status TEXT NOT NULL DEFAULT 'queued',
+                     attempts INTEGER NOT NULL DEFAULT 0,
+                     max_attempts INTEGER NOT NULL DEFAULT 3,
+                     run_after TEXT NOT NULL,
+                     locked_by TEXT,
+                     locked_at TEXT,
+                     last_error TEXT,
+                     result TEXT,
+                     created_date TEXT,
+                     updated_date TEXT,
+                     finished_date TEXT)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)')
+
+def create_property_locations(conn):
+    # R*Tree over map link coordinates for radius and bounding-box search
+    # (see geo.py); each point is stored as a zero-sized box
+    conn.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS property_locations
+                    USING rtree(id, min_lat, max_lat, min_lng, max_lng, +property_id INTEGER)''')
+
+    valid = "{row}.latitude BETWEEN -90 AND 90 AND {row}.longitude BETWEEN -180 AND 180"
+    insert = f'''INSERT OR REPLACE INTO property_locations (id, min_lat, max_lat, min_lng, max_lng, property_id)
+                 SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude, new.property_id
+                 WHERE {valid.format(row='new')};'''
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS property_locations_insert AFTER INSERT ON property_maps_links BEGIN
+                         {insert}
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS property_locations_update
+                     AFTER UPDATE OF latitude, longitude, property_id ON property_maps_links BEGIN
+                         DELETE FROM property_locations WHERE id = old.id;
+                         {insert}
+                     END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS property_locations_delete AFTER DELETE ON property_maps_links BEGIN
+                        DELETE FROM property_locations WHERE id = old.id;
+                    END''')
+
+    # Backfill from the links that already have coordinates
+    conn.execute(f'''INSERT OR REPLACE INTO property_locations (id, min_lat, max_lat, min_lng, max_lng, property_id)
+                     SELECT l.id, l.latitude, l.latitude, l.longitude, l.longitude, l.property_id
+                     FROM property_maps_links l WHERE {valid.format(row='l')}''')
+
+def create_locations_generation(conn):
+    # Map tiles are cached per generation of the map link coordinates
+    conn.execute("INSERT OR IGNORE INTO data_generations (name, generation) VALUES ('locations', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS locations_generation_{event.lower()}
+                         AFTER {event} ON property_maps_links BEGIN
+                             UPDATE data_generations SET generation = generation + 1 WHERE name = 'locations';
+                         END''')
+
+def create_rtc_index(conn):
+    # Imports that upsert by RTC look existing properties up a batch at a time
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_properties_rtc ON properties (rtc)')
+
+def create_page_generations(conn):
+    # Rendered pages are cached per generation. The listing only shows each
+    # property's latest photo, so other documents do not bump 'photos'
+    conn.execute("INSERT OR IGNORE INTO data_generations (name, generation) VALUES ('photos', 0)")
+    for event, condition in (('INSERT', "new.document_type = 'Photos'"),
+                             ('UPDATE', "old.document_type = 'Photos' OR new.document_type = 'Photos'"),
+                             ('DELETE', "old.document_type = 'Photos'")):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS photos_generation_{event.lower()}
+                         AFTER {event} ON property_documents WHEN {condition} BEGIN
+                             UPDATE data_generations SET generation = generation + 1 WHERE name = 'photos';
+                         END''')
+
+    # One counter per property for its detail page, bumped by writes to the
+    # property, its documents and its map links. Rows outlive deleted
+    # properties so a cached page of a deleted property is never served
+    conn.execute('''CREATE TABLE IF NOT EXISTS property_generations
+                    (property_id INTEGER PRIMARY KEY,
+                     generation INTEGER NOT NULL DEFAULT 0)''')
+    bump = '''INSERT INTO property_generations (property_id, generation) VALUES ({}, 1)
+              ON CONFLICT (property_id) DO UPDATE SET generation = generation + 1;'''
+    for table, column in (('properties', 'id'), ('property_documents', 'property_id'),
+                          ('property_maps_links', 'property_id')):
+        for event, rows in (('INSERT', ['new']), ('UPDATE', ['old', 'new']), ('DELETE', ['old'])):
+            statements = '\n'.join(bump.format(f'{row}.{column}') for row in rows)
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_property_generation_{event.lower()}
+                             AFTER {event} ON {table} BEGIN
+                                 {statements}
+                             END''')
+
+def create_users_generation(conn):
+    # Cached users are keyed by this generation, so any change to the table
+    # (including one made outside the app) reaches every worker
+    conn.execute("INSERT OR IGNORE INTO data_generations (name, generation) VALUES ('users', 0)")
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS users_generation_{event.lower()}
+                         AFTER {event} ON users BEGIN
+                             UPDATE data_generations SET generation = generation + 1 WHERE name = 'users';
+                         END''')
+
+def add_upload_session_document(conn):
+    # Completed sessions remember their document so a repeated /complete can answer with it
+    _add_column_if_missing(conn, 'upload_sessions', 'document_id', 'INTEGER')
+
+def drop_users_generation(conn):
+    # Cached users are keyed by id and invalidated by the code that writes
+    # them (see users.py), so the counter from migration 17 is unused
+    for event in ('insert', 'update', 'delete'):
+        conn.execute(f'DROP TRIGGER IF EXISTS users_generation_{event}')
+    conn.execute("DELETE FROM data_generations WHERE name = 'users'")
+
+# Ordered list of (version, description, step). Never renumber or edit an
+# applied step; append a new one instead.
+MIGRATIONS = [
+    (1, 'Create base tables', create_base_tables),
+    (2, 'Add document_type column to property_documents', add_document_type_column),
+    (3, 'Add rtc column to properties', add_rtc_column),
+    (4, 'Add bedrooms, bathrooms and area columns to properties', add_production_property_columns),
+    (5, 'Create lookup and sort indexes', create_lookup_indexes),
+    (6, 'Create properties_fts full-text index and sync triggers', create_properties_fts),
+    (7, 'Create dashboard summary tables and maintenance triggers', create_dashboard_stats),
+    (8, 'Create data_generations counters for cache invalidation', create_data_generations),
+    (9, 'Add image derivative columns to property_documents', add_image_derivative_columns),
+    (10, 'Index property_documents.filename for blob reference counts', create_document_filename_index),
+    (11, 'Create upload_sessions table for resumable uploads', create_upload_sessions),
+    (12, 'Create jobs table for background work', create_jobs_table),
+    (13, 'Create property_locations R*Tree over map link coordinates', create_property_locations),
+    (14, 'Add a locations data generation for map tile caching', create_locations_generation),
+    (15, 'Index properties.rtc for upserting imports', create_rtc_index),
+    (16, 'Add photos and per-property generations for page caching', create_page_generations),
+    (17, 'Add users generation for the user cache', create_users_generation),
+    (18, 'Add document_id to upload_sessions for idempotent completion', add_upload_session_document),
+    (19, 'Drop the users generation; cached users are invalidated on write', drop_users_generation),
+]
+
+def applied_migrations(conn):
+    """Return the recorded (version, description, applied_date) rows"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS schema_version
+                    (version INTEGER PRIMARY KEY,
+                     description TEXT NOT NULL,
+                     applied_date TEXT NOT NULL)''')
+    return conn.execute('SELECT version, description, applied_date FROM schema_version ORDER BY version').fetchall()
+
+def apply_migrations(conn, verbose=True):
+    """Apply every pending migration in order, each in its own transaction.
+
+    The pending check is repeated under ``BEGIN IMMEDIATE`` so several
+    workers starting at once apply each step only once. Returns the list of
+    versions applied by this call; stops at the first failing step.
+    """
+    applied = {row[0] for row in applied_migrations(conn)}
+    newly_applied = []
+
+    for version, description, step in MIGRATIONS:
+        if version in applied:
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT 1 FROM schema_version WHERE version = ?', (version,)).fetchone():
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute('INSERT INTO schema_version (version, description, applied_date) VALUES (?, ?, ?)',
+                         (version, description, datetime.now().isoformat()))
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"Migration error in version {version} ({description}): {e}")
+            break
+
+        newly_applied.append(version)
+        if verbose:
+            print(f"Applied migration {version}: {description}")
+
+    return newly_applied
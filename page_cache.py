@@ -0,0 +1,52 @@
+"""
+Whole-page caching for rendered HTML views.
+
+``cached_page`` stores a view's rendered HTML under (endpoint, user,
+normalized query args, view args, data generations) in a cache from
+cache.create_cache. While the generations the page depends on are unchanged
+a repeat request is answered from the cache without running the view's
+queries or Jinja; the only database work is reading those generations.
+Triggers bump them in the same transaction as each write, so a page is
+never served from before a committed change, whichever worker made it.
+
+Pages are cached per user because the navbar shows the username. A request
+with pending flash messages bypasses the cache in both directions, since the
+page would show (and consume) them; redirects and other non-HTML responses
+are never stored.
+"""
+from functools import wraps
+
+from flask import request, session
+from flask_login import current_user
+
+def normalized_args(args):
+    """Query args as a hashable, order-independent tuple; empty values are dropped"""
+    items = ((key, tuple(value for value in args.getlist(key) if value)) for key in args)
+    return tuple(sorted(item for item in items if item[1]))
+
+def cached_page(cache, generations):
+    """Serve the decorated view's HTML from ``cache`` until ``generations(**view_args)`` changes.
+
+    ``generations`` returns a hashable value (usually a tuple of counters)
+    covering everything the page shows; it is read before the view runs,
+    so a page rendered from newer data can only ever be stored under an
+    older key, never the reverse. With ``cache=None`` the view runs on
+    every request.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if cache is None or request.method != 'GET' or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            key = ('page', request.endpoint, current_user.get_id(), normalized_args(request.args),
+                   tuple(sorted(kwargs.items())), generations(**kwargs))
+            body = cache.get(key)
+            if body is None:
+                body = view(*args, **kwargs)
+                if not isinstance(body, str) or '_flashes' in session:
+                    return body
+                cache.set(key, body)
+            return body
+        return wrapper
+    return decorator
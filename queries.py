@@ -0,0 +1,385 @@
+"""
+Shared SQL helpers for the property listing and its filter form.
+
+Both app.py and app_production.py build their listing through these
+functions so the query shape stays identical between the two entry points.
+"""
+import re
+import base64
+import json
+
+from thumbnails import DERIVATIVE_COLUMNS, document_filenames
+from geo import parse_bbox, parse_point, radius_bounds
+
+# Sort expressions allowed in the listing, keyed by the ``sort_by`` request value.
+# NULLs are folded to a constant so keyset comparisons never see a NULL.
+SORT_FIELDS = {
+    'created_date': "IFNULL(p.created_date, '')",
+    'updated_date': "IFNULL(p.updated_date, '')",
+    'title': "p.title",
+    'price': "IFNULL(p.price, 0)",
+    'status': "IFNULL(p.status, '')",
+}
+
+# Relevance is only meaningful while a full-text search is active
+RELEVANCE_SORT = 's.relevance'
+
+# bm25 weights for title, description, rtc, location, owner_name (see migrations.FTS_COLUMNS)
+FTS_WEIGHTS = '10.0, 1.0, 5.0, 3.0, 2.0'
+
+# Control characters bracketing matched terms in search snippets; the
+# template escapes the snippet first and then swaps these for <mark> tags
+SNIPPET_START = '\x02'
+SNIPPET_END = '\x03'
+
+# Candidate properties with a map point inside (min_lat, max_lat, min_lng, max_lng)
+LOCATION_BOX_SQL = '''SELECT property_id FROM property_locations
+                      WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ?'''
+MAX_RADIUS_KM = 500
+
+def build_match_query(search_query):
+    """Turn free text from the search box into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term, so ``plot 12`` matches rows
+    containing words starting with both "plot" and "12". Returns None when
+    the text contains no searchable words.
+    """
+    terms = re.findall(r'\w+', search_query)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def build_property_filters(args, include_search=True):
+    """Translate listing request args into `` AND ...`` clauses on alias ``p``.
+
+    Returns ``(where_sql, params)``. Unparseable price bounds are ignored,
+    matching the behaviour of the search form, as are incomplete or
+    out-of-range ``near_lat``/``near_lng``/``radius_km`` and ``bbox``
+    (``min_lng,min_lat,max_lng,max_lat``) filters. Pass ``include_search=False``
+    when the caller joins the full-text match itself (see
+    fetch_properties_with_photos).
+    """
+    where_sql = ""
+    params = []
+
+    match_query = build_match_query(args.get('search', ''))
+    if match_query and include_search:
+        where_sql += " AND p.id IN (SELECT rowid FROM properties_fts WHERE properties_fts MATCH ?)"
+        params.append(match_query)
+
+    property_type = args.get('property_type', '')
+    if property_type:
+        where_sql += " AND p.property_type = ?"
+        params.append(property_type)
+
+    status = args.get('status', '')
+    if status:
+        where_sql += " AND p.status = ?"
+        params.append(status)
+
+    price_min = args.get('price_min', '')
+    if price_min:
+        try:
+            params.append(float(price_min))
+            where_sql += " AND p.price >= ?"
+        except ValueError:
+            pass
+
+    price_max = args.get('price_max', '')
+    if price_max:
+        try:
+            params.append(float(price_max))
+            where_sql += " AND p.price <= ?"
+        except ValueError:
+            pass
+
+    location = args.get('location', '')
+    if location:
+        where_sql += " AND p.location LIKE ?"
+        params.append(f'%{location}%')
+
+    # Spatial filters go through the property_locations R*Tree; a property
+    # matches when any of its map links does
+    near = parse_point(args.get('near_lat'), args.get('near_lng'))
+    radius_km = parse_radius(args.get('radius_km', ''))
+    if near and radius_km:
+        where_sql += f" AND p.id IN ({LOCATION_BOX_SQL} AND distance_km(min_lat, min_lng, ?, ?) <= ?)"
+        params.extend([*radius_bounds(*near, radius_km), *near, radius_km])
+
+    bbox = parse_bbox(args.get('bbox', ''))
+    if bbox:
+        where_sql += f" AND p.id IN ({LOCATION_BOX_SQL})"
+        params.extend(bbox)
+
+    return where_sql, params
+
+def parse_radius(value, max_km=MAX_RADIUS_KM):
+    """Search radius in km from a request string, or None when missing or not positive"""
+    try:
+        radius_km = float(value)
+    except (TypeError, ValueError):
+        return None
+    return min(radius_km, max_km) if radius_km > 0 else None
+
+def normalize_sort(sort_by, sort_order, searching=False):
+    """Fall back to newest-first for unknown sort fields or orders.
+
+    ``relevance`` is accepted only while ``searching``; in that case
+    ``desc`` means best match first.
+    """
+    if sort_by == 'relevance' and searching:
+        return sort_by, 'asc' if sort_order.lower() == 'asc' else 'desc'
+    if sort_by not in SORT_FIELDS:
+        return 'created_date', 'desc'
+    return sort_by, 'asc' if sort_order.lower() == 'asc' else 'desc'
+
+# Query args read by build_property_filters, and the listing's sort and page size;
+# the only ones carried into generated links (anything else could collide with
+# url_for's own arguments such as ``endpoint`` or ``_external``)
+FILTER_ARGS = ('search', 'property_type', 'status', 'price_min', 'price_max', 'location',
+               'near_lat', 'near_lng', 'radius_km', 'bbox')
+LISTING_ARGS = FILTER_ARGS + ('sort_by', 'sort_order', 'per_page')
+
+def pick_args(args, keys=LISTING_ARGS):
+    """The non-empty values of ``keys`` in ``args`` as a plain dict, safe to pass to url_for"""
+    return {key: args[key] for key in keys if args.get(key)}
+
+def listing_query_from_args(args):
+    """Filters and sort for the listing, shared by the listing page and CSV exports"""
+    # Full-text matches are ranked by relevance unless another sort is chosen
+    match_query = build_match_query(args.get('search', ''))
+    sort_by = args.get('sort_by', 'relevance' if match_query else 'created_date')
+    sort_order = args.get('sort_order', 'desc')
+
+    # Build the filter clauses dynamically
+    where_sql, params = build_property_filters(args, include_search=False)
+    sort_by, sort_order = normalize_sort(sort_by, sort_order, searching=bool(match_query))
+    return match_query, where_sql, params, sort_by, sort_order
+
+def encode_cursor(sort_value, property_id, direction):
+    """Pack a keyset position into an opaque URL-safe token"""
+    payload = json.dumps([sort_value, property_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Unpack a cursor token; returns None for missing or malformed tokens"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, property_id, direction = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        return None
+    if direction not in ('next', 'prev') or not isinstance(property_id, int):
+        return None
+    return sort_value, property_id, direction
+
+def fetch_properties_with_photos(conn, where_sql='', params=(), sort_sql=SORT_FIELDS['created_date'], descending=True,
+                                 limit=None, match_query=None, columns=None, with_photos=True):
+    """Fetch the filtered listing together with each property's latest photo.
+
+    ``where_sql`` is a string of `` AND ...`` clauses against the ``p`` alias;
+    rows are ordered by ``sort_sql`` with ``p.id`` as tiebreaker and each row
+    carries its ``sort_key``. The latest photo is resolved by a correlated
+    lookup on idx_documents_property_type_date, applied only to the rows that
+    survive the LIMIT. Returns a list of dicts with a ``photos`` list (zero or
+    one entry, including its ``thumbnail_filename``) in the shape index.html
+    expects.
+
+    With ``match_query`` the rows are restricted to full-text matches and
+    gain ``relevance`` (negated bm25, higher is better, sortable as
+    ``RELEVANCE_SORT``) and a marked-up ``search_snippet``.
+
+    ``columns`` limits the properties columns read (``id`` is always
+    included) and ``with_photos=False`` skips the photo lookup entirely.
+    """
+    select_sql = 'p.*' if columns is None else ', '.join(f'p.{column}' for column in ['id', *columns] if column)
+    query_params = []
+    search_select = ""
+    search_join = ""
+    if match_query:
+        search_select = ", s.relevance, s.search_snippet"
+        search_join = f'''
+                    JOIN (SELECT rowid AS fts_rowid, -bm25(properties_fts, {FTS_WEIGHTS}) AS relevance,
+                                 snippet(properties_fts, -1, ?, ?, '…', 16) AS search_snippet
+                          FROM properties_fts WHERE properties_fts MATCH ?) s ON s.fts_rowid = p.id'''
+        query_params.extend([SNIPPET_START, SNIPPET_END, match_query])
+
+    query_params.extend(params)
+    limit_sql = ""
+    if limit is not None:
+        limit_sql = " LIMIT ?"
+        query_params.append(limit)
+
+    direction = 'DESC' if descending else 'ASC'
+    query = f'''SELECT {select_sql}{search_select}, {sort_sql} AS sort_key
+                FROM properties p{search_join}
+                WHERE 1=1{where_sql}
+                ORDER BY {sort_sql} {direction}, p.id {direction}{limit_sql}'''
+    if not with_photos:
+        return [dict(row) for row in conn.execute(query, query_params)]
+
+    query = f'''SELECT p.*, ph.filename AS photo_filename, ph.original_filename AS photo_original_filename,
+                       ph.thumbnail_filename AS photo_thumbnail_filename
+                FROM ({query}) p
+                LEFT JOIN property_documents ph ON ph.id = (
+                    SELECT d.id FROM property_documents d
+                    WHERE d.property_id = p.id AND d.document_type = 'Photos'
+                    ORDER BY d.upload_date DESC, d.id DESC LIMIT 1)
+                ORDER BY p.sort_key {direction}, p.id {direction}'''
+
+    properties = []
+    for row in conn.execute(query, query_params):
+        property_dict = dict(row)
+        filename = property_dict.pop('photo_filename')
+        photo = {'filename': filename,
+                 'original_filename': property_dict.pop('photo_original_filename'),
+                 'thumbnail_filename': property_dict.pop('photo_thumbnail_filename')}
+        property_dict['photos'] = [photo] if filename else []
+        properties.append(property_dict)
+    return properties
+
+def fetch_properties_page(conn, where_sql='', params=(), sort_by='created_date', sort_order='desc',
+                          cursor=None, page_size=24, match_query=None, columns=None, with_photos=True):
+    """Fetch one keyset-paginated page of the listing.
+
+    Pages seek from the previous page's last ``(sort key, id)`` pair instead
+    of using OFFSET, so any page costs the same as the first one. Returns
+    ``(properties, next_cursor, prev_cursor)``; cursors are None at either end.
+    ``match_query`` (from build_match_query) enables full-text matching and
+    the ``relevance`` sort; ``columns`` and ``with_photos`` are passed on to
+    fetch_properties_with_photos.
+    """
+    sort_by, sort_order = normalize_sort(sort_by, sort_order, searching=bool(match_query))
+    sort_sql = RELEVANCE_SORT if sort_by == 'relevance' else SORT_FIELDS[sort_by]
+    descending = sort_order == 'desc'
+
+    position = decode_cursor(cursor)
+    direction = position[2] if position else 'next'
+    # Walking backwards flips both the seek comparison and the scan order
+    scan_descending = descending if direction == 'next' else not descending
+
+    page_where = where_sql
+    page_params = list(params)
+    if position:
+        comparison = '<' if scan_descending else '>'
+        # The redundant leading bound lets SQLite seek the sort-key index;
+        # row-value comparisons alone are only applied as a filter
+        page_where += f" AND {sort_sql} {comparison}= ? AND ({sort_sql}, p.id) {comparison} (?, ?)"
+        page_params.extend([position[0], position[0], position[1]])
+
+    properties = fetch_properties_with_photos(conn, page_where, page_params, sort_sql, scan_descending,
+                                              limit=page_size + 1, match_query=match_query,
+                                              columns=columns, with_photos=with_photos)
+    has_more = len(properties) > page_size
+    properties = properties[:page_size]
+    if direction == 'prev':
+        properties.reverse()
+
+    next_cursor = prev_cursor = None
+    if properties:
+        if direction == 'prev' or has_more:
+            last = properties[-1]
+            next_cursor = encode_cursor(last['sort_key'], last['id'], 'next')
+        if (direction == 'next' and position) or (direction == 'prev' and has_more):
+            first = properties[0]
+            prev_cursor = encode_cursor(first['sort_key'], first['id'], 'prev')
+
+    return properties, next_cursor, prev_cursor
+
+# Filter form fields backed by property_stats dimensions
+FILTER_OPTION_DIMENSIONS = ['property_type', 'status', 'location']
+
+def get_data_generation(conn, name='properties'):
+    """Current write generation for ``name`` (bumped by triggers on every write)"""
+    row = conn.execute('SELECT generation FROM data_generations WHERE name = ?', (name,)).fetchone()
+    return row[0] if row else 0
+
+def get_data_generations(conn, names):
+    """Current generations for ``names`` as a tuple in the same order, read in one query"""
+    placeholders = ', '.join('?' * len(names))
+    rows = dict(conn.execute(f'SELECT name, generation FROM data_generations WHERE name IN ({placeholders})',
+                             list(names)).fetchall())
+    return tuple(rows.get(name, 0) for name in names)
+
+def get_property_generation(conn, property_id):
+    """Write generation of one property, its documents and its map links"""
+    row = conn.execute('SELECT generation FROM property_generations WHERE property_id = ?', (property_id,)).fetchone()
+    return row[0] if row else 0
+
+def fetch_filter_options(conn):
+    """Dropdown options for the filter form with their property counts.
+
+    Reads the trigger-maintained property_stats counters, so options and
+    facet counts come from one small query instead of DISTINCT scans.
+    Returns ``{dimension: [{dimension: value, 'count': n}, ...]}``.
+    """
+    options = {dimension: [] for dimension in FILTER_OPTION_DIMENSIONS}
+    placeholders = ', '.join('?' * len(FILTER_OPTION_DIMENSIONS))
+    rows = conn.execute(f'''SELECT dimension, value, count FROM property_stats
+                            WHERE dimension IN ({placeholders})
+                            ORDER BY dimension, value''', FILTER_OPTION_DIMENSIONS)
+    for dimension, value, count in rows:
+        options[dimension].append({dimension: value, 'count': count})
+    return options
+
+def load_filter_options(conn, cache):
+    """Filter options from ``cache``, rebuilt only after the data generation moves"""
+    generation = get_data_generation(conn)
+    return cache.get_or_load(('filter_options', generation), lambda: fetch_filter_options(conn))
+
+# Ids per statement in bulk writes; stays well under SQLite's bound-parameter limit
+BULK_CHUNK_SIZE = 500
+
+def chunked(values, size=BULK_CHUNK_SIZE):
+    """Split ``values`` into lists of at most ``size`` items"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def orphaned_files(conn, rows):
+    """Files of deleted property_documents ``rows`` that no remaining row references.
+
+    Blobs are shared between documents with identical content, so a file
+    (with its derivatives) may only go once its reference count reaches zero.
+    Returns one ``[original, *derivatives]`` list per blob. Call inside the
+    deleting transaction, after the rows are gone.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(row['filename'], document_filenames(row))
+    if not groups:
+        return []
+    # One statement for every distinct filename; NOT EXISTS probes idx_documents_filename
+    orphaned = {row[0] for row in conn.execute('''SELECT value FROM json_each(?)
+                                                  WHERE NOT EXISTS (SELECT 1 FROM property_documents WHERE filename = value)''',
+                                               (json.dumps(list(groups)),))}
+    return [files for filename, files in groups.items() if filename in orphaned]
+
+def delete_properties(conn, property_ids):
+    """Delete properties with their documents and maps links.
+
+    Runs chunked ``IN (...)`` statements in the caller's transaction and
+    returns ``(deleted_count, orphaned_files)``: the blobs and derivatives,
+    grouped per blob, no longer referenced by any document. The caller
+    queues their removal in the same transaction (see cleanup.py).
+    """
+    deleted = 0
+    documents = []
+    columns = ', '.join(['filename'] + DERIVATIVE_COLUMNS)
+    for chunk in chunked(property_ids):
+        placeholders = ', '.join('?' * len(chunk))
+        documents.extend(conn.execute(f'SELECT {columns} FROM property_documents WHERE property_id IN ({placeholders})', chunk))
+        conn.execute(f'DELETE FROM property_documents WHERE property_id IN ({placeholders})', chunk)
+        conn.execute(f'DELETE FROM property_maps_links WHERE property_id IN ({placeholders})', chunk)
+        deleted += conn.execute(f'DELETE FROM properties WHERE id IN ({placeholders})', chunk).rowcount
+    return deleted, orphaned_files(conn, documents)
+
+def update_properties_status(conn, property_ids, status, updated_date):
+    """Set ``status`` on every property in ``property_ids``; returns the number updated"""
+    updated = 0
+    for chunk in chunked(property_ids):
+        placeholders = ', '.join('?' * len(chunk))
+        updated += conn.execute(f'UPDATE properties SET status = ?, updated_date = ? WHERE id IN ({placeholders})',
+                                [status, updated_date, *chunk]).rowcount
+    return updated
@@ -0,0 +1,41 @@
+"""
+Shared fixtures: app.py against a throwaway database and upload folder.
+
+app.py reads its configuration from the environment at import time, so the
+environment is set here, before any test module imports it.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmp = tempfile.mkdtemp(prefix='property_management_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_tmp, 'test.db')
+os.environ['UPLOAD_FOLDER'] = os.path.join(_tmp, 'uploads')
+os.environ['JOB_WORKER'] = 'external'
+os.environ['CACHE_BACKEND'] = 'memory'
+
+import app as app_module  # noqa: E402
+
+app_module.init_db()
+
+@pytest.fixture
+def app():
+    return app_module.app
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'}).close()
+    return client
+
+@pytest.fixture
+def conn(app):
+    from database import connect_from_config
+    conn = connect_from_config(app.config)
+    yield conn
+    conn.close()
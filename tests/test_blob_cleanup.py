@@ -0,0 +1,62 @@
+import io
+import os
+import time
+import hashlib
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from blobstore import BLOB_DIR, blob_filename
+
+def upload(content, name='deed.pdf'):
+    return FileStorage(io.BytesIO(content), filename=name)
+
+def add_property(conn):
+    property_id = conn.execute("INSERT INTO properties (title, status) VALUES ('Plot', 'Available')").lastrowid
+    conn.commit()
+    return property_id
+
+def insert_document(conn, property_id, filename):
+    document_id = conn.execute('''INSERT INTO property_documents (property_id, filename, original_filename, document_type, upload_date)
+                                  VALUES (?, ?, 'deed.pdf', 'General', '')''', (property_id, filename)).lastrowid
+    conn.commit()
+    return document_id
+
+def test_reused_blob_survives_cleanup_before_insert(app, client, conn):
+    blob_store = app.extensions['blob_store']
+    content = b'%PDF reused while its last reference is deleted'
+    property_id = add_property(conn)
+    with blob_store.batch() as blobs:
+        old_id = insert_document(conn, property_id, blobs.save_upload(upload(content)))
+
+    # save_many reuses (and touches) the blob, then the last reference is
+    # deleted and the cleanup job runs before the new row is inserted
+    with blob_store.batch() as blobs:
+        filename, = blobs.save_many([upload(content)])
+        time.sleep(0.01)
+        client.post(f'/delete_document/{old_id}').close()
+        app.extensions['jobs'].run_pending()
+        assert not os.path.exists(blob_store.path(filename))
+        insert_document(conn, property_id, filename)
+
+    with open(blob_store.path(filename), 'rb') as f:
+        assert f.read() == content
+
+def test_failed_save_many_removes_only_new_blobs(app):
+    blob_store = app.extensions['blob_store']
+    with blob_store.batch() as blobs:
+        existing = blobs.save_upload(upload(b'already stored'))
+
+    class Broken:
+        def read(self, size):
+            raise OSError('disk went away')
+
+    with pytest.raises(OSError):
+        with blob_store.batch() as blobs:
+            blobs.save_many([upload(b'brand new'), upload(b'already stored'),
+                             FileStorage(Broken(), filename='broken.pdf')], 4)
+
+    new = blob_filename(hashlib.sha256(b'brand new').hexdigest(), 'deed.pdf')
+    assert not os.path.exists(blob_store.path(new))
+    assert os.path.exists(blob_store.path(existing))
+    assert os.listdir(os.path.join(blob_store.root, BLOB_DIR, 'tmp')) == []
@@ -0,0 +1,22 @@
+import io
+
+from werkzeug.datastructures import FileStorage
+
+def test_blob_etag_comes_from_its_name(app, client, monkeypatch):
+    import downloads
+    with app.extensions['blob_store'].batch() as blobs:
+        filename = blobs.save_upload(FileStorage(io.BytesIO(b'%PDF etag'), filename='deed.pdf'))
+
+    def no_hashing(path, cache):
+        raise AssertionError('blob was re-hashed')
+    monkeypatch.setattr(downloads, 'file_etag', no_hashing)
+
+    response = client.get(f'/download/{filename}')
+    digest = filename.rsplit('/', 1)[1].split('.')[0]
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'"{digest}"'
+    response.close()
+
+    response = client.get(f'/download/{filename}', headers={'If-None-Match': f'"{digest}"'})
+    assert response.status_code == 304
+    response.close()
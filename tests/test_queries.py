@@ -0,0 +1,20 @@
+from queries import orphaned_files
+
+def test_orphaned_files_is_one_statement(conn):
+    property_id = conn.execute("INSERT INTO properties (title, status) VALUES ('Plot', 'Available')").lastrowid
+    for filename in ('blobs/aa/aa/shared.pdf', 'blobs/aa/aa/shared.pdf', 'blobs/bb/bb/alone.jpg'):
+        conn.execute('''INSERT INTO property_documents (property_id, filename, original_filename, upload_date)
+                        VALUES (?, ?, 'x', '')''', (property_id, filename))
+    rows = conn.execute('SELECT * FROM property_documents WHERE property_id = ? ORDER BY id', (property_id,)).fetchall()
+    # Delete one reference to the shared blob and the only one to the other
+    conn.execute('DELETE FROM property_documents WHERE id IN (?, ?)', (rows[0]['id'], rows[2]['id']))
+
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        files = orphaned_files(conn, [rows[0], rows[2]])
+    finally:
+        conn.set_trace_callback(None)
+        conn.rollback()
+    assert files == [['blobs/bb/bb/alone.jpg']]
+    assert len(statements) == 1
@@ -0,0 +1,14 @@
+import json
+
+import pytest
+
+import jobs
+
+pytest.importorskip('PIL')
+
+def test_missing_source_finishes_the_job(app, conn):
+    job_id = jobs.enqueue(conn, 'thumbnails', {'document_id': 999999, 'filename': 'blobs/00/00/gone.jpg'})
+    conn.commit()
+    app.extensions['jobs'].run_pending()
+    job = conn.execute('SELECT status, attempts, result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    assert (job['status'], job['attempts'], json.loads(job['result'])) == ('done', 1, {})
@@ -0,0 +1,40 @@
+import re
+
+from users import invalidate_user, user_cache_key
+
+def statement_count(response):
+    """Number of SQL statements the request ran, from its Server-Timing header"""
+    response.close()
+    return int(re.search(r'desc="(\d+) statement', response.headers['Server-Timing']).group(1))
+
+def admin_id(conn):
+    return conn.execute("SELECT id FROM users WHERE username = 'admin'").fetchone()[0]
+
+def test_cached_user_saves_a_statement(app, client):
+    statement_count(client.get('/dashboard'))  # warm the other caches
+
+    app.extensions['user_cache'].clear()
+    cold = statement_count(client.get('/dashboard'))
+    warm = statement_count(client.get('/dashboard'))
+    assert warm == cold - 1
+
+def test_cached_user_has_no_password_hash(app, client, conn):
+    client.get('/dashboard').close()
+    user = app.extensions['user_cache'].get(user_cache_key(admin_id(conn)))
+    assert user.username == 'admin'
+    assert not hasattr(user, 'password_hash')
+
+def test_invalidate_user_rereads_the_row(app, client, conn):
+    user_id = admin_id(conn)
+    client.get('/dashboard').close()
+    conn.execute('UPDATE users SET username = ? WHERE id = ?', ('boss', user_id))
+    conn.commit()
+    try:
+        invalidate_user(app.extensions['user_cache'], user_id)
+        response = client.get('/dashboard')
+        assert b'boss' in response.data
+        response.close()
+    finally:
+        conn.execute('UPDATE users SET username = ? WHERE id = ?', ('admin', user_id))
+        conn.commit()
+        invalidate_user(app.extensions['user_cache'], user_id)
@@ -0,0 +1,112 @@
+"""
+Resized derivatives of uploaded photos.
+
+Listing cards and the gallery used to load the original upload (up to
+MAX_CONTENT_LENGTH) and scale it in CSS. Inserting an image document also
+enqueues a ``thumbnails`` job (see jobs.py), which writes a small JPEG
+thumbnail, a medium JPEG and a medium WebP next to the original and records
+their filenames on the row. Templates fall back to the original
+while a derivative is missing.
+
+Pillow is listed in requirements.txt; an install without it still accepts
+uploads but produces no derivatives.
+"""
+import os
+
+import jobs
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow not installed: derivatives are disabled
+    Image = None
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+# (property_documents column, filename suffix, bounding box, Pillow format, save options)
+DERIVATIVES = [
+    ('thumbnail_filename', '_thumb.jpg', (400, 300), 'JPEG', {'quality': 80, 'optimize': True}),
+    ('medium_filename', '_medium.jpg', (1280, 960), 'JPEG', {'quality': 85, 'optimize': True}),
+    ('webp_filename', '_medium.webp', (1280, 960), 'WEBP', {'quality': 80, 'method': 4}),
+]
+
+DERIVATIVE_COLUMNS = [column for column, _, _, _, _ in DERIVATIVES]
+
+def derivatives_enabled():
+    return Image is not None
+
+def is_image(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+def derivative_stem(filename):
+    """Prefix for the derivatives of ``filename``.
+
+    The source extension is kept, so ``<sha>.jpg`` and ``<sha>.jpeg`` (one
+    content, two blobs) each get their own derivatives and removing one
+    blob's files never takes the other's.
+    """
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}_{extension.lstrip('.').lower()}" if extension else stem
+
+def generate_derivatives(upload_folder, filename):
+    """Write every derivative of ``filename`` and return ``{column: derivative filename}``"""
+    stem = derivative_stem(filename)
+    existing = {column: f"{stem}{suffix}" for column, suffix, _, _, _ in DERIVATIVES}
+    if all(os.path.exists(os.path.join(upload_folder, name)) for name in existing.values()):
+        # Another document already shares this blob and its derivatives
+        return existing
+
+    with Image.open(os.path.join(upload_folder, filename)) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        derivatives = {}
+        for column, suffix, size, image_format, options in DERIVATIVES:
+            derivative_name = f"{stem}{suffix}"
+            resized = image.copy()
+            resized.thumbnail(size)
+            resized.save(os.path.join(upload_folder, derivative_name), image_format, **options)
+            derivatives[column] = derivative_name
+        return derivatives
+
+def document_filenames(row):
+    """The original and any derivative filenames recorded on a property_documents row"""
+    return [row[column] for column in ['filename'] + DERIVATIVE_COLUMNS if row[column]]
+
+def enqueue_thumbnails(conn, document_id, filename):
+    """Queue derivatives for a new document in the caller's transaction.
+
+    Non-images are ignored, as is everything without Pillow.
+    """
+    if derivatives_enabled() and is_image(filename):
+        jobs.enqueue(conn, 'thumbnails', {'document_id': document_id, 'filename': filename})
+
+@jobs.handler('thumbnails')
+def build_thumbnails(app, conn, payload):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    filename = payload['filename']
+    try:
+        derivatives = generate_derivatives(upload_folder, filename)
+    except FileNotFoundError:
+        if conn.execute('SELECT 1 FROM property_documents WHERE id = ?', (payload['document_id'],)).fetchone():
+            raise  # The blob may still be put back (see blobstore.BlobBatch); retry
+        # The document and its blob were deleted before the job ran
+        return {}
+    assignments = ', '.join(f'{column} = ?' for column in derivatives)
+    updated = conn.execute(f'UPDATE property_documents SET {assignments} WHERE id = ?',
+                           [*derivatives.values(), payload['document_id']]).rowcount
+    conn.commit()
+    still_used = conn.execute('SELECT 1 FROM property_documents WHERE filename = ? LIMIT 1', (filename,)).fetchone()
+    if not updated and not still_used:
+        # Document was deleted while its derivatives were being written
+        for derivative_name in derivatives.values():
+            try:
+                os.remove(os.path.join(upload_folder, derivative_name))
+            except FileNotFoundError:
+                pass  # Already taken by that document's delete_files job
+    return derivatives
+
+def init_app(app):
+    """Report once at startup when derivatives are unavailable"""
+    if not derivatives_enabled():
+        print("ℹ️  Pillow is not installed (pip install -r requirements.txt); photos are served without thumbnails")
@@ -0,0 +1,59 @@
+"""
+User model and cached lookup for Flask-Login.
+
+``load_user`` runs on every @login_required request, so users are kept in a
+cache (see cache.create_cache) keyed by id alone, so a cache hit costs no
+SQL at all. Code that writes to the users table calls ``invalidate_user``
+in the same request; with a shared backend that reaches every worker, and
+changes made outside the app show up once USER_CACHE_TTL expires. Cached
+users hold only id and username: the password hash stays in SQLite and is
+read by the login view alone.
+"""
+
+class User:
+    """Authenticated user; implements the attributes Flask-Login expects"""
+    __slots__ = ('id', 'username')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row['id'], row['username'])
+
+    def get_id(self):
+        return str(self.id)
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.get_id() == other.get_id()
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        if equal is NotImplemented:
+            return equal
+        return not equal
+
+    __hash__ = object.__hash__
+
+def fetch_user(conn, user_id):
+    """Read one user from the database, or None if the id is unknown"""
+    row = conn.execute('SELECT id, username FROM users WHERE id = ?', (user_id,)).fetchone()
+    return User.from_row(row) if row else None
+
+def user_cache_key(user_id):
+    return ('user', str(user_id))
+
+def load_cached_user(cache, get_connection, user_id):
+    """Return the User for ``user_id``, querying the users table only on a cache miss"""
+    return cache.get_or_load(user_cache_key(user_id), lambda: fetch_user(get_connection(), user_id))
+
+def invalidate_user(cache, user_id):
+    """Drop a cached user after its users row was inserted, updated or deleted"""
+    cache.invalidate(user_cache_key(user_id))
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Background job worker for Property Management System
+Runs queued jobs (thumbnails, file cleanup, exports, index rebuilds) outside
+the web server. Use it with JOB_WORKER=external, or alongside the in-process
+threads to add capacity; any number of workers can share one database.
+
+Usage: python worker.py [--once] [--app app|app_production]
+"""
+
+import sys
+import signal
+import importlib
+import threading
+
+from database import connect_from_config
+from migrations import apply_migrations
+
+def main():
+    args = sys.argv[1:]
+    run_once = '--once' in args
+    module_name = args[args.index('--app') + 1] if '--app' in args else 'app'
+
+    # Importing the app registers every job handler
+    app = importlib.import_module(module_name).app
+    worker = app.extensions['jobs']
+
+    conn = connect_from_config(app.config)
+    try:
+        apply_migrations(conn, verbose=False)
+        if run_once:
+            ran = worker.run_pending(conn)
+            print(f"✅ Ran {ran} job(s)")
+            return
+    finally:
+        conn.close()
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    print(f"🚀 Job worker {worker.worker_id} polling {app.config['DATABASE']}")
+    try:
+        worker.run_forever(stop)
+    except KeyboardInterrupt:
+        pass
+    print("ℹ️  Job worker stopped")
+
+if __name__ == '__main__':
+    main()